@@ -1,11 +1,20 @@
 import os
+import sys
 import asyncio
 import httpx
-import aiofiles
 
 from tikhub import Client
 from dotenv import load_dotenv
 
+# 将仓库根目录加入模块搜索路径 | Add repository root to module search path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from response_cache import RESPONSE_CACHE, VIDEO_DETAIL_TTL
+from metrics import start_metrics_server, timed_request
+from video_download import DOWNLOAD_CONCURRENCY, DownloadPool, Urls, download_client
+from download_manifest import DownloadManifest
+from profile_sync import ProfileSync, state_path
+from video_variants import DOUYIN_DEFAULT_KEYS, VIDEO_VARIANT_POLICY, Variant, bytes_saved, choose_play_address
+
 # 加载 .env 文件 | Load .env file
 load_dotenv()
 
@@ -18,82 +27,145 @@ if api_key is None or api_key == "your_private_api_key":
         file.write("API_KEY=your_private_api_key")
     raise ValueError("API_KEY is not set in .env file")
 
-# 初始化 TikHub 客户端 | Initialize TikHub client
-client = Client(api_key=api_key)
+# 初始化 TikHub 客户端，可通过 TIKHUB_API_BASE 指向其他服务 (如本地模拟服务器)
+# Initialize TikHub client; TIKHUB_API_BASE can point it at another server (e.g. the local mock server)
+api_base = os.getenv("TIKHUB_API_BASE")
+client = Client(api_key=api_key, base_url=api_base) if api_base else Client(api_key=api_key)
+
+
+# 下载清单：记录每个作品的地址、大小、哈希和状态，重启后跳过已完成的 | Download manifest: URL, size, hash and status of every item; restarts skip completed items
+MANIFEST = DownloadManifest()
 
 
 # 下载视频函数 | Download video function
-async def download_file(aweme_id: str, play_addr: str, output_dir: str = "downloads"):
+async def download_file(aweme_id: str, play_addr: Urls, output_dir: str = "downloads",
+                        http_client: httpx.AsyncClient = None):
     # 创建下载目录 | Create download directory
     os.makedirs(output_dir, exist_ok=True)
-    # 请求文件 | Request file
+    # 文件名 | File name
+    # $.data.aweme_detail.aweme_id
+    file_name = os.path.join(output_dir, aweme_id + ".mp4")
+    # 大文件按 Range 分段并发下载并可续传，否则分块流式下载；完成后才重命名为 .mp4
+    # Large files are fetched as concurrent resumable Range segments, others streamed in chunks; renamed to .mp4 only when complete
+    if http_client is not None:
+        return await MANIFEST.download(http_client, play_addr, file_name, "douyin")
     async with httpx.AsyncClient() as http_client:
-        response = await http_client.get(play_addr)
-        # 文件名 | File name
-        # $.data.aweme_detail.aweme_id
-        file_name = os.path.join(output_dir, aweme_id + ".mp4")
-        # 写入文件 | Write file
-        async with aiofiles.open(file_name, "wb") as file:
-            await file.write(response.content)
-        return file_name
+        return await MANIFEST.download(http_client, play_addr, file_name, "douyin")
 
 
-# 获取主页视频信息 | Get profile videos info
-async def get_profile_videos_info(sec_user_id: str):
+# 逐页获取主页视频信息 | Yield profile videos page by page
+async def iter_profile_videos(sec_user_id: str):
     async def fetch_videos(max_cursor: int):
         print(f"Fetching videos with max_cursor: {max_cursor}")
         # 执行API请求 | Perform API request
-        response = await client.DouyinAppV3.fetch_user_post_videos(sec_user_id, max_cursor=max_cursor, count=20)
+        response = await RESPONSE_CACHE.fetch(
+            "douyin/app/v3/fetch_user_post_videos",
+            {"sec_user_id": sec_user_id, "max_cursor": max_cursor, "count": 20},
+            timed_request(
+                "douyin:fetch_user_post_videos",
+                lambda: client.DouyinAppV3.fetch_user_post_videos(sec_user_id, max_cursor=max_cursor, count=20),
+            ),
+            ttl=VIDEO_DETAIL_TTL,
+        )
         # 提取并返回需要的信息 | Extract and return the required information
         return response["data"]["aweme_list"], response["data"]["has_more"], response["data"]["max_cursor"]
 
-    # 创建一个空列表来存储所有视频信息 | Create an empty list to store all videos info
-    all_videos_info = []
+    fetched = 0
     has_more = True
     max_cursor = 0
 
-    # 循环获取视频信息直到没有更多 | Loop to get video info until there are no more
+    # 循环获取视频信息直到没有更多，每页取到后立即交出 | Loop until there are no more, yielding each page as soon as it arrives
     while has_more:
         videos_info, has_more, max_cursor = await fetch_videos(max_cursor)
-        all_videos_info.extend(videos_info)
-        print(f"Total videos fetched: {len(all_videos_info)}")
+        fetched += len(videos_info)
+        print(f"Total videos fetched: {fetched}")
+        for video_info in videos_info:
+            yield video_info
 
-    return all_videos_info
 
+# 获取主页视频信息 | Get profile videos info
+async def get_profile_videos_info(sec_user_id: str):
+    return [video_info async for video_info in iter_profile_videos(sec_user_id)]
 
-def get_video_play_address(video_info):
+
+def get_video_variant(video_info) -> Variant:
     """
-    Tries to retrieve the video play address from the available formats.
-    If 265 format is not found, it falls back to h264.
+    Picks the video variant among play_addr_265, play_addr_h264 and the bit_rate variants
+    according to VIDEO_VARIANT_POLICY (see video_variants.py). The default policy keeps the
+    previous choice: play_addr_265, falling back to h264. The downloader hedges across the
+    CDN mirrors in the returned url_list.
+    Raises ValueError if the post is not a video, has been deleted, or is an album.
     """
-    for format_key in ["play_addr_265", "play_addr_h264"]:
-        try:
-            return video_info["video"][format_key]["url_list"][0]
-        except (KeyError, IndexError):
-            continue
-    raise ValueError("No valid video URL found, this post is not a video, or the video has been deleted, or its an album.")
+    return choose_play_address(video_info.get("video"), "douyin", DOUYIN_DEFAULT_KEYS)
 
 
-if __name__ == "__main__":
-    # 主页链接 | Profile URL
-    profile_url = "https://www.douyin.com/user/MS4wLjABAAAAH6qtuglSMr7givzADiJu6mr2S4ufCtRvIGvV1O1T85uqlCNX4SVct8TWIs8BU2x6"
-    sec_user_id = profile_url.split("/")[-1]
-    # 获取所有视频信息 | Get all videos info
-    all_videos_info = asyncio.run(get_profile_videos_info(sec_user_id))
+def get_video_play_address(video_info) -> str:
+    """
+    Returns the play address (first URL) of the variant chosen by get_video_variant.
+    Raises ValueError if the post is not a video, has been deleted, or is an album.
+    """
+    return get_video_variant(video_info).url
 
-    # 下载所有视频 | Download all videos
-    for video_info in all_videos_info:
+
+# 主页视频的下载任务 | Download jobs for a profile's videos
+async def iter_profile_jobs(sec_user_id: str, output_dir: str = "downloads", sync: ProfileSync = None):
+    videos = iter_profile_videos(sec_user_id)
+    if sync is not None:
+        # 只取上次同步之后的新作品，遇到已同步的作品即停止翻页 | Only posts newer than the last sync; stop paging at known posts
+        videos = sync.new_videos(videos)
+    async for video_info in videos:
         # 从响应中获取视频链接 | Get video URL from response
         aweme_id = video_info["aweme_id"]
         try:
             # Try to get the video play address
-            play_addr = get_video_play_address(video_info)
+            variant = get_video_variant(video_info)
         except Exception as e:
             # 如果报错大概是因为作品不是视频而是图集，或视频已被删除
             # If error, probably because the work is not a video but a set of pictures, or the video has been deleted
             print(f"Error retrieving video info: {e}")
             print(f"Skipping video: {aweme_id}")
             continue
-        # 下载视频 | Download video
-        file_name = asyncio.run(download_file(aweme_id, play_addr))
-        print(f"Video downloaded: {file_name}")
+        file_name = os.path.join(output_dir, aweme_id + ".mp4")
+        # 跳过已下载且大小一致的文件 | Skip files already downloaded with the recorded size
+        if sync is not None and sync.is_downloaded(file_name):
+            continue
+        # 接口给出的文件大小记入清单作为预期大小 | The size reported by the API is recorded as the expected size
+        yield variant.url_list, file_name, "douyin", variant.data_size
+
+
+# 并发下载主页全部视频 | Download all videos of a profile concurrently
+async def download_profile(sec_user_id: str, output_dir: str = "downloads", concurrency: int = DOWNLOAD_CONCURRENCY,
+                           sync: bool = False):
+    # 翻页与下载重叠：第一页取到后就开始下载，队列有上限，内存不随作品数增长
+    # Pagination overlaps downloading: downloads start after the first page, and the bounded queue keeps memory flat
+    # 一个事件循环、一个连接池，限制总并发和每个 CDN 主机的并发
+    # One event loop and one connection pool, bounded overall and per CDN host
+    os.makedirs(output_dir, exist_ok=True)
+    # 增量同步：按主页状态文件只下载新作品，已有文件大小一致时跳过
+    # Incremental sync: the per-profile state file limits downloads to new posts, existing files of the right size are skipped
+    state = ProfileSync(state_path(output_dir, "douyin", sec_user_id)) if sync else None
+    async with download_client(concurrency) as http_client:
+        pool = DownloadPool(http_client, "douyin", concurrency, skip_existing=sync,
+                            on_complete=state.mark_downloaded if state is not None else None, manifest=MANIFEST)
+        complete = False
+        try:
+            downloaded = await pool.stream(iter_profile_jobs(sec_user_id, output_dir, state))
+            complete = pool.failed == 0
+        finally:
+            if state is not None:
+                state.finish(complete)
+    print(pool.summary())
+    print(f"Variant selection ({VIDEO_VARIANT_POLICY}) saved {bytes_saved('douyin') / 1024 / 1024:.1f} MB")
+    if state is not None:
+        print(f"Sync: {state.new_posts} new posts" + (", stopped at already synced posts" if state.reached_known else ""))
+    return downloaded
+
+
+if __name__ == "__main__":
+    # 设置 METRICS_PORT 时提供 /metrics 端点 | Serve /metrics when METRICS_PORT is set
+    start_metrics_server()
+    # 主页链接 | Profile URL
+    profile_url = "https://www.douyin.com/user/MS4wLjABAAAAH6qtuglSMr7givzADiJu6mr2S4ufCtRvIGvV1O1T85uqlCNX4SVct8TWIs8BU2x6"
+    sec_user_id = profile_url.split("/")[-1]
+    # 增量同步主页视频，再次运行只下载新作品 | Sync profile videos; re-runs only download new posts
+    asyncio.run(download_profile(sec_user_id, sync=True))
@@ -1,10 +1,16 @@
 import os
+import sys
 import asyncio
 import httpx
 import aiofiles
 from tikhub import Client
 from dotenv import load_dotenv
 
+# 将仓库根目录加入模块搜索路径 | Add repository root to module search path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from response_cache import cache_key
+from singleflight import INFLIGHT
+
 # 加载 .env 文件 | Load .env file
 load_dotenv()
 
@@ -21,19 +27,28 @@ if not api_key or api_key == "your_private_api_key":
 
     asyncio.run(create_default_env_file())
 
-# 初始化 TikHub 客户端 | Initialize TikHub client
-client = Client(api_key=api_key)
+# 初始化 TikHub 客户端，可通过 TIKHUB_API_BASE 指向其他服务 (如本地模拟服务器)
+# Initialize TikHub client; TIKHUB_API_BASE can point it at another server (e.g. the local mock server)
+api_base = os.getenv("TIKHUB_API_BASE")
+client = Client(api_key=api_key, base_url=api_base) if api_base else Client(api_key=api_key)
 
 
 # 获取视频统计信息 | Get video statistics
 async def video_statistics_checker(video_url: str):
     try:
-        video_info = await client.DouyinAppV3.fetch_one_video_by_share_url(video_url)
+        # 统计数据需要实时，只合并并发的相同请求而不做缓存 | Statistics must be live: coalesce concurrent calls, no caching
+        video_info = await INFLIGHT.do(
+            cache_key("douyin/app/v3/fetch_one_video_by_share_url", {"share_url": video_url}),
+            lambda: client.DouyinAppV3.fetch_one_video_by_share_url(video_url),
+        )
 
         aweme_id = video_info["data"]["aweme_detail"]["aweme_id"]
         statistics_1 = video_info["data"]["aweme_detail"]["statistics"]
 
-        statistics_2 = await client.DouyinAppV3.fetch_video_statistics(aweme_id)
+        statistics_2 = await INFLIGHT.do(
+            cache_key("douyin/app/v3/fetch_video_statistics", {"aweme_ids": aweme_id}),
+            lambda: client.DouyinAppV3.fetch_video_statistics(aweme_id),
+        )
 
         all_statistics = statistics_1 | statistics_2["data"]["statistics_list"][0]
 
@@ -47,6 +62,7 @@ async def video_statistics_checker(video_url: str):
 async def main(video_url: str):
     statistics = await video_statistics_checker(video_url)
     print(statistics)
+    print(f"Request coalescing: {INFLIGHT.stats()}")
 
 
 if __name__ == "__main__":
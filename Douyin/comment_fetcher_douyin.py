@@ -1,10 +1,31 @@
 import os
+import sys
 import asyncio
+import argparse
 import httpx
 from dotenv import load_dotenv
-from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType
+from pymilvus import connections, Collection
 from sentence_transformers import SentenceTransformer
 
+# 将仓库根目录加入模块搜索路径，复用根目录下的公共模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from response_cache import RESPONSE_CACHE, cache_key
+from singleflight import INFLIGHT
+from profiling import PROFILER, add_profile_arguments, enable_from_args
+from metrics import start_metrics_server, timed_request
+from comment_batch import CommentBatch
+from comment_clustering import load_tagger
+from comment_schema import (
+    collection_fields, comment_pk, create_comment_collection, ensure_scalar_indexes, epoch_seconds, has_epoch_time,
+    is_legacy,
+)
+from crawl_manifest import (
+    CrawlManifest, COMPLETE, INCREMENTAL_KNOWN_PAGES, Newest, comments_stored, seed_from_collection,
+)
+from comment_scheduler import (
+    COMMENT_CONCURRENCY, COMMENT_RATE_LIMIT, RateLimiter, add_scheduler_arguments, crawl_videos,
+)
+
 # 加载环境变量
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
@@ -12,101 +33,133 @@ API_KEY = os.getenv("API_KEY")
 # Milvus 配置
 MILVUS_HOST = "localhost"
 MILVUS_PORT = "19530"
+# TikHub API 地址，可指向其他服务 (如本地模拟服务器)
+TIKHUB_API_BASE = os.getenv("TIKHUB_API_BASE", "https://api.tikhub.io")
 model = SentenceTransformer('all-MiniLM-L6-v2')
+# 每攒多少页评论做一次 encode + insert (1 表示逐页写入)
+FLUSH_PAGES = int(os.getenv("DOUYIN_COMMENT_FLUSH_PAGES", "1"))
+# 各视频的抓取进度 (与快手评论共用一个清单文件，按平台区分)
+MANIFEST = CrawlManifest()
+# 设置 COMMENT_CLUSTER_DIR 时，写入前把新评论与已知的近重复簇比较
+TAGGER = load_tagger("douyin_comments")
 
-def init_milvus():
+def init_milvus(collection_name: str = "douyin_comments"):
     """初始化 Milvus 连接和集合"""
     connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
-    collection_name = "douyin_comments"
     
     try:
         collection = Collection(name=collection_name)
         print(f"集合已存在: {collection_name}")
+        if is_legacy(collection.schema.fields):
+            print("该集合为自增主键的旧版 schema，写入时按 comment_id 先删后插；"
+                  "可用 comment_dedupe.py 清理重复行或迁移到以评论 ID 为主键的新集合")
+        if not has_epoch_time(collection.schema.fields):
+            print("该集合的 time 字段为字符串，不支持按时间范围过滤；迁移到新 schema 后改为 Unix 秒")
+        ensure_scalar_indexes(collection)
     except Exception:
-        fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="comment_id", dtype=DataType.INT64),
-            FieldSchema(name="photo_id", dtype=DataType.VARCHAR, max_length=200),
-            FieldSchema(name="author_name", dtype=DataType.VARCHAR, max_length=200),
-            FieldSchema(name="author_id", dtype=DataType.INT64),
-            FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=2000),
-            FieldSchema(name="content_vector", dtype=DataType.FLOAT_VECTOR, dim=384),
-            FieldSchema(name="time", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="likes", dtype=DataType.INT64),
-            FieldSchema(name="area", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="is_reply", dtype=DataType.BOOL),
-            FieldSchema(name="video_author_id", dtype=DataType.VARCHAR, max_length=200),
-            FieldSchema(name="video_author_name", dtype=DataType.VARCHAR, max_length=200)
-        ]
-        schema = CollectionSchema(fields, description="抖音视频评论集合")
-        collection = Collection(name=collection_name, schema=schema)
-        
-        index_params = {
-            "metric_type": "L2",
-            "index_type": "IVF_FLAT",
-            "params": {"nlist": 1024}
-        }
-        collection.create_index(field_name="content_vector", index_params=index_params)
+        collection = create_comment_collection(collection_name, "抖音视频评论集合")
         print(f"创建集合: {collection_name}")
     
     collection.load()
     return collection
 
-async def save_to_milvus(collection, comments, photo_id, video_author_id, video_author_name):
-    """保存评论到 Milvus"""
+def comment_row(comment, is_reply, photo_id, video_author_id, video_author_name):
+    """把一条原始评论转成一行 (不含向量)"""
+    user = comment.get("user") or {}
+    comment_id = int(comment.get("cid", 0))
+    if not comment_id:
+        raise ValueError("缺少评论 ID")
+    return {
+        "pk": comment_pk("douyin", comment_id),
+        "comment_id": comment_id,
+        "photo_id": str(photo_id),
+        "author_name": str(user.get("nickname", "")),
+        "author_id": int(user.get("uid", 0)),
+        "content": str(comment.get("text", "")),
+        "time": epoch_seconds(comment.get("create_time")),
+        "likes": int(comment.get("digg_count", 0)),
+        "area": str(user.get("region", "")),
+        "is_reply": is_reply,
+        "video_author_id": str(video_author_id),
+        "video_author_name": str(video_author_name)
+    }
+
+def new_comment_batch(collection):
+    """同一条评论重复写入时覆盖原有的行"""
+    return CommentBatch(collection, model, collection_fields(collection), "抖音", "douyin_comments",
+                        replace_key="comment_id", tagger=TAGGER)
+
+def comment_time(comment) -> int:
+    """评论时间戳 (秒)"""
+    return epoch_seconds(comment.get("create_time"))
+
+async def save_to_milvus(collection, comments, photo_id, video_author_id, video_author_name, batch=None, final=True):
+    """把一页评论 (含回复) 加入列批次；攒满 FLUSH_PAGES 页或 final 时一次 encode、一次 insert。
+
+    返回本次写入的条数 (只加入批次时为 0)，写入失败时返回 None。
+    """
     try:
         print(f"\n开始处理评论数据，共 {len(comments)} 条评论")
+        if batch is None:
+            batch = new_comment_batch(collection)
         
-        def process_and_insert_comment(comment, is_reply=False):
-            try:
-                content = comment.get("text", "")
-                content_vector = model.encode(content).tolist()
-                
-                entity = [{
-                    "comment_id": int(comment.get("cid", 0)),
-                    "photo_id": str(photo_id),
-                    "author_name": str(comment.get("user", {}).get("nickname", "")),
-                    "author_id": int(comment.get("user", {}).get("uid", 0)),
-                    "content": str(content),
-                    "content_vector": content_vector,
-                    "time": str(comment.get("create_time", "")),
-                    "likes": int(comment.get("digg_count", 0)),
-                    "area": str(comment.get("user", {}).get("region", "")),
-                    "is_reply": is_reply,
-                    "video_author_id": str(video_author_id),
-                    "video_author_name": str(video_author_name)
-                }]
-                
-                print(f"\n处理评论: {content[:30]}...")
-                mr = collection.insert(entity)
-                print(f"评论已保存，插入结果：{mr}")
+        # extract 阶段只包含字段整理，不含 encode/insert
+        with PROFILER.stage("extract"):
+            for comment in comments:
+                batch.add(comment, comment_row, False, photo_id, video_author_id, video_author_name)
                 
-            except Exception as e:
-                print(f"处理单条评论时出错: {str(e)}")
-                print(f"评论原始数据: {comment}")
-        
-        # 处理评论
-        total_count = 0
-        for comment in comments:
-            process_and_insert_comment(comment)
-            total_count += 1
-            
-            # 处理回复评论
-            if "reply_comment" in comment and comment["reply_comment"]:
-                process_and_insert_comment(comment["reply_comment"], True)
-                total_count += 1
+                # 处理回复评论 (单条或列表)
+                replies = comment.get("reply_comment") if isinstance(comment, dict) else None
+                if isinstance(replies, dict):
+                    replies = [replies]
+                for reply in replies or []:
+                    batch.add(reply, comment_row, True, photo_id, video_author_id, video_author_name)
         
-        # 确保数据写入
-        collection.flush()
-        print(f"\n总共保存了 {total_count} 条评论到 Milvus")
+        if batch.end_page() >= FLUSH_PAGES or final:
+            return await flush_comments(collection, batch)
+        return 0
             
     except Exception as e:
         print(f"保存到 Milvus 时出错: {str(e)}")
         print(f"错误详情: {type(e).__name__}")
+        return None
 
-async def fetch_video_comments(aweme_id: str, collection, video_author_id: str, video_author_name: str, cursor: str = "0"):
-    """获取指定视频的评论信息"""
-    api_url = "https://api.tikhub.io/api/v1/douyin/app/v1/fetch_video_comments"
+async def flush_comments(collection, batch):
+    """写入批次中累积的评论，返回写入条数，失败时返回 None"""
+    pages = batch.pages
+    try:
+        # encode 和 insert 放到线程中执行，不阻塞其他视频的请求
+        total_count = await asyncio.to_thread(batch.flush)
+    except Exception as e:
+        print(f"写入评论批次时出错: {str(e)}")
+        return None
+    if not total_count:
+        return 0
+    # 确保数据写入
+    with PROFILER.stage("flush"):
+        await asyncio.to_thread(collection.flush)
+    print(f"\n{pages} 页共保存了 {total_count} 条评论到 Milvus" + (f"，累计跳过 {batch.skipped} 条格式异常的评论" if batch.skipped else ""))
+    return total_count
+
+async def fetch_video_comments(aweme_id: str, collection, video_author_id: str, video_author_name: str, cursor: str = "0",
+                               client: httpx.AsyncClient = None, limiter: RateLimiter = None,
+                               incremental: bool = False, since: Newest = None):
+    """按页顺序获取指定视频的评论，各页共用一个列批次，结束时写入剩余评论。
+
+    client 和 limiter 可由调度器在多个视频间共享。每次写入后在清单中记录下一页的游标，
+    全部分页完成后标记为 complete。
+    incremental 为 True 时刷新已完成的视频：按 comment_id 覆盖写入，连续 INCREMENTAL_KNOWN_PAGES 页
+    的评论都已在集合中时停止 (晚于 since，即上次记录的最新评论的，不必查询)，结束时才更新清单；
+    增量刷新不读响应缓存。
+    """
+    if client is None:
+        async with httpx.AsyncClient(verify=False) as own_client:
+            return await fetch_video_comments(aweme_id, collection, video_author_id, video_author_name, cursor,
+                                              own_client, limiter, incremental, since)
+    if limiter is None:
+        limiter = RateLimiter()
+
+    api_url = f"{TIKHUB_API_BASE}/api/v1/douyin/app/v1/fetch_video_comments"
     
     headers = {
         "Authorization": f"Bearer {API_KEY}",
@@ -114,66 +167,158 @@ async def fetch_video_comments(aweme_id: str, collection, video_author_id: str,
         "User-Agent": "TikHub-Demo"
     }
     
-    params = {
-        "aweme_id": aweme_id,
-        "cursor": cursor
-    }
-    
-    async with httpx.AsyncClient(verify=False) as client:
-        try:
+    batch = new_comment_batch(collection)
+    newest = None
+    known_pages = 0  # 连续已全部写入过的页数
+    written_pages = written_comments = 0  # 已写入、尚未记录到清单的页数和条数
+    complete = False
+
+    def record(next_cursor=None):
+        """把已写入的页数、条数和最新评论写入清单；next_cursor 为空表示已完成"""
+        nonlocal written_pages, written_comments
+        if next_cursor:
+            MANIFEST.save_progress("抖音", aweme_id, next_cursor, written_pages, written_comments, newest)
+        else:
+            MANIFEST.mark_complete("抖音", aweme_id, written_pages, written_comments, newest)
+        written_pages = written_comments = 0
+
+    try:
+        while True:
+            params = {
+                "aweme_id": aweme_id,
+                "cursor": cursor
+            }
+            
             if cursor == "0":
                 print(f"\n正在获取视频 {aweme_id} 的评论...")
             else:
                 print(f"\n正在获取下一页评论 (cursor: {cursor})...")
                 
-            response = await client.get(api_url, headers=headers, params=params, timeout=30.0)
+            async def request_page():
+                # 只有真正发出的请求才占用限速额度，缓存命中不受影响
+                await limiter.acquire()
+                with PROFILER.stage("fetch"):
+                    response = await client.get(api_url, headers=headers, params=params, timeout=30.0)
+                response.raise_for_status()
+                with PROFILER.stage("parse"):
+                    return response.json()
+
+            try:
+                # 多个任务同时请求同一页评论时只发起一次上游请求；增量刷新要看到接口当前的评论，
+                # 不能读缓存 (缓存中的旧页会被判为已抓取而提前结束)，也不搭可能读缓存的同一页请求
+                data = await INFLIGHT.do(
+                    cache_key(api_url, params) + (":refresh" if incremental else ""),
+                    lambda: RESPONSE_CACHE.fetch(api_url, params, timed_request("抖音:comments", request_page),
+                                                 refresh=incremental),
+                )
+            except httpx.HTTPStatusError as e:
+                print(f"获取评论失败: {e.response.text}")
+                return
+
+            comments = data.get("data", {}).get("comments", [])
+            has_more = data.get("data", {}).get("has_more", False)
             
-            if response.status_code == 200:
-                data = response.json()
-                comments = data.get("data", {}).get("comments", [])
-                
-                if comments:
-                    # 保存到 Milvus
-                    await save_to_milvus(collection, comments, aweme_id, video_author_id, video_author_name)
-                
-                if not comments:
-                    if cursor == "0":
-                        print("没有找到评论")
+            if not comments:
+                if cursor == "0":
+                    print("没有找到评论")
+                complete = True
+                return
+            
+            if incremental:
+                # 连续 INCREMENTAL_KNOWN_PAGES 页的评论都已写入集合才停止：接口先列热门评论，不能只看时间
+                page = [(comment_time(c), int(c.get("cid") or 0)) for c in comments]
+                if await asyncio.to_thread(comments_stored, collection, aweme_id, page, since):
+                    known_pages += 1
+                else:
+                    known_pages = 0
+                if known_pages >= INCREMENTAL_KNOWN_PAGES:
+                    print(f"\n视频 {aweme_id} 连续 {known_pages} 页评论均已抓取过，增量刷新结束")
+                    complete = True
                     return
+            page_newest = max((comment_time(c), str(c.get("cid"))) for c in comments)
+            newest = max(newest, page_newest) if newest else page_newest
+            
+            # 保存到 Milvus
+            pages = batch.pages + 1
+            saved = await save_to_milvus(collection, comments, aweme_id, video_author_id, video_author_name,
+                                         batch, final=not has_more)
+            if saved is None:
+                # 未写入的页不推进游标，下次从上次记录的位置重新开始
+                return
+            cursor = str(int(cursor) + len(comments))
+            if batch.pages == 0:
+                # 本页触发了写入
+                written_pages += pages
+                written_comments += saved
+                if has_more and not incremental:
+                    # 增量刷新中途不记录游标：中断后下次整体重新刷新，避免续抓时重复插入
+                    record(cursor)
+            
+            # 检查是否有更多评论，继续下一页
+            if not has_more:
+                print("\n已获取全部评论")
+                complete = True
+                return
                 
-                # 检查是否有更多评论并递归获取
-                has_more = data.get("data", {}).get("has_more", False)
-                next_cursor = str(int(cursor) + len(comments))
-                
-                if has_more:
-                    await asyncio.sleep(1)  # 添加延迟避免请求过快
-                    await fetch_video_comments(aweme_id, collection, video_author_id, video_author_name, next_cursor)
-                else:
-                    print("\n已获取全部评论")
-                    
+    except Exception as e:
+        print(f"获取评论时出错: {str(e)}")
+    finally:
+        # 中途出错或提前结束时也写入已攒下的评论
+        if batch.pages:
+            pages = batch.pages
+            written = await flush_comments(collection, batch)
+            if written is None:
+                complete = False
             else:
-                print(f"获取评论失败: {response.text}")
-                
-        except Exception as e:
-            print(f"获取评论时出错: {str(e)}")
+                written_pages += pages
+                written_comments += written
+                if not complete and not incremental:
+                    record(cursor)
+        if complete:
+            record()
+
+async def crawl_comment_videos(collection, videos, concurrency: int = COMMENT_CONCURRENCY, rate: float = COMMENT_RATE_LIMIT):
+    """并发抓取多个视频的评论。
 
-async def main():
+    videos 为 (aweme_id, 作者 ID, 作者昵称[, 续抓游标[, 增量刷新起点]]) 列表，
+    带增量刷新起点 (或为 True) 的视频按增量模式刷新。
+    """
+    limiter = RateLimiter(rate)
+    limits = httpx.Limits(max_connections=max(concurrency, 1), max_keepalive_connections=max(concurrency, 1))
+    async with httpx.AsyncClient(verify=False, limits=limits) as client:
+        async def crawl_one(video):
+            aweme_id, video_author_id, video_author_name, *rest = video
+            cursor = rest[0] if rest and rest[0] else "0"
+            refresh = rest[1] if len(rest) > 1 else None
+            print(f"\n正在处理视频 ID: {aweme_id} (作者: {video_author_name} / {video_author_id})"
+                  + (f"，从 cursor={cursor} 继续" if cursor != "0" else "")
+                  + ("，增量刷新" if refresh else ""))
+            await fetch_video_comments(aweme_id, collection, video_author_id, video_author_name, cursor,
+                                       client=client, limiter=limiter, incremental=bool(refresh),
+                                       since=refresh if isinstance(refresh, tuple) else None)
+
+        await crawl_videos(videos, crawl_one, concurrency, queue_name="抖音:comment_videos")
+
+async def main(concurrency: int = COMMENT_CONCURRENCY, rate: float = COMMENT_RATE_LIMIT, seed: bool = False,
+               incremental: bool = False):
+    start_metrics_server()
     try:
         collection = init_milvus()
         
-        # 获取已存在的 photo_id 列表
-        existing_videos = set()
-        try:
-            res = collection.query(
-                expr="photo_id != ''",
-                output_fields=["photo_id"]
-            )
-            existing_videos = set(item['photo_id'] for item in res)
-            print(f"数据库中已存在 {len(existing_videos)} 个视频的评论")
-        except Exception as e:
-            print(f"查询现有数据时出错: {str(e)}")
+        if seed:
+            # 一次性迁移：把库中已有评论的视频记为已完成
+            try:
+                print(f"从 Milvus 登记了 {seed_from_collection(MANIFEST, '抖音', collection)} 个已完成视频")
+            except Exception as e:
+                print(f"从 Milvus 登记已有视频时出错: {str(e)}")
+        
+        # 读取各视频的抓取进度
+        states = MANIFEST.states("抖音")
+        print(f"清单中已登记 {len(states)} 个视频: {MANIFEST.counts('抖音')}")
         
         # 从文件中读取数据
+        videos = []
+        queued = set()
         comment_file_path = "e:\\TikHub-API-Demo-main\\抖音作品评论.txt"
         with open(comment_file_path, 'r', encoding='utf-8') as f:
             for line in f:
@@ -185,25 +330,40 @@ async def main():
                 parts = line.split()
                 if len(parts) >= 3:
                     aweme_id = parts[0]
-                    video_author_id = parts[1]
-                    video_author_name = parts[2]
                     
-                    # 检查是否已存在
-                    if aweme_id in existing_videos:
-                        print(f"\n视频 {aweme_id} 的评论已存在，跳过")
+                    # 已完成的视频跳过 (增量模式下从头刷新到已知评论为止)，
+                    # 抓到一半的从记录的游标继续 (文件中重复的视频只抓一次)
+                    state = states.get(aweme_id)
+                    if aweme_id in queued:
                         continue
-                    
-                    print(f"\n正在处理新视频 ID: {aweme_id}")
-                    print(f"视频作者 ID: {video_author_id}")
-                    print(f"视频作者昵称: {video_author_name}")
-                    
-                    await fetch_video_comments(aweme_id, collection, video_author_id, video_author_name)
-                    # 添加到已处理集合
-                    existing_videos.add(aweme_id)
+                    if state and state.status == COMPLETE:
+                        if not incremental:
+                            continue
+                        queued.add(aweme_id)
+                        videos.append((aweme_id, parts[1], parts[2], "", state.newest or True))
+                        continue
+                    queued.add(aweme_id)
+                    videos.append((aweme_id, parts[1], parts[2], state.cursor if state else ""))
                 else:
                     print(f"行格式错误，跳过: {line}")
+        
+        MANIFEST.register("抖音", queued)
+        print(f"\n待抓取 {len(videos)} 个视频 (其中 {sum(1 for v in videos if v[3])} 个续抓，{sum(1 for v in videos if len(v) > 4)} 个增量刷新)，并发数 {concurrency}，限速 {rate} 次/秒")
+        await crawl_comment_videos(collection, videos, concurrency, rate)
     finally:
         connections.disconnect("default")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="抖音视频评论采集")
+    parser.add_argument("--flush-pages", type=int, default=FLUSH_PAGES,
+                        help="每攒多少页评论写入一次 Milvus (默认读取 DOUYIN_COMMENT_FLUSH_PAGES，为 1)")
+    parser.add_argument("--seed-from-milvus", action="store_true",
+                        help="把 Milvus 中已有评论的视频登记为已完成 (从旧版本升级时运行一次)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量刷新已完成的视频：只抓取上次之后的新评论，按 comment_id 覆盖写入")
+    add_scheduler_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    FLUSH_PAGES = max(1, args.flush_pages)
+    enable_from_args(args)
+    asyncio.run(main(args.concurrency, args.rate, args.seed_from_milvus, args.incremental))
@@ -1,10 +1,31 @@
 import os
+import sys
 import asyncio
+import argparse
 import httpx
 from dotenv import load_dotenv
-from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType
+from pymilvus import connections, Collection
 from sentence_transformers import SentenceTransformer
 
+# 将仓库根目录加入模块搜索路径，复用根目录下的公共模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from response_cache import RESPONSE_CACHE, cache_key
+from singleflight import INFLIGHT
+from profiling import PROFILER, add_profile_arguments, enable_from_args
+from metrics import start_metrics_server, timed_request
+from comment_batch import CommentBatch
+from comment_clustering import load_tagger
+from comment_schema import (
+    collection_fields, comment_pk, create_comment_collection, ensure_scalar_indexes, epoch_seconds, has_epoch_time,
+    is_legacy,
+)
+from crawl_manifest import (
+    CrawlManifest, COMPLETE, INCREMENTAL_KNOWN_PAGES, Newest, comments_stored, seed_from_collection,
+)
+from comment_scheduler import (
+    COMMENT_CONCURRENCY, COMMENT_RATE_LIMIT, RateLimiter, add_scheduler_arguments, crawl_videos,
+)
+
 # 加载环境变量
 load_dotenv()
 API_KEY = os.getenv("API_KEY")
@@ -12,194 +33,354 @@ API_KEY = os.getenv("API_KEY")
 # Milvus 配置
 MILVUS_HOST = "localhost"
 MILVUS_PORT = "19530"
+# TikHub API 地址，可指向其他服务 (如本地模拟服务器)
+TIKHUB_API_BASE = os.getenv("TIKHUB_API_BASE", "https://api.tikhub.io")
+HEADERS = {
+    "Authorization": f"Bearer {API_KEY}",
+    "Referer": "https://github.com/TikHub/TikHub-API-Demo",
+    "User-Agent": "TikHub-Demo"
+}
+# 每个视频同时展开的回复楼层数 (0 表示只保存主评论页内嵌的回复)
+SUB_COMMENT_CONCURRENCY = int(os.getenv("KUAISHOU_SUB_COMMENT_CONCURRENCY", "4"))
 model = SentenceTransformer('all-MiniLM-L6-v2')
+# 各视频的抓取进度 (与抖音评论共用一个清单文件，按平台区分)
+MANIFEST = CrawlManifest()
+# 设置 COMMENT_CLUSTER_DIR 时，写入前把新评论与已知的近重复簇比较
+TAGGER = load_tagger("kuaishou_comments")
 
-def init_milvus():
+def init_milvus(collection_name: str = "kuaishou_comments"):
     """初始化 Milvus 连接和集合"""
     connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
-    collection_name = "kuaishou_comments"
     
     try:
         collection = Collection(name=collection_name)
         print(f"集合已存在: {collection_name}")
+        if is_legacy(collection.schema.fields):
+            print("该集合为自增主键的旧版 schema，写入时按 comment_id 先删后插；"
+                  "可用 comment_dedupe.py 清理重复行或迁移到以评论 ID 为主键的新集合")
+        if not has_epoch_time(collection.schema.fields):
+            print("该集合的 time 字段为字符串，不支持按时间范围过滤；迁移到新 schema 后改为 Unix 秒")
+        ensure_scalar_indexes(collection)
     except Exception:
-        fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="comment_id", dtype=DataType.INT64),
-            FieldSchema(name="photo_id", dtype=DataType.VARCHAR, max_length=200),
-            FieldSchema(name="author_name", dtype=DataType.VARCHAR, max_length=200),
-            FieldSchema(name="author_id", dtype=DataType.INT64),
-            FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=2000),
-            FieldSchema(name="content_vector", dtype=DataType.FLOAT_VECTOR, dim=384),
-            FieldSchema(name="time", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="likes", dtype=DataType.INT64),
-            FieldSchema(name="area", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="is_reply", dtype=DataType.BOOL),
-            # 添加新字段
-            FieldSchema(name="video_author_id", dtype=DataType.VARCHAR, max_length=200),
-            FieldSchema(name="video_author_name", dtype=DataType.VARCHAR, max_length=200)
-        ]
-        schema = CollectionSchema(fields, description="快手视频评论集合")
-        collection = Collection(name=collection_name, schema=schema)
-        
-        index_params = {
-            "metric_type": "L2",
-            "index_type": "IVF_FLAT",
-            "params": {"nlist": 1024}
-        }
-        collection.create_index(field_name="content_vector", index_params=index_params)
+        collection = create_comment_collection(collection_name, "快手视频评论集合")
         print(f"创建集合: {collection_name}")
     
     collection.load()
     return collection
 
+def comment_row(comment, is_reply, photo_id, video_author_id, video_author_name):
+    """把一条原始评论转成一行 (不含向量)"""
+    comment_id = int(comment.get("comment_id", 0))
+    if not comment_id:
+        raise ValueError("缺少评论 ID")
+    return {
+        "pk": comment_pk("kuaishou", comment_id),
+        "comment_id": comment_id,
+        "photo_id": str(photo_id),
+        "author_name": str(comment.get("author_name", "")),
+        "author_id": int(comment.get("author_id", 0)),
+        "content": str(comment.get("content", "")),
+        "time": epoch_seconds(comment.get("timestamp") or comment.get("time")),
+        "likes": int(comment.get("likedCount", 0)),
+        "area": str(comment.get("authorArea", "")),
+        "is_reply": is_reply,
+        "video_author_id": str(video_author_id),
+        "video_author_name": str(video_author_name)
+    }
+
+def comment_time(comment) -> int:
+    """评论时间戳 (秒)，快手返回的 timestamp 为毫秒"""
+    return epoch_seconds(comment.get("timestamp"))
+
 async def save_to_milvus(collection, comments, sub_comments_map, photo_id, video_author_id, video_author_name):
-    """保存评论到 Milvus"""
+    """把一页主评论和子评论整理成列，一次 encode、一次 insert 保存到 Milvus。
+
+    同一条评论重复写入时覆盖原有的行。返回写入条数，出错时返回 None。
+    """
     try:
         print(f"\n开始处理评论数据，共 {len(comments)} 条主评论")
+        batch = CommentBatch(collection, model, collection_fields(collection), "快手", "kuaishou_comments",
+                             replace_key="comment_id", tagger=TAGGER)
         
-        def process_and_insert_comment(comment, is_reply=False):
-            try:
-                content = comment.get("content", "")
-                content_vector = model.encode(content).tolist()
-                
-                entity = [{
-                    "comment_id": int(comment.get("comment_id", 0)),
-                    "photo_id": str(photo_id),
-                    "author_name": str(comment.get("author_name", "")),
-                    "author_id": int(comment.get("author_id", 0)),
-                    "content": str(content),
-                    "content_vector": content_vector,
-                    "time": str(comment.get("time", "")),
-                    "likes": int(comment.get("likedCount", 0)),
-                    "area": str(comment.get("authorArea", "")),
-                    "is_reply": is_reply,
-                    "video_author_id": str(video_author_id),
-                    "video_author_name": str(video_author_name)
-                }]
+        # 展开主评论和子评论；extract 阶段只包含字段整理，不含打印和 encode/insert
+        sub_counts = []
+        with PROFILER.stage("extract"):
+            for comment in comments:
+                batch.add(comment, comment_row, False, photo_id, video_author_id, video_author_name)
                 
-                print(f"\n处理评论: {content[:30]}...")
-                mr = collection.insert(entity)
-                print(f"评论已保存，插入结果：{mr}")
-                
-            except Exception as e:
-                print(f"处理单条评论时出错: {str(e)}")
-                print(f"评论原始数据: {comment}")
+                comment_id = str(comment.get("comment_id"))
+                if comment_id in sub_comments_map:
+                    sub_comments = sub_comments_map[comment_id].get("subComments", [])
+                    sub_counts.append(len(sub_comments))
+                    for sub in sub_comments:
+                        batch.add(sub, comment_row, True, photo_id, video_author_id, video_author_name)
+        for count in sub_counts:
+            print(f"发现 {count} 条子评论")
         
-        # 处理主评论和子评论
-        total_count = 0
-        for comment in comments:
-            process_and_insert_comment(comment)
-            total_count += 1
-            
-            comment_id = str(comment.get("comment_id"))
-            if comment_id in sub_comments_map:
-                sub_comments = sub_comments_map[comment_id].get("subComments", [])
-                print(f"发现 {len(sub_comments)} 条子评论")
-                for sub in sub_comments:
-                    process_and_insert_comment(sub, True)
-                    total_count += 1
+        # encode 和 insert 放到线程中执行，不阻塞其他视频的请求
+        total_count = await asyncio.to_thread(batch.flush)
         
         # 确保数据写入
-        collection.flush()
-        print(f"\n总共保存了 {total_count} 条评论到 Milvus")
+        with PROFILER.stage("flush"):
+            await asyncio.to_thread(collection.flush)
+        print(f"\n总共保存了 {total_count} 条评论到 Milvus" + (f"，跳过 {batch.skipped} 条格式异常的评论" if batch.skipped else ""))
+        return total_count
             
     except Exception as e:
         print(f"保存到 Milvus 时出错: {str(e)}")
         print(f"错误详情: {type(e).__name__}")
+        return None
 
-async def fetch_video_comments(photo_id: str, collection, video_author_id: str, video_author_name: str, pcursor: str = ""):
-    """获取指定视频的评论信息"""
-    api_url = "https://api.tikhub.io/api/v1/kuaishou/app/fetch_one_video_comment"
-    
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Referer": "https://github.com/TikHub/TikHub-API-Demo",
-        "User-Agent": "TikHub-Demo"
-    }
-    
-    params = {
-        "photo_id": photo_id,
-        "pcursor": pcursor
-    }
+async def fetch_json(client: httpx.AsyncClient, limiter: RateLimiter, api_url: str, params: dict, source: str,
+                     refresh: bool = False):
+    """请求一页接口数据，相同请求复用缓存和进行中的请求；refresh 为 True 时不读缓存"""
+    async def request_page():
+        # 只有真正发出的请求才占用限速额度，缓存命中不受影响
+        await limiter.acquire()
+        with PROFILER.stage("fetch"):
+            response = await client.get(api_url, headers=HEADERS, params=params, timeout=30.0)
+        response.raise_for_status()
+        with PROFILER.stage("parse"):
+            return response.json()
+
+    # 多个任务同时请求同一页时只发起一次上游请求
+    # refresh 的请求不能搭上可能读缓存的同一页请求
+    return await INFLIGHT.do(
+        cache_key(api_url, params) + (":refresh" if refresh else ""),
+        lambda: RESPONSE_CACHE.fetch(api_url, params, timed_request(source, request_page), refresh=refresh),
+    )
+
+async def fetch_sub_comments(client: httpx.AsyncClient, limiter: RateLimiter, photo_id: str, root_comment_id: str,
+                             pcursor: str = "", refresh: bool = False):
+    """从 pcursor 开始按页获取一条主评论的其余回复"""
+    api_url = f"{TIKHUB_API_BASE}/api/v1/kuaishou/app/fetch_one_video_sub_comment"
+    replies = []
+    while pcursor != "no_more":
+        params = {"photo_id": photo_id, "root_comment_id": root_comment_id, "pcursor": pcursor}
+        data = (await fetch_json(client, limiter, api_url, params, "快手:sub_comments", refresh)).get("data", {})
+        page = data.get("subComments", [])
+        replies.extend(page)
+        next_cursor = data.get("pcursor")
+        if not page or not next_cursor or next_cursor == pcursor:
+            break
+        pcursor = next_cursor
+    return replies
+
+async def expand_sub_comments(client: httpx.AsyncClient, limiter: RateLimiter, photo_id: str, root_comments,
+                              sub_comments_map, concurrency: int = SUB_COMMENT_CONCURRENCY,
+                              refresh: bool = False) -> int:
+    """补全本页回复数多于内嵌条数的楼层，回复追加到 sub_comments_map 中，返回新增条数。
+
+    各楼层并发抓取 (最多 concurrency 个)，请求仍受所有视频共享的限速约束；
+    某个楼层出错只保留其内嵌的回复。
+    """
+    if concurrency <= 0:
+        return 0
+    truncated = []
+    for comment in root_comments:
+        comment_id = str(comment.get("comment_id"))
+        thread = sub_comments_map.get(comment_id) or {}
+        embedded = len(thread.get("subComments", []))
+        if int(comment.get("subCommentCount") or 0) > embedded and thread.get("pcursor") != "no_more":
+            # 内嵌回复没有游标时从头抓取，重复的回复在写入批次时按 comment_id 去重
+            truncated.append((comment_id, (thread.get("pcursor") or "") if embedded else ""))
+    if not truncated:
+        return 0
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def expand(comment_id, pcursor):
+        async with slots:
+            try:
+                return await fetch_sub_comments(client, limiter, photo_id, comment_id, pcursor, refresh)
+            except Exception as e:
+                print(f"获取评论 {comment_id} 的回复时出错: {str(e)}")
+                return []
+
+    with PROFILER.stage("replies"):
+        results = await asyncio.gather(*(expand(comment_id, pcursor) for comment_id, pcursor in truncated))
+    added = 0
+    for (comment_id, _), replies in zip(truncated, results):
+        thread = sub_comments_map.setdefault(comment_id, {})
+        thread["subComments"] = thread.get("subComments", []) + replies
+        added += len(replies)
+    print(f"展开 {len(truncated)} 个回复楼层，补充 {added} 条回复")
+    return added
+
+async def fetch_video_comments(photo_id: str, collection, video_author_id: str, video_author_name: str, pcursor: str = "",
+                               client: httpx.AsyncClient = None, limiter: RateLimiter = None,
+                               incremental: bool = False, since: Newest = None,
+                               sub_comment_concurrency: int = SUB_COMMENT_CONCURRENCY):
+    """按页顺序获取指定视频的评论；client 和 limiter 可由调度器在多个视频间共享。
+
+    每页写入后在清单中记录下一页的游标，全部分页完成后标记为 complete。
+    incremental 为 True 时刷新已完成的视频：按 comment_id 覆盖写入，连续 INCREMENTAL_KNOWN_PAGES 页
+    的主评论都已在集合中时停止 (晚于 since，即上次记录的最新评论的，不必查询)，结束时才更新清单；
+    增量刷新不读响应缓存。
+    回复数多于内嵌条数的楼层会并发补全 (sub_comment_concurrency 为 0 时不补全)，与主评论一起写入。
+    """
+    if client is None:
+        async with httpx.AsyncClient(verify=False) as own_client:
+            return await fetch_video_comments(photo_id, collection, video_author_id, video_author_name, pcursor,
+                                              own_client, limiter, incremental, since, sub_comment_concurrency)
+    if limiter is None:
+        limiter = RateLimiter()
+
+    newest = None
+    known_pages = 0  # 连续已全部写入过的页数
+    pending_pages = pending_comments = 0
+
+    def record(next_cursor=None):
+        """把尚未记录的页数、条数和最新评论写入清单；next_cursor 为空表示已完成"""
+        nonlocal pending_pages, pending_comments
+        if next_cursor:
+            MANIFEST.save_progress("快手", photo_id, next_cursor, pending_pages, pending_comments, newest)
+        else:
+            MANIFEST.mark_complete("快手", photo_id, pending_pages, pending_comments, newest)
+        pending_pages = pending_comments = 0
+
+    api_url = f"{TIKHUB_API_BASE}/api/v1/kuaishou/app/fetch_one_video_comment"
     
-    async with httpx.AsyncClient(verify=False) as client:
-        try:
+    try:
+        while True:
+            params = {
+                "photo_id": photo_id,
+                "pcursor": pcursor
+            }
+            
             if not pcursor:
                 print(f"\n正在获取视频 {photo_id} 的评论...")
             else:
                 print(f"\n正在获取下一页评论 (pcursor: {pcursor})...")
                 
-            response = await client.get(api_url, headers=headers, params=params, timeout=30.0)
+            try:
+                # 增量刷新要看到接口当前的评论，不能读缓存：缓存中的旧页会被判为已抓取而提前结束
+                data = await fetch_json(client, limiter, api_url, params, "快手:comments", refresh=incremental)
+            except httpx.HTTPStatusError as e:
+                print(f"获取评论失败: {e.response.text}")
+                return
+
+            root_comments = data.get("data", {}).get("rootComments", [])
+            sub_comments_map = data.get("data", {}).get("subCommentsMap", {})
+            next_cursor = data.get("data", {}).get("pcursor")
             
-            if response.status_code == 200:
-                data = response.json()
-                root_comments = data.get("data", {}).get("rootComments", [])
-                sub_comments_map = data.get("data", {}).get("subCommentsMap", {})
-                
-                if root_comments:
-                    # 保存到 Milvus
-                    await save_to_milvus(collection, root_comments, sub_comments_map, photo_id, video_author_id, video_author_name)
-                
-                if not root_comments:
-                    if not pcursor:
-                        print("没有找到评论")
+            if not root_comments:
+                if not pcursor:
+                    print("没有找到评论")
+                record()
+                return
+            
+            if incremental:
+                # 连续 INCREMENTAL_KNOWN_PAGES 页的评论都已写入集合才停止：接口先列热门评论，不能只看时间
+                page = [(comment_time(c), int(c.get("comment_id") or 0)) for c in root_comments]
+                if await asyncio.to_thread(comments_stored, collection, photo_id, page, since):
+                    known_pages += 1
+                else:
+                    known_pages = 0
+                if known_pages >= INCREMENTAL_KNOWN_PAGES:
+                    print(f"\n视频 {photo_id} 连续 {known_pages} 页评论均已抓取过，增量刷新结束")
+                    record()
                     return
+            page_newest = max((comment_time(c), str(c.get("comment_id"))) for c in root_comments)
+            newest = max(newest, page_newest) if newest else page_newest
+            
+            # 补全被截断的回复楼层，与本页主评论一起写入
+            await expand_sub_comments(client, limiter, photo_id, root_comments, sub_comments_map,
+                                      sub_comment_concurrency, refresh=incremental)
+            
+            # 保存到 Milvus
+            saved = await save_to_milvus(collection, root_comments, sub_comments_map, photo_id, video_author_id, video_author_name)
+            if saved is None:
+                # 本页未写入，保留上一页的游标，下次从本页重新开始
+                return
+            pending_pages += 1
+            pending_comments += saved
+            
+            has_more = bool(next_cursor) and next_cursor != "no_more"
+            if not has_more:
+                record()
+            elif not incremental:
+                # 增量刷新中途不记录游标：中断后下次整体重新刷新，避免续抓时重复插入
+                record(next_cursor)
+            
+            if not pcursor:
+                print("\n评论列表：")
                 
-                if not pcursor:
-                    print("\n评论列表：")
-                    
-                for comment in root_comments:
-                    print("\n" + "="*50)
-                    print(f"用户名: {comment.get('author_name', '未知用户')}")
-                    print(f"用户ID: {comment.get('author_id', '未知ID')}")
-                    print(f"评论内容: {comment.get('content', '无内容')}")
-                    print(f"评论时间: {comment.get('time', '未知时间')}")
-                    print(f"点赞数: {comment.get('likedCount', 0)}")
-                    print(f"地区: {comment.get('authorArea', '未知地区')}")
-                    
-                    # 获取子评论
-                    comment_id = str(comment.get('comment_id'))
-                    if comment_id in sub_comments_map:
-                        sub_comments = sub_comments_map[comment_id].get('subComments', [])
-                        if sub_comments:
-                            print("\n回复：")
-                            for sub in sub_comments:
-                                print(f"\n  ↳ {sub.get('author_name')}: {sub.get('content')}")
-                                print(f"    时间: {sub.get('time')}")
-                                print(f"    点赞: {sub.get('likedCount', 0)}")
+            for comment in root_comments:
+                print("\n" + "="*50)
+                print(f"用户名: {comment.get('author_name', '未知用户')}")
+                print(f"用户ID: {comment.get('author_id', '未知ID')}")
+                print(f"评论内容: {comment.get('content', '无内容')}")
+                print(f"评论时间: {comment.get('time', '未知时间')}")
+                print(f"点赞数: {comment.get('likedCount', 0)}")
+                print(f"地区: {comment.get('authorArea', '未知地区')}")
                 
-                # 检查是否有更多评论并递归获取
-                next_cursor = data.get("data", {}).get("pcursor")
-                if next_cursor and next_cursor != "no_more":
-                    await asyncio.sleep(1)  # 添加延迟避免请求过快
-                    await fetch_video_comments(photo_id, collection, video_author_id, video_author_name, next_cursor)
-                elif pcursor:
+                # 获取子评论
+                comment_id = str(comment.get('comment_id'))
+                if comment_id in sub_comments_map:
+                    sub_comments = sub_comments_map[comment_id].get('subComments', [])
+                    if sub_comments:
+                        print("\n回复：")
+                        for sub in sub_comments:
+                            print(f"\n  ↳ {sub.get('author_name')}: {sub.get('content')}")
+                            print(f"    时间: {sub.get('time')}")
+                            print(f"    点赞: {sub.get('likedCount', 0)}")
+            
+            # 检查是否有更多评论，继续下一页
+            if not has_more:
+                if pcursor:
                     print("\n已获取全部评论")
-                    
-            else:
-                print(f"获取评论失败: {response.text}")
+                return
+            pcursor = next_cursor
                 
-        except Exception as e:
-            print(f"获取评论时出错: {str(e)}")
+    except Exception as e:
+        print(f"获取评论时出错: {str(e)}")
+
+async def crawl_comment_videos(collection, videos, concurrency: int = COMMENT_CONCURRENCY, rate: float = COMMENT_RATE_LIMIT,
+                               sub_comment_concurrency: int = SUB_COMMENT_CONCURRENCY):
+    """并发抓取多个视频的评论。
+
+    videos 为 (photo_id, 作者 ID, 作者昵称[, 续抓游标[, 增量刷新起点]]) 列表，
+    带增量刷新起点 (或为 True) 的视频按增量模式刷新。主评论和回复请求共用同一个限速器。
+    """
+    limiter = RateLimiter(rate)
+    connections_limit = max(concurrency, 1) * max(sub_comment_concurrency, 1)
+    limits = httpx.Limits(max_connections=connections_limit, max_keepalive_connections=connections_limit)
+    async with httpx.AsyncClient(verify=False, limits=limits) as client:
+        async def crawl_one(video):
+            photo_id, video_author_id, video_author_name, *rest = video
+            pcursor = rest[0] if rest else ""
+            refresh = rest[1] if len(rest) > 1 else None
+            print(f"\n正在处理视频 ID: {photo_id} (作者: {video_author_name} / {video_author_id})"
+                  + (f"，从 pcursor={pcursor} 继续" if pcursor else "")
+                  + ("，增量刷新" if refresh else ""))
+            await fetch_video_comments(photo_id, collection, video_author_id, video_author_name, pcursor,
+                                       client=client, limiter=limiter, incremental=bool(refresh),
+                                       since=refresh if isinstance(refresh, tuple) else None,
+                                       sub_comment_concurrency=sub_comment_concurrency)
+
+        await crawl_videos(videos, crawl_one, concurrency, queue_name="快手:comment_videos")
 
-async def main():
+async def main(concurrency: int = COMMENT_CONCURRENCY, rate: float = COMMENT_RATE_LIMIT, seed: bool = False,
+               incremental: bool = False, sub_comment_concurrency: int = SUB_COMMENT_CONCURRENCY):
+    start_metrics_server()
     try:
         collection = init_milvus()
         
-        # 获取已存在的 photo_id 列表
-        existing_photos = set()
-        try:
-            res = collection.query(
-                expr="photo_id != ''",
-                output_fields=["photo_id"]
-            )
-            existing_photos = set(item['photo_id'] for item in res)
-            print(f"数据库中已存在 {len(existing_photos)} 个视频的评论")
-        except Exception as e:
-            print(f"查询现有数据时出错: {str(e)}")
+        if seed:
+            # 一次性迁移：把库中已有评论的视频记为已完成
+            try:
+                print(f"从 Milvus 登记了 {seed_from_collection(MANIFEST, '快手', collection)} 个已完成视频")
+            except Exception as e:
+                print(f"从 Milvus 登记已有视频时出错: {str(e)}")
+        
+        # 读取各视频的抓取进度
+        states = MANIFEST.states("快手")
+        print(f"清单中已登记 {len(states)} 个视频: {MANIFEST.counts('快手')}")
         
         # 从文件中读取数据
+        videos = []
+        queued = set()
         comment_file_path = "e:\\TikHub-API-Demo-main\\快手作品评论.txt"
         with open(comment_file_path, 'r', encoding='utf-8') as f:
             for line in f:
@@ -211,25 +392,39 @@ async def main():
                 parts = line.split()
                 if len(parts) >= 3:
                     photo_id = parts[0]
-                    video_author_id = parts[1]
-                    video_author_name = parts[2]
                     
-                    # 检查是否已存在
-                    if photo_id in existing_photos:
-                        print(f"\n视频 {photo_id} 的评论已存在，跳过")
+                    # 已完成的视频跳过 (增量模式下从头刷新到已知评论为止)，
+                    # 抓到一半的从记录的游标继续 (文件中重复的视频只抓一次)
+                    state = states.get(photo_id)
+                    if photo_id in queued:
                         continue
-                    
-                    print(f"\n正在处理新视频 ID: {photo_id}")
-                    print(f"视频作者 ID: {video_author_id}")
-                    print(f"视频作者昵称: {video_author_name}")
-                    
-                    await fetch_video_comments(photo_id, collection, video_author_id, video_author_name)
-                    # 添加到已处理集合
-                    existing_photos.add(photo_id)
+                    if state and state.status == COMPLETE:
+                        if not incremental:
+                            continue
+                        queued.add(photo_id)
+                        videos.append((photo_id, parts[1], parts[2], "", state.newest or True))
+                        continue
+                    queued.add(photo_id)
+                    videos.append((photo_id, parts[1], parts[2], state.cursor if state else ""))
                 else:
                     print(f"行格式错误，跳过: {line}")
+        
+        MANIFEST.register("快手", queued)
+        print(f"\n待抓取 {len(videos)} 个视频 (其中 {sum(1 for v in videos if v[3])} 个续抓，{sum(1 for v in videos if len(v) > 4)} 个增量刷新)，并发数 {concurrency}，限速 {rate} 次/秒")
+        await crawl_comment_videos(collection, videos, concurrency, rate, sub_comment_concurrency)
     finally:
         connections.disconnect("default")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="快手视频评论采集")
+    parser.add_argument("--seed-from-milvus", action="store_true",
+                        help="把 Milvus 中已有评论的视频登记为已完成 (从旧版本升级时运行一次)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量刷新已完成的视频：只抓取上次之后的新评论，按 comment_id 覆盖写入")
+    parser.add_argument("--sub-comment-concurrency", type=int, default=SUB_COMMENT_CONCURRENCY,
+                        help="每个视频同时展开的回复楼层数，0 表示只保存内嵌回复 (默认读取 KUAISHOU_SUB_COMMENT_CONCURRENCY，为 4)")
+    add_scheduler_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    enable_from_args(args)
+    asyncio.run(main(args.concurrency, args.rate, args.seed_from_milvus, args.incremental, args.sub_comment_concurrency))
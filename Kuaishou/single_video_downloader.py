@@ -1,9 +1,18 @@
 import os
+import sys
 import asyncio
 import httpx
 import aiofiles
 from dotenv import load_dotenv
 
+# 将仓库根目录加入模块搜索路径 | Add repository root to module search path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from response_cache import RESPONSE_CACHE, VIDEO_DETAIL_TTL, cache_key
+from singleflight import INFLIGHT
+from metrics import start_metrics_server, timed_request
+from video_download import Urls
+from download_manifest import DownloadManifest
+
 # 加载 .env 文件 | Load .env file
 load_dotenv()
 
@@ -20,27 +29,29 @@ if not api_key or api_key == "your_private_api_key":
 
     asyncio.run(create_default_env_file())
 
+# TikHub API 地址，可指向其他服务 (如本地模拟服务器) | TikHub API base URL, can point to another server (e.g. the local mock server)
+TIKHUB_API_BASE = os.getenv("TIKHUB_API_BASE", "https://api.tikhub.io")
+
+
+# 下载清单：记录每个作品的地址、大小、哈希和状态 | Download manifest: URL, size, hash and status of every item
+MANIFEST = DownloadManifest()
+
 
 # 下载视频函数 | Download video function
-async def download_file(video_info: dict, play_addr: str, output_dir: str = "downloads"):
+async def download_file(video_info: dict, play_addr: Urls, output_dir: str = "downloads"):
     os.makedirs(output_dir, exist_ok=True)
     # $.data[0].photoId
     file_name = os.path.join(output_dir, f"{video_info['data'][0]['photoId']}.mp4")
 
-    # 请求文件并下载 | Request file and download
-    async with httpx.AsyncClient() as http_client:
-        try:
-            response = await http_client.get(play_addr)
-            response.raise_for_status()  # 检查响应状态 | Check response status
-        except httpx.HTTPStatusError as exc:
-            print(f"Error downloading video: {exc.response.status_code}")
-            return None
-
-    # 保存文件 | Save file
-    async with aiofiles.open(file_name, "wb") as file:
-        await file.write(response.content)
+    # 清单中已下载完成且大小一致的文件直接返回 | Files already complete in the manifest with the recorded size are returned as is
+    if MANIFEST.is_complete("kuaishou", file_name):
+        print(f"Already downloaded: {file_name}")
+        return file_name
 
-    return file_name
+    # 大文件按 Range 分段并发下载并可续传，否则分块流式下载；完成后才重命名为 .mp4
+    # Large files are fetched as concurrent resumable Range segments, others streamed in chunks; renamed to .mp4 only when complete
+    async with httpx.AsyncClient() as http_client:
+        return await MANIFEST.download(http_client, play_addr, file_name, "kuaishou")
 
 
 # 获取视频信息 | Get video info
@@ -53,12 +64,24 @@ async def get_video_info(video_url: str):
     }
     try:
         async with httpx.AsyncClient(timeout=30) as http_client:
-            url = f"https://api.tikhub.io/api/v1/kuaishou/web/fetch_one_video?share_text={video_url}"
-            response = await http_client.get(url, headers=headers)
-            response.raise_for_status()
-            video_info = response.json()
-        # $.data[0].mainMvUrls[0].url
-        play_addr = video_info["data"][0]["mainMvUrls"][0]["url"]
+            url = f"{TIKHUB_API_BASE}/api/v1/kuaishou/web/fetch_one_video?share_text={video_url}"
+
+            async def request_video_info():
+                response = await http_client.get(url, headers=headers)
+                response.raise_for_status()
+                return response.json()
+
+            # 命中磁盘缓存时不再消耗 API 额度 | Served from the on-disk cache when available
+            # 同一分享链接的并发请求共享一次调用 | Concurrent lookups of the same share URL share one call
+            video_info = await INFLIGHT.do(
+                cache_key("kuaishou/web/fetch_one_video", {"share_text": video_url}),
+                lambda: RESPONSE_CACHE.fetch(
+                    "kuaishou/web/fetch_one_video", {"share_text": video_url},
+                    timed_request("kuaishou:fetch_one_video", request_video_info), ttl=VIDEO_DETAIL_TTL,
+                ),
+            )
+        # $.data[0].mainMvUrls[*].url，各 CDN 镜像都交给下载器对冲 | Every CDN mirror is hedged by the downloader
+        play_addr = [entry["url"] for entry in video_info["data"][0]["mainMvUrls"] if entry.get("url")]
         return video_info, play_addr
     except KeyError as e:
         print(f"Error retrieving video info: {e}")
@@ -66,6 +89,8 @@ async def get_video_info(video_url: str):
 
 
 async def main(video_url: str):
+    # 设置 METRICS_PORT 时提供 /metrics 端点 | Serve /metrics when METRICS_PORT is set
+    start_metrics_server()
     video_info, play_addr = await get_video_info(video_url)
     if not play_addr:
         return
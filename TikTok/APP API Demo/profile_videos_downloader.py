@@ -1,11 +1,20 @@
 import os
+import sys
 import asyncio
 import httpx
-import aiofiles
 
 from tikhub import Client
 from dotenv import load_dotenv
 
+# 将仓库根目录加入模块搜索路径 | Add repository root to module search path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from response_cache import RESPONSE_CACHE, VIDEO_DETAIL_TTL
+from metrics import start_metrics_server, timed_request
+from video_download import DOWNLOAD_CONCURRENCY, DownloadPool, Urls, download_client
+from download_manifest import DownloadManifest
+from profile_sync import ProfileSync, state_path
+from video_variants import TIKTOK_DEFAULT_KEYS, VIDEO_VARIANT_POLICY, bytes_saved, choose_play_address
+
 # 加载 .env 文件 | Load .env file
 load_dotenv()
 
@@ -18,74 +27,136 @@ if api_key is None or api_key == "your_private_api_key":
         file.write("API_KEY=your_private_api_key")
     raise ValueError("API_KEY is not set in .env file")
 
-# 初始化 TikHub 客户端 | Initialize TikHub client
-client = Client(api_key=api_key)
+# 初始化 TikHub 客户端，可通过 TIKHUB_API_BASE 指向其他服务 (如本地模拟服务器)
+# Initialize TikHub client; TIKHUB_API_BASE can point it at another server (e.g. the local mock server)
+api_base = os.getenv("TIKHUB_API_BASE")
+client = Client(api_key=api_key, base_url=api_base) if api_base else Client(api_key=api_key)
+
+
+# 下载清单：记录每个作品的地址、大小、哈希和状态，重启后跳过已完成的 | Download manifest: URL, size, hash and status of every item; restarts skip completed items
+MANIFEST = DownloadManifest()
 
 
 # 下载视频函数 | Download video function
-async def download_file(aweme_id: str, play_addr: str, output_dir: str = "downloads"):
+async def download_file(aweme_id: str, play_addr: Urls, output_dir: str = "downloads",
+                        http_client: httpx.AsyncClient = None):
     # 创建下载目录 | Create download directory
     os.makedirs(output_dir, exist_ok=True)
-    # 请求文件 | Request file
+    # 文件名 | File name
+    # $.data.aweme_detail.aweme_id
+    file_name = os.path.join(output_dir, aweme_id + ".mp4")
+    # 大文件按 Range 分段并发下载并可续传，否则分块流式下载；完成后才重命名为 .mp4
+    # Large files are fetched as concurrent resumable Range segments, others streamed in chunks; renamed to .mp4 only when complete
+    if http_client is not None:
+        return await MANIFEST.download(http_client, play_addr, file_name, "tiktok")
     async with httpx.AsyncClient() as http_client:
-        response = await http_client.get(play_addr)
-        # 文件名 | File name
-        # $.data.aweme_detail.aweme_id
-        file_name = os.path.join(output_dir, aweme_id + ".mp4")
-        # 写入文件 | Write file
-        async with aiofiles.open(file_name, "wb") as file:
-            await file.write(response.content)
-        return file_name
+        return await MANIFEST.download(http_client, play_addr, file_name, "tiktok")
 
 
-# 获取主页视频信息 | Get profile videos info
-async def get_profile_videos_info(profile_url: str):
-    sec_user_id_data = await client.TikTokWeb.get_sec_user_id(profile_url)
+# 逐页获取主页视频信息 | Yield profile videos page by page
+async def iter_profile_videos(profile_url: str):
+    sec_user_id_data = await RESPONSE_CACHE.fetch(
+        "tiktok/web/get_sec_user_id",
+        {"url": profile_url},
+        lambda: client.TikTokWeb.get_sec_user_id(profile_url),
+    )
     sec_user_id = sec_user_id_data["data"]
 
     async def fetch_videos(max_cursor: int):
         print(f"Fetching videos with max_cursor: {max_cursor}")
         # 执行API请求 | Perform API request
-        response = await client.TikTokAppV3.fetch_user_post_videos(sec_user_id, max_cursor=max_cursor, count=20)
+        response = await RESPONSE_CACHE.fetch(
+            "tiktok/app/v3/fetch_user_post_videos",
+            {"sec_user_id": sec_user_id, "max_cursor": max_cursor, "count": 20},
+            timed_request(
+                "tiktok:fetch_user_post_videos",
+                lambda: client.TikTokAppV3.fetch_user_post_videos(sec_user_id, max_cursor=max_cursor, count=20),
+            ),
+            ttl=VIDEO_DETAIL_TTL,
+        )
         # 提取并返回需要的信息 | Extract and return the required information
         return response["data"]["aweme_list"], response["data"]["has_more"], response["data"]["max_cursor"]
 
-    # 创建一个空列表来存储所有视频信息 | Create an empty list to store all videos info
-    all_videos_info = []
+    fetched = 0
     has_more = True
     max_cursor = 0
 
-    # 循环获取视频信息直到没有更多 | Loop to get video info until there are no more
+    # 循环获取视频信息直到没有更多，每页取到后立即交出 | Loop until there are no more, yielding each page as soon as it arrives
     while has_more:
         videos_info, has_more, max_cursor = await fetch_videos(max_cursor)
-        all_videos_info.extend(videos_info)
-        print(f"Total videos fetched: {len(all_videos_info)}")
-
-    return all_videos_info
+        fetched += len(videos_info)
+        print(f"Total videos fetched: {fetched}")
+        for video_info in videos_info:
+            yield video_info
 
 
-if __name__ == "__main__":
-    # 主页链接 | Profile URL
-    profile_url = "https://www.tiktok.com/@taylorswift"
-    # sec_user_id = "MS4wLjABAAAAqB08cUbXaDWqbD6MCga2RbGTuhfO2EsHayBYx08NDrN7IE3jQuRDNNN6YwyfH6_6"
+# 获取主页视频信息 | Get profile videos info
+async def get_profile_videos_info(profile_url: str):
+    return [video_info async for video_info in iter_profile_videos(profile_url)]
 
-    # 获取所有视频信息 | Get all videos info
-    all_videos_info = asyncio.run(get_profile_videos_info(profile_url))
-    # print(all_videos_info)
 
-    # 下载所有视频 | Download all videos
-    for video_info in all_videos_info:
+# 主页视频的下载任务 | Download jobs for a profile's videos
+async def iter_profile_jobs(profile_url: str, output_dir: str = "downloads", sync: ProfileSync = None):
+    videos = iter_profile_videos(profile_url)
+    if sync is not None:
+        # 只取上次同步之后的新作品，遇到已同步的作品即停止翻页 | Only posts newer than the last sync; stop paging at known posts
+        videos = sync.new_videos(videos)
+    async for video_info in videos:
         # 从响应中获取视频链接 | Get video URL from response
         aweme_id = video_info["aweme_id"]
         try:
-            # $.video.play_addr_h264.url_list.[0]
-            play_addr = video_info["video"]["play_addr_h264"]["url_list"][0]
+            # 按 VIDEO_VARIANT_POLICY 在 play_addr_h264 与 bit_rate 各版本中选择 (默认沿用 play_addr_h264)
+            # Pick among play_addr_h264 and the bit_rate variants per VIDEO_VARIANT_POLICY (play_addr_h264 by default)
+            # url_list 中的全部 CDN 镜像都交给下载器对冲 | All CDN mirrors in url_list are hedged by the downloader
+            variant = choose_play_address(video_info["video"], "tiktok", TIKTOK_DEFAULT_KEYS)
         except Exception as e:
             # 如果报错大概是因为作品不是视频而是图集，或视频已被删除
             # If error, probably because the work is not a video but a set of pictures, or the video has been deleted
             print(f"Error retrieving video info: {e}")
             print(f"Skipping video: {aweme_id}")
             continue
-        # 下载视频 | Download video
-        file_name = asyncio.run(download_file(aweme_id, play_addr))
-        print(f"Video downloaded: {file_name}")
+        file_name = os.path.join(output_dir, aweme_id + ".mp4")
+        # 跳过已下载且大小一致的文件 | Skip files already downloaded with the recorded size
+        if sync is not None and sync.is_downloaded(file_name):
+            continue
+        # 接口给出的文件大小记入清单作为预期大小 | The size reported by the API is recorded as the expected size
+        yield variant.url_list, file_name, "tiktok", variant.data_size
+
+
+# 并发下载主页全部视频 | Download all videos of a profile concurrently
+async def download_profile(profile_url: str, output_dir: str = "downloads", concurrency: int = DOWNLOAD_CONCURRENCY,
+                           sync: bool = False):
+    # 翻页与下载重叠：第一页取到后就开始下载，队列有上限，内存不随作品数增长
+    # Pagination overlaps downloading: downloads start after the first page, and the bounded queue keeps memory flat
+    # 一个事件循环、一个连接池，限制总并发和每个 CDN 主机的并发
+    # One event loop and one connection pool, bounded overall and per CDN host
+    os.makedirs(output_dir, exist_ok=True)
+    # 增量同步：按主页状态文件只下载新作品，已有文件大小一致时跳过
+    # Incremental sync: the per-profile state file limits downloads to new posts, existing files of the right size are skipped
+    state = ProfileSync(state_path(output_dir, "tiktok", profile_url)) if sync else None
+    async with download_client(concurrency) as http_client:
+        pool = DownloadPool(http_client, "tiktok", concurrency, skip_existing=sync,
+                            on_complete=state.mark_downloaded if state is not None else None, manifest=MANIFEST)
+        complete = False
+        try:
+            downloaded = await pool.stream(iter_profile_jobs(profile_url, output_dir, state))
+            complete = pool.failed == 0
+        finally:
+            if state is not None:
+                state.finish(complete)
+    print(pool.summary())
+    print(f"Variant selection ({VIDEO_VARIANT_POLICY}) saved {bytes_saved('tiktok') / 1024 / 1024:.1f} MB")
+    if state is not None:
+        print(f"Sync: {state.new_posts} new posts" + (", stopped at already synced posts" if state.reached_known else ""))
+    return downloaded
+
+
+if __name__ == "__main__":
+    # 设置 METRICS_PORT 时提供 /metrics 端点 | Serve /metrics when METRICS_PORT is set
+    start_metrics_server()
+    # 主页链接 | Profile URL
+    profile_url = "https://www.tiktok.com/@taylorswift"
+    # sec_user_id = "MS4wLjABAAAAqB08cUbXaDWqbD6MCga2RbGTuhfO2EsHayBYx08NDrN7IE3jQuRDNNN6YwyfH6_6"
+
+    # 增量同步主页视频，再次运行只下载新作品 | Sync profile videos; re-runs only download new posts
+    asyncio.run(download_profile(profile_url, sync=True))
@@ -1,10 +1,20 @@
 import os
+import sys
 import asyncio
 import httpx
 import aiofiles
 from tikhub import Client
 from dotenv import load_dotenv
 
+# 将仓库根目录加入模块搜索路径 | Add repository root to module search path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from response_cache import RESPONSE_CACHE, VIDEO_DETAIL_TTL, cache_key
+from singleflight import INFLIGHT
+from metrics import start_metrics_server, timed_request
+from video_download import Urls
+from download_manifest import DownloadManifest
+from video_variants import TIKTOK_DEFAULT_KEYS, choose_play_address
+
 # 加载 .env 文件 | Load .env file
 load_dotenv()
 
@@ -21,45 +31,62 @@ if not api_key or api_key == "your_private_api_key":
 
     asyncio.run(create_default_env_file())
 
-# 初始化 TikHub 客户端 | Initialize TikHub client
-client = Client(api_key=api_key)
+# 初始化 TikHub 客户端，可通过 TIKHUB_API_BASE 指向其他服务 (如本地模拟服务器)
+# Initialize TikHub client; TIKHUB_API_BASE can point it at another server (e.g. the local mock server)
+api_base = os.getenv("TIKHUB_API_BASE")
+client = Client(api_key=api_key, base_url=api_base) if api_base else Client(api_key=api_key)
+
+
+# 下载清单：记录每个作品的地址、大小、哈希和状态 | Download manifest: URL, size, hash and status of every item
+MANIFEST = DownloadManifest()
 
 
 # 下载视频函数 | Download video function
-async def download_file(video_info: dict, play_addr: str, output_dir: str = "downloads"):
+async def download_file(video_info: dict, play_addr: Urls, output_dir: str = "downloads"):
     os.makedirs(output_dir, exist_ok=True)  # 同步操作，因为是轻量任务 | Synchronous because it's lightweight
     # $.data.aweme_details.[0].aweme_id
     file_name = os.path.join(output_dir, f"{video_info['data']['aweme_details'][0]['aweme_id']}.mp4")
 
-    # 请求文件并下载 | Request file and download
-    async with httpx.AsyncClient() as http_client:
-        try:
-            response = await http_client.get(play_addr)
-            response.raise_for_status()  # 检查响应状态 | Check response status
-        except httpx.HTTPStatusError as exc:
-            print(f"Error downloading video: {exc.response.status_code}")
-            return None
-
-    # 保存文件 | Save file
-    async with aiofiles.open(file_name, "wb") as file:
-        await file.write(response.content)
+    # 清单中已下载完成且大小一致的文件直接返回 | Files already complete in the manifest with the recorded size are returned as is
+    if MANIFEST.is_complete("tiktok", file_name):
+        print(f"Already downloaded: {file_name}")
+        return file_name
 
-    return file_name
+    # 大文件按 Range 分段并发下载并可续传，否则分块流式下载；完成后才重命名为 .mp4
+    # Large files are fetched as concurrent resumable Range segments, others streamed in chunks; renamed to .mp4 only when complete
+    async with httpx.AsyncClient() as http_client:
+        return await MANIFEST.download(http_client, play_addr, file_name, "tiktok")
 
 
 # 获取视频信息 | Get video info
 async def get_video_info(video_url: str):
     try:
-        video_info = await client.TikTokAppV3.fetch_one_video_by_share_url(video_url)
-        # $.data.aweme_details.[0].video.play_addr_h264.url_list.[0]
-        play_addr = video_info["data"]["aweme_details"][0]["video"]["play_addr_h264"]["url_list"][0]
-        return video_info, play_addr
-    except KeyError as e:
+        # 命中磁盘缓存时不再消耗 API 额度 | Served from the on-disk cache when available
+        # 同一分享链接的并发请求共享一次调用 | Concurrent lookups of the same share URL share one call
+        endpoint = "tiktok/app/v3/fetch_one_video_by_share_url"
+        video_info = await INFLIGHT.do(
+            cache_key(endpoint, {"share_url": video_url}),
+            lambda: RESPONSE_CACHE.fetch(
+                endpoint,
+                {"share_url": video_url},
+                timed_request("tiktok:fetch_one_video_by_share_url", lambda: client.TikTokAppV3.fetch_one_video_by_share_url(video_url)),
+                ttl=VIDEO_DETAIL_TTL,
+            ),
+        )
+        # 按 VIDEO_VARIANT_POLICY 在 play_addr_h264 与 bit_rate 各版本中选择 (默认沿用 play_addr_h264)
+        # Pick among play_addr_h264 and the bit_rate variants per VIDEO_VARIANT_POLICY (play_addr_h264 by default)
+        variant = choose_play_address(video_info["data"]["aweme_details"][0]["video"], "tiktok", TIKTOK_DEFAULT_KEYS)
+        print(f"Selected variant: {variant.describe()}")
+        # url_list 中的全部 CDN 镜像都交给下载器对冲 | All CDN mirrors in url_list are hedged by the downloader
+        return video_info, variant.url_list
+    except (KeyError, IndexError, ValueError) as e:
         print(f"Error retrieving video info: {e}")
         return None, None
 
 
 async def main(video_url: str):
+    # 设置 METRICS_PORT 时提供 /metrics 端点 | Serve /metrics when METRICS_PORT is set
+    start_metrics_server()
     video_info, play_addr = await get_video_info(video_url)
     if not play_addr:
         return
@@ -0,0 +1,339 @@
+"""
+批量下载分享链接：从文件读取抖音 / TikTok / 快手混合的分享链接 (或含链接的分享文案，每行一条)，
+按域名识别平台，并发解析出作品 ID 和播放地址，全部送入同一个下载池，每条链接的结果写入清单 CSV。
+
+    python batch_share_downloader.py links.txt
+    python batch_share_downloader.py links.txt --output downloads --manifest batch_manifest.csv --resolve-concurrency 16
+
+视频保存为 <output>/<平台>/<作品 ID>.mp4。分享链接到作品 ID 的映射保存在 SHARE_ID_CACHE_FILE
+(默认 share_id_cache.json)，再次运行时文件已存在的链接不再请求 API；视频详情仍经过 RESPONSE_CACHE。
+下载结果同时记入共用的 SQLite 下载清单 (download_manifest.py)，包括大小和 SHA-256。
+
+清单列: share_url, platform, item_id, status, size, resolve_seconds, download_seconds, file, error
+status: downloaded / exists / duplicate / unsupported / resolve_failed / no_video / download_failed
+"""
+import os
+import re
+import csv
+import json
+import time
+import asyncio
+import argparse
+import urllib.parse
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from resilience import Resilience, FetchError
+from response_cache import RESPONSE_CACHE, VIDEO_DETAIL_TTL, CacheMiss, cache_key
+from singleflight import INFLIGHT
+from comment_scheduler import RateLimiter
+from metrics import start_metrics_server, timed_request
+from video_download import DOWNLOAD_CONCURRENCY, DownloadPool, download_client
+from download_manifest import DownloadManifest
+from video_variants import DOUYIN_DEFAULT_KEYS, TIKTOK_DEFAULT_KEYS, choose_play_address
+
+load_dotenv()
+API_KEY = os.getenv("API_KEY")
+TIKHUB_API_BASE = os.getenv("TIKHUB_API_BASE", "https://api.tikhub.io")
+SHARE_ID_CACHE_FILE = os.getenv("SHARE_ID_CACHE_FILE", "share_id_cache.json")
+RESOLVE_CONCURRENCY = int(os.getenv("RESOLVE_CONCURRENCY", "8"))
+
+HEADERS = {
+    "Authorization": f"Bearer {API_KEY}",
+    "Referer": "https://github.com/TikHub/TikHub-API-Demo",
+    "User-Agent": "TikHub-Demo"
+}
+
+URL_PATTERN = re.compile(r"https?://[^\s\"'<>，。]+")
+
+# 域名 (含子域名) -> 平台
+PLATFORM_DOMAINS = {
+    "douyin.com": "douyin",
+    "iesdouyin.com": "douyin",
+    "tiktok.com": "tiktok",
+    "kuaishou.com": "kuaishou",
+    "chenzhongtech.com": "kuaishou",
+    "gifshow.com": "kuaishou",
+}
+
+MANIFEST_FIELDS = ["share_url", "platform", "item_id", "status", "size", "resolve_seconds", "download_seconds",
+                   "file", "error"]
+
+RESILIENCE = Resilience()
+
+
+def extract_url(line: str) -> Optional[str]:
+    """分享文案中的第一个链接"""
+    match = URL_PATTERN.search(line)
+    return match.group(0) if match else None
+
+
+def detect_platform(url: str) -> Optional[str]:
+    host = (urllib.parse.urlsplit(url).hostname or "").lower()
+    for domain, platform in PLATFORM_DOMAINS.items():
+        if host == domain or host.endswith("." + domain):
+            return platform
+    return None
+
+
+def _douyin_video(data: Dict):
+    detail = data["data"]["aweme_detail"]
+    variant = choose_play_address(detail["video"], "douyin", DOUYIN_DEFAULT_KEYS)
+    return detail["aweme_id"], variant.url_list, variant.data_size
+
+
+def _tiktok_video(data: Dict):
+    detail = data["data"]["aweme_details"][0]
+    variant = choose_play_address(detail["video"], "tiktok", TIKTOK_DEFAULT_KEYS)
+    return detail["aweme_id"], variant.url_list, variant.data_size
+
+
+def _kuaishou_video(data: Dict):
+    item = data["data"][0]
+    return item["photoId"], [entry["url"] for entry in item.get("mainMvUrls") or [] if entry.get("url")], 0
+
+
+# 平台 -> (接口, 分享链接参数名, 从响应中取 (作品 ID, 播放地址镜像列表, 预期大小))，与各单视频下载器使用相同的接口和缓存键
+RESOLVERS = {
+    "douyin": ("douyin/app/v3/fetch_one_video_by_share_url", "share_url", _douyin_video),
+    "tiktok": ("tiktok/app/v3/fetch_one_video_by_share_url", "share_url", _tiktok_video),
+    "kuaishou": ("kuaishou/web/fetch_one_video", "share_text", _kuaishou_video),
+}
+
+
+class ShareJob:
+    """一条分享链接的处理状态，对应清单中的一行"""
+
+    def __init__(self, share_url: str, platform: Optional[str]):
+        self.share_url = share_url
+        self.platform = platform or ""
+        self.item_id = ""
+        self.urls: List[str] = []
+        self.expected_size = 0
+        self.file_name = ""
+        self.status = ""
+        self.size = 0
+        self.resolve_seconds = 0.0
+        self.download_seconds = 0.0
+        self.error = ""
+
+    def row(self) -> list:
+        return [self.share_url, self.platform, self.item_id, self.status, self.size,
+                round(self.resolve_seconds, 3), round(self.download_seconds, 3), self.file_name, self.error]
+
+
+class ShareIdCache:
+    """分享链接 -> 作品 ID，短链接对应的作品不会变，可以长期保存"""
+
+    def __init__(self, path: str = SHARE_ID_CACHE_FILE):
+        self.path = path
+        self.ids: Dict[str, str] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.ids = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, share_url: str) -> Optional[str]:
+        return self.ids.get(share_url)
+
+    def put(self, share_url: str, item_id: str):
+        self.ids[share_url] = item_id
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.ids, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+def read_share_urls(lines: Iterable[str]) -> Iterable[ShareJob]:
+    """逐行读取，跳过空行和 # 注释；行中没有链接时整行作为链接 (识别不出平台)"""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        share_url = extract_url(line) or line
+        yield ShareJob(share_url, detect_platform(share_url))
+
+
+async def fetch_video_detail(api_client: httpx.AsyncClient, platform: str, share_url: str) -> Dict:
+    endpoint, param, _ = RESOLVERS[platform]
+    params = {param: share_url}
+
+    async def request():
+        response = await api_client.get(f"{TIKHUB_API_BASE}/api/v1/{endpoint}", headers=HEADERS, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    # 命中磁盘缓存时不再消耗 API 额度，同一链接的并发请求共享一次调用
+    return await INFLIGHT.do(
+        cache_key(endpoint, params),
+        lambda: RESPONSE_CACHE.fetch(
+            endpoint, params,
+            lambda: RESILIENCE.call(f"{platform}:fetch_one_video", timed_request(f"{platform}:fetch_one_video", request)),
+            ttl=VIDEO_DETAIL_TTL,
+        ),
+    )
+
+
+class ShareResolver:
+    """解析分享链接：识别平台、查作品 ID 缓存、请求视频详情并选择播放地址"""
+
+    def __init__(self, api_client: httpx.AsyncClient, output_dir: str, id_cache: ShareIdCache,
+                 limiter: Optional[RateLimiter] = None):
+        self.api_client = api_client
+        self.output_dir = output_dir
+        self.id_cache = id_cache
+        self.limiter = limiter
+
+    def file_name(self, job: ShareJob) -> str:
+        return os.path.join(self.output_dir, job.platform, job.item_id + ".mp4")
+
+    async def resolve(self, job: ShareJob):
+        """填充 job 的 item_id / urls / file_name；无需下载时设置 status"""
+        if not job.platform:
+            job.status, job.error = "unsupported", "unknown platform"
+            return
+        # 已知作品 ID 且文件已存在时不请求 API (下载完成才会重命名为 .mp4，存在即完整)
+        job.item_id = self.id_cache.get(job.share_url) or ""
+        if job.item_id and os.path.exists(self.file_name(job)):
+            job.file_name, job.status = self.file_name(job), "exists"
+            job.size = os.path.getsize(job.file_name)
+            return
+        start = time.perf_counter()
+        try:
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            data = await fetch_video_detail(self.api_client, job.platform, job.share_url)
+            job.item_id, job.urls, job.expected_size = RESOLVERS[job.platform][2](data)
+        except (FetchError, CacheMiss) as e:
+            job.status, job.error = "resolve_failed", str(e)[:200]
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            # 图集、已删除的作品或响应中没有视频
+            job.status, job.error = "no_video", f"{type(e).__name__}: {e}"[:200]
+        finally:
+            job.resolve_seconds = time.perf_counter() - start
+        if job.status:
+            return
+        if not job.urls:
+            job.status, job.error = "no_video", "no play address"
+            return
+        self.id_cache.put(job.share_url, job.item_id)
+        job.file_name = self.file_name(job)
+        if os.path.exists(job.file_name):
+            job.status, job.size = "exists", os.path.getsize(job.file_name)
+
+
+async def resolve_all(jobs: Iterable[ShareJob], resolver: ShareResolver, concurrency: int) -> AsyncIterator[ShareJob]:
+    """用 concurrency 个任务并发解析，按完成顺序交出；输出队列有上限，不会一次读入全部链接"""
+    resolved: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    pending = iter(jobs)
+
+    async def worker():
+        # 各任务共用同一个迭代器，取下一条链接时不会让出事件循环
+        for job in pending:
+            await resolver.resolve(job)
+            await resolved.put(job)
+
+    async def run_workers():
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        finally:
+            await resolved.put(None)
+
+    runner = asyncio.ensure_future(run_workers())
+    try:
+        while True:
+            job = await resolved.get()
+            if job is None:
+                break
+            yield job
+    finally:
+        if not runner.done():
+            runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+    # 解析任务本身出错 (不是单条链接失败) 时抛出
+    runner.result()
+
+
+async def download_share_urls(lines: Iterable[str], output_dir: str = "downloads",
+                              manifest_path: str = "batch_manifest.csv",
+                              concurrency: int = DOWNLOAD_CONCURRENCY,
+                              resolve_concurrency: int = RESOLVE_CONCURRENCY, rate: float = 0) -> Dict[str, int]:
+    """解析并下载全部分享链接，写入清单，返回各状态的链接数"""
+    id_cache = ShareIdCache()
+    # 与其他下载器共用的下载清单，记录大小和哈希，可用 download_manifest.py 重试或校验
+    downloads = DownloadManifest()
+    counts: Dict[str, int] = {}
+    # 已入队的文件 -> 分享链接，下载完成时据此写清单；不同链接解析到同一作品时只下载一次
+    queued: Dict[str, ShareJob] = {}
+    finished_files = set()
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(manifest_path, "w", encoding="utf-8-sig", newline="") as manifest:
+        writer = csv.writer(manifest)
+        writer.writerow(MANIFEST_FIELDS)
+
+        def finish(job: ShareJob, status: str):
+            job.status = status
+            writer.writerow(job.row())
+            counts[status] = counts.get(status, 0) + 1
+
+        def on_result(file_name: str, result: Optional[str], seconds: float):
+            job = queued.pop(file_name)
+            finished_files.add(file_name)
+            job.download_seconds = seconds
+            if result:
+                job.size = os.path.getsize(result)
+            finish(job, "downloaded" if result else "download_failed")
+
+        async with httpx.AsyncClient(timeout=30) as api_client, download_client(concurrency) as http_client:
+            resolver = ShareResolver(api_client, output_dir, id_cache, RateLimiter(rate) if rate > 0 else None)
+
+            async def download_jobs():
+                async for job in resolve_all(read_share_urls(lines), resolver, resolve_concurrency):
+                    if job.status:
+                        finish(job, job.status)
+                    elif job.file_name in queued or job.file_name in finished_files:
+                        finish(job, "duplicate")
+                    else:
+                        queued[job.file_name] = job
+                        os.makedirs(os.path.dirname(job.file_name), exist_ok=True)
+                        yield job.urls, job.file_name, job.platform, job.expected_size
+
+            pool = DownloadPool(http_client, "batch", concurrency, on_result=on_result, manifest=downloads)
+            try:
+                await pool.stream(download_jobs())
+            finally:
+                id_cache.save()
+                downloads.close()
+
+    print(pool.summary())
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) + f" -> {manifest_path}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量解析并下载抖音 / TikTok / 快手分享链接")
+    parser.add_argument("input", help="分享链接文件，每行一条链接或分享文案")
+    parser.add_argument("--output", default="downloads", help="下载目录")
+    parser.add_argument("--manifest", default="batch_manifest.csv", help="结果清单 CSV")
+    parser.add_argument("--concurrency", type=int, default=DOWNLOAD_CONCURRENCY, help="同时下载的视频数")
+    parser.add_argument("--resolve-concurrency", type=int, default=RESOLVE_CONCURRENCY, help="同时解析的链接数")
+    parser.add_argument("--rate", type=float, default=0, help="解析请求速率上限 (次/秒)，0 表示不限速")
+    args = parser.parse_args()
+
+    if not API_KEY or API_KEY == "your_private_api_key":
+        raise ValueError("API_KEY is not set in .env file")
+    # 设置 METRICS_PORT 时提供 /metrics 端点
+    start_metrics_server()
+    with open(args.input, "r", encoding="utf-8") as f:
+        asyncio.run(download_share_urls(f, args.output, args.manifest, args.concurrency,
+                                        args.resolve_concurrency, args.rate))
+
+
+if __name__ == "__main__":
+    main()
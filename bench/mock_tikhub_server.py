@@ -0,0 +1,605 @@
+"""
+本地 TikHub 模拟服务器，用于离线基准测试，不消耗 API 额度。
+
+回放 bench/fixtures 下录制的接口响应 (搜索、评论、视频详情、主页作品列表)，
+按请求的游标生成不同 ID 的分页数据，并支持配置延迟、错误率和分页深度。
+同时在 /mock/video/<name>.mp4 提供确定性内容的视频文件供下载器使用，支持 Range 请求，
+可按比例在传输中途断开连接以测试分段下载的重试和续传。
+
+--mirrors N 时另起 N-1 个端口作为 CDN 镜像，响应中的 url_list / mainMvUrls 展开为全部镜像的地址；
+--slow-mirrors K 让前 K 个镜像延迟 --mirror-delay 秒才响应，--mirror-stall-rate 让除最后一个
+以外的镜像按比例在传输中途卡住 (保持连接但不再发送数据)，用于测试多镜像对冲和卡顿切换。
+
+单独运行:
+    python bench/mock_tikhub_server.py --port 8765 --latency 0.05 --depth 5
+"""
+import os
+import copy
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def stable_id(*parts) -> int:
+    """由字符串参数得到稳定的 60 位整数 ID，保证重复运行时数据一致"""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return int(digest[:15], 16)
+
+
+class MockConfig:
+    """模拟服务器参数"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 depth: int = 3, page_size: int = 20, video_size: int = 2 * 1024 * 1024,
+                 sub_comments: int = 3, new_comments: int = 0, range_support: bool = True, video_cut_rate: float = 0.0,
+                 mirrors: int = 1, slow_mirrors: int = 0, mirror_delay: float = 2.0, mirror_stall_rate: float = 0.0,
+                 fixtures_dir: str = FIXTURES_DIR, seed: int = 42):
+        self.latency = latency          # 每个 API 请求的基础延迟 (秒)
+        self.jitter = jitter            # 额外的随机延迟上限 (秒)
+        self.error_rate = error_rate    # 随机返回 500/429 的概率
+        self.depth = depth              # 每个关键词/视频/主页的分页数
+        self.page_size = page_size      # 每页条目数
+        self.video_size = video_size    # 模拟视频文件大小 (字节)
+        self.sub_comments = sub_comments  # 快手每条主评论的回复数 (主评论页只内嵌第一条)
+        self.new_comments = new_comments  # 排在原有评论之前的新评论数，模拟两次抓取之间新增的评论
+        self.range_support = range_support  # 视频是否支持 Range 请求
+        self.video_cut_rate = video_cut_rate  # 视频传输到一半时断开连接的概率
+        self.mirrors = max(mirrors, 1)  # 视频镜像数 (含主服务器)
+        self.slow_mirrors = slow_mirrors  # 前几个镜像响应慢
+        self.mirror_delay = mirror_delay  # 慢镜像的首字节延迟 (秒)
+        self.mirror_stall_rate = mirror_stall_rate  # 除最后一个外的镜像传输到一半卡住的概率
+        self.fixtures_dir = fixtures_dir
+        self.seed = seed
+
+
+class MockStats:
+    """线程安全的请求计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self.api_pages = 0
+        self.video_requests = 0
+        self.video_bytes = 0
+
+    def record(self, route: str, error: bool = False, video_bytes: int = 0):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            if error:
+                self.errors += 1
+            elif route.startswith("/mock/video"):
+                self.video_requests += 1
+                self.video_bytes += video_bytes
+            else:
+                self.api_pages += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "errors": self.errors,
+                "api_pages": self.api_pages,
+                "video_requests": self.video_requests,
+                "video_bytes": self.video_bytes,
+            }
+
+
+class MockTikHub:
+    """按路由生成分页响应"""
+
+    def __init__(self, config: MockConfig, base_url: str = ""):
+        self.config = config
+        self.base_url = base_url
+        # 各镜像的地址，第一个是主服务器
+        self.mirror_urls = [base_url]
+        self.fixtures: Dict[str, Dict] = {}
+        for name in os.listdir(config.fixtures_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(config.fixtures_dir, name), "r", encoding="utf-8") as f:
+                    self.fixtures[name[:-5]] = json.load(f)
+        self.routes: Dict[str, Callable[[Dict[str, str]], Dict]] = {
+            "/api/v1/douyin/web/fetch_user_search_result": self.douyin_search,
+            "/api/v1/kuaishou/web/fetch_search_user": self.kuaishou_search,
+            "/api/v1/douyin/app/v1/fetch_video_comments": self.douyin_comments,
+            "/api/v1/kuaishou/app/fetch_one_video_comment": self.kuaishou_comments,
+            "/api/v1/kuaishou/app/fetch_one_video_sub_comment": self.kuaishou_sub_comments,
+            "/api/v1/douyin/app/v3/fetch_one_video_by_share_url": self.douyin_video_detail,
+            "/api/v1/tiktok/app/v3/fetch_one_video_by_share_url": self.tiktok_video_detail,
+            "/api/v1/kuaishou/web/fetch_one_video": self.kuaishou_video_detail,
+            "/api/v1/douyin/app/v3/fetch_user_post_videos": self.douyin_user_posts,
+            "/api/v1/tiktok/app/v3/fetch_user_post_videos": self.tiktok_user_posts,
+            "/api/v1/tiktok/web/get_sec_user_id": self.tiktok_sec_user_id,
+            "/api/v1/douyin/app/v3/fetch_video_statistics": self.douyin_statistics,
+        }
+
+    def _fixture(self, name: str, **placeholders) -> Dict:
+        """读取录制的响应并替换其中的 {占位符}"""
+        text = json.dumps(self.fixtures[name], ensure_ascii=False)
+        placeholders.setdefault("video_base", self.base_url)
+        for key, value in placeholders.items():
+            text = text.replace("{" + key + "}", str(value))
+        data = json.loads(text)
+        self._fix_sizes(data)
+        if len(self.mirror_urls) > 1:
+            self._expand_mirrors(data)
+        return data
+
+    def _fix_sizes(self, node):
+        """录制的 data_size 改为实际提供的视频大小，与下载到的文件一致"""
+        if isinstance(node, list):
+            for item in node:
+                self._fix_sizes(item)
+        elif isinstance(node, dict):
+            urls = node.get("url_list")
+            if "data_size" in node and isinstance(urls, list) and any(
+                    isinstance(url, str) and url.startswith(self.base_url + "/mock/video/") for url in urls):
+                node["data_size"] = self.config.video_size
+            for value in node.values():
+                self._fix_sizes(value)
+
+    def _mirrored(self, url: str) -> list:
+        """主服务器上的视频地址在各镜像上的地址"""
+        if not isinstance(url, str) or not url.startswith(self.base_url + "/mock/video/"):
+            return [url]
+        path = url[len(self.base_url):]
+        return [mirror + path for mirror in self.mirror_urls]
+
+    def _expand_mirrors(self, node):
+        """把 url_list 和快手的 mainMvUrls 展开为全部镜像"""
+        if isinstance(node, list):
+            for item in node:
+                self._expand_mirrors(item)
+        elif isinstance(node, dict):
+            for key, value in node.items():
+                if key == "url_list" and isinstance(value, list):
+                    node[key] = [mirror for url in value for mirror in self._mirrored(url)]
+                elif key == "mainMvUrls" and isinstance(value, list):
+                    node[key] = [dict(entry, cdn=urllib.parse.urlsplit(mirror).netloc, url=mirror)
+                                 for entry in value for mirror in self._mirrored(entry.get("url"))]
+                else:
+                    self._expand_mirrors(value)
+
+    def _page_items(self, template: Dict, count: int, rewrite: Callable[[Dict, int], None]):
+        items = []
+        for i in range(count):
+            item = copy.deepcopy(template)
+            rewrite(item, i)
+            items.append(item)
+        return items
+
+    # ---------- 关键词搜索 ----------
+
+    def douyin_search(self, params: Dict[str, str]) -> Dict:
+        page_size = self.config.page_size
+        cursor = int(params.get("cursor") or 0)
+        page = cursor // page_size
+        data = self._fixture("douyin_search")
+        inner = data["data"]["data"]
+        template = inner["user_list"][0]
+        keyword = params.get("keyword", "")
+
+        def rewrite(user, i):
+            uid = stable_id("douyin_user", keyword, page, i)
+            user["user_id"] = str(uid)
+            user["nick_name"] = f"{template['nick_name']}_{keyword}_{page}_{i}"
+            user["fans_cnt"] = uid % 1000000
+
+        count = page_size if page < self.config.depth else 0
+        inner["user_list"] = self._page_items(template, count, rewrite)
+        inner["cursor"] = (page + 1) * page_size
+        inner["has_more"] = 1 if page + 1 < self.config.depth else 0
+        return data
+
+    def kuaishou_search(self, params: Dict[str, str]) -> Dict:
+        page = int(params.get("page") or 1)
+        data = self._fixture("kuaishou_search")
+        template = data["data"]["mixFeeds"][0]
+        keyword = params.get("keyword", "")
+
+        def rewrite(feed, i):
+            uid = stable_id("kuaishou_user", keyword, page, i)
+            feed["user"]["user_id"] = uid
+            feed["user"]["user_name"] = f"{template['user']['user_name']}_{keyword}_{page}_{i}"
+
+        count = self.config.page_size if page <= self.config.depth else 0
+        data["data"]["mixFeeds"] = self._page_items(template, count, rewrite)
+        data["data"]["pcursor"] = str(page + 1) if page < self.config.depth else "no_more"
+        return data
+
+    # ---------- 评论 ----------
+
+    def douyin_comments(self, params: Dict[str, str]) -> Dict:
+        page_size = self.config.page_size
+        aweme_id = params.get("aweme_id", "")
+        cursor = int(params.get("cursor") or 0)
+        page = cursor // page_size
+        data = self._fixture("douyin_comments")
+        template = data["data"]["comments"][0]
+        base_time = template["create_time"]
+
+        def rewrite(comment, i):
+            # 新评论的 index 为负数，ID 与原有评论不同且时间更新
+            index = page * page_size + i - self.config.new_comments
+            comment["cid"] = str(stable_id("douyin_comment", aweme_id, index))
+            comment["aweme_id"] = aweme_id
+            comment["text"] = f"{template['text']} #{index}"
+            # 越靠前的评论越新
+            comment["create_time"] = base_time - index * 60
+            comment["user"]["uid"] = str(stable_id("douyin_commenter", aweme_id, index))
+            reply = comment.get("reply_comment")
+            if reply:
+                reply["cid"] = str(stable_id("douyin_reply", aweme_id, index))
+                reply["text"] = f"{reply['text']} #{index}"
+                reply["create_time"] = comment["create_time"] + 30
+
+        count = page_size if page < self.config.depth else 0
+        data["data"]["comments"] = self._page_items(template, count, rewrite)
+        data["data"]["cursor"] = cursor + count
+        data["data"]["has_more"] = 1 if page + 1 < self.config.depth else 0
+        data["data"]["total"] = page_size * self.config.depth
+        return data
+
+    def kuaishou_comments(self, params: Dict[str, str]) -> Dict:
+        page_size = self.config.page_size
+        photo_id = params.get("photo_id", "")
+        pcursor = params.get("pcursor") or ""
+        page = int(pcursor) if pcursor.isdigit() else 0
+        data = self._fixture("kuaishou_comments")
+        template = data["data"]["rootComments"][0]
+        sub_template = next(iter(data["data"]["subCommentsMap"].values()))
+        base_ts = template["timestamp"]
+        sub_comments_map = {}
+
+        def rewrite(comment, i):
+            index = page * page_size + i - self.config.new_comments
+            comment_id = stable_id("kuaishou_comment", photo_id, index)
+            comment["comment_id"] = comment_id
+            comment["author_id"] = stable_id("kuaishou_commenter", photo_id, index)
+            comment["content"] = f"{template['content']} #{index}"
+            comment["timestamp"] = base_ts - index * 60000
+            comment["time"] = time.strftime("%Y-%m-%d %H:%M", time.localtime(comment["timestamp"] / 1000))
+            comment["subCommentCount"] = self.config.sub_comments
+            sub = copy.deepcopy(sub_template)
+            sub["subComments"] = self._replies(photo_id, comment_id, 0, min(1, self.config.sub_comments))
+            sub["pcursor"] = "1" if self.config.sub_comments > 1 else "no_more"
+            sub_comments_map[str(comment_id)] = sub
+
+        count = page_size if page < self.config.depth else 0
+        data["data"]["rootComments"] = self._page_items(template, count, rewrite)
+        data["data"]["subCommentsMap"] = sub_comments_map
+        data["data"]["pcursor"] = str(page + 1) if page + 1 < self.config.depth else "no_more"
+        data["data"]["commentCount"] = page_size * self.config.depth
+        return data
+
+    def _replies(self, photo_id: str, root_comment_id, start: int, end: int):
+        """第 start..end-1 条回复，主评论页内嵌的和回复分页返回的 ID 一致"""
+        data = self._fixture("kuaishou_comments")
+        template = next(iter(data["data"]["subCommentsMap"].values()))["subComments"][0]
+
+        def rewrite(reply, j):
+            index = start + j
+            reply["comment_id"] = stable_id("kuaishou_reply", photo_id, root_comment_id, index)
+            reply["content"] = f"{template['content']} #{root_comment_id}-{index}"
+            reply["timestamp"] = template["timestamp"] + index * 30000
+
+        return self._page_items(template, max(0, end - start), rewrite)
+
+    def kuaishou_sub_comments(self, params: Dict[str, str]) -> Dict:
+        photo_id = params.get("photo_id", "")
+        root_comment_id = params.get("root_comment_id", "")
+        pcursor = params.get("pcursor") or ""
+        start = int(pcursor) if pcursor.isdigit() else 0
+        end = min(start + self.config.page_size, self.config.sub_comments)
+        return {
+            "code": 200,
+            "router": "/api/v1/kuaishou/app/fetch_one_video_sub_comment",
+            "data": {
+                "result": 1,
+                "subComments": self._replies(photo_id, root_comment_id, start, end),
+                "pcursor": str(end) if end < self.config.sub_comments else "no_more",
+            },
+        }
+
+    # ---------- 视频详情 ----------
+
+    def douyin_video_detail(self, params: Dict[str, str]) -> Dict:
+        aweme_id = str(stable_id("douyin_video", params.get("share_url", "")))
+        data = self._fixture("douyin_video_detail", aweme_id=aweme_id)
+        detail = data["data"]["aweme_detail"]
+        detail["aweme_id"] = aweme_id
+        detail["statistics"]["aweme_id"] = aweme_id
+        return data
+
+    def tiktok_video_detail(self, params: Dict[str, str]) -> Dict:
+        aweme_id = str(stable_id("tiktok_video", params.get("share_url", "")))
+        data = self._fixture("tiktok_video_detail", aweme_id=aweme_id)
+        data["data"]["aweme_details"][0]["aweme_id"] = aweme_id
+        return data
+
+    def kuaishou_video_detail(self, params: Dict[str, str]) -> Dict:
+        photo_id = format(stable_id("kuaishou_video", params.get("share_text", "")), "x")
+        data = self._fixture("kuaishou_video_detail", photo_id=photo_id)
+        data["data"][0]["photoId"] = photo_id
+        return data
+
+    def douyin_statistics(self, params: Dict[str, str]) -> Dict:
+        aweme_id = params.get("aweme_ids", "")
+        return {
+            "code": 200,
+            "data": {"statistics_list": [{"aweme_id": aweme_id, "play_count": stable_id("play", aweme_id) % 10 ** 7}]},
+        }
+
+    # ---------- 主页作品 ----------
+
+    def _user_posts(self, fixture: str, params: Dict[str, str]) -> Dict:
+        page_size = int(params.get("count") or self.config.page_size)
+        sec_user_id = params.get("sec_user_id", "")
+        max_cursor = int(params.get("max_cursor") or 0)
+        # max_cursor 为上一页最后一条作品的时间戳 (毫秒)，0 表示第一页
+        data = self._fixture(fixture, aweme_id="{aweme_id}")
+        template = data["data"]["aweme_list"][0]
+        newest = template["create_time"]
+        start = 0 if max_cursor == 0 else (newest - max_cursor // 1000) // 3600 + 1
+        total = page_size * self.config.depth
+        end = min(start + page_size, total)
+        items = []
+        for index in range(start, end):
+            aweme_id = str(stable_id(fixture, sec_user_id, index))
+            text = json.dumps(template, ensure_ascii=False).replace("{aweme_id}", aweme_id)
+            item = json.loads(text)
+            item["aweme_id"] = aweme_id
+            item["create_time"] = newest - index * 3600
+            items.append(item)
+        data["data"]["aweme_list"] = items
+        data["data"]["has_more"] = 1 if end < total else 0
+        data["data"]["max_cursor"] = items[-1]["create_time"] * 1000 if items else max_cursor
+        return data
+
+    def douyin_user_posts(self, params: Dict[str, str]) -> Dict:
+        return self._user_posts("douyin_user_posts", params)
+
+    def tiktok_user_posts(self, params: Dict[str, str]) -> Dict:
+        return self._user_posts("tiktok_user_posts", params)
+
+    def tiktok_sec_user_id(self, params: Dict[str, str]) -> Dict:
+        data = self._fixture("tiktok_sec_user_id")
+        data["data"] = f"MS4wLjABAAAA{stable_id('tiktok_user', params.get('url', ''))}"
+        return data
+
+
+def video_block(name: str) -> bytes:
+    """视频内容由按文件名生成的 64 KiB 块重复组成"""
+    return hashlib.sha256(name.encode("utf-8")).digest() * 2048
+
+
+def video_bytes(name: str, size: int) -> bytes:
+    """按文件名生成确定性的视频内容，便于校验下载结果"""
+    block = video_block(name)
+    repeats = size // len(block) + 1
+    return (block * repeats)[:size]
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockTikHub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def mock(self) -> MockTikHub:
+        return self.server.mock
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _inject_error(self) -> bool:
+        config = self.mock.config
+        if config.error_rate and self.server.rng.random() < config.error_rate:
+            if self.server.rng.random() < 0.5:
+                self._send_json(429, {"code": 429, "message": "Too Many Requests"}, {"Retry-After": "0"})
+            else:
+                self._send_json(500, {"code": 500, "message": "Internal Server Error"})
+            return True
+        return False
+
+    def _parse(self) -> Tuple[str, Dict[str, str]]:
+        parsed = urllib.parse.urlsplit(self.path)
+        params = {k: v[-1] for k, v in urllib.parse.parse_qs(parsed.query, keep_blank_values=True).items()}
+        return parsed.path, params
+
+    def do_HEAD(self):
+        self.do_GET(head_only=True)
+
+    def do_GET(self, head_only: bool = False):
+        path, params = self._parse()
+        if path.startswith("/mock/video/"):
+            self._serve_video(path, head_only)
+            return
+        if self.server.mirror_index:
+            # 镜像只提供视频
+            self._send_json(404, {"code": 404, "message": f"unknown route {path}"})
+            return
+
+        handler = self.mock.routes.get(path)
+        if handler is None:
+            self._send_json(404, {"code": 404, "message": f"unknown route {path}"})
+            return
+
+        config = self.mock.config
+        if config.latency or config.jitter:
+            time.sleep(config.latency + self.server.rng.uniform(0, config.jitter))
+        if self._inject_error():
+            self.server.stats.record(path, error=True)
+            return
+        self._send_json(200, handler(params))
+        self.server.stats.record(path)
+
+    def _serve_video(self, path: str, head_only: bool):
+        name = path.rsplit("/", 1)[-1]
+        config = self.mock.config
+        mirror = self.server.mirror_index
+        if mirror < config.slow_mirrors:
+            time.sleep(config.mirror_delay)
+        size = config.video_size
+        first, last = 0, size - 1
+        byte_range = self.headers.get("Range", "")
+        if config.range_support and byte_range.startswith("bytes="):
+            start, _, end = byte_range[len("bytes="):].partition("-")
+            first = int(start or 0)
+            last = min(int(end), size - 1) if end else size - 1
+            if first > last:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+        else:
+            self.send_response(200)
+        length = last - first + 1
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes" if config.range_support else "none")
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+        if head_only:
+            return
+        # 传输到一半时断开连接，模拟 CDN 掉线
+        cut_at = length // 2 if config.video_cut_rate and self.server.rng.random() < config.video_cut_rate else length
+        # 除最后一个镜像外，按比例在一半处卡住：连接保持打开但不再发送数据
+        stall_at = length // 2 if (config.mirror_stall_rate and mirror < config.mirrors - 1
+                                   and self.server.rng.random() < config.mirror_stall_rate) else None
+        # 按块生成并发送，服务端内存与视频大小无关，基准测试的峰值 RSS 只反映下载端
+        block = video_block(name)
+        sent = 0
+        try:
+            while sent < cut_at:
+                if stall_at is not None and sent >= stall_at:
+                    self.wfile.flush()
+                    time.sleep(60)
+                    break
+                offset = (first + sent) % len(block)
+                limit = cut_at if stall_at is None else min(cut_at, stall_at)
+                piece = block[offset:offset + min(len(block) - offset, limit - sent)]
+                self.wfile.write(piece)
+                sent += len(piece)
+        except (BrokenPipeError, ConnectionResetError):
+            # 下载端取消了请求
+            self.close_connection = True
+        if sent < length:
+            self.close_connection = True
+        self.server.stats.record(f"/mock/video@mirror{mirror}" if mirror else "/mock/video", video_bytes=sent)
+
+
+class MockTikHubServer:
+    """在后台线程中运行的模拟服务器"""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        # 主服务器 (镜像 0) 加上 mirrors-1 个只提供视频的镜像，各占一个端口
+        self.servers = [ThreadingHTTPServer((host, port if i == 0 else 0), MockRequestHandler)
+                        for i in range(self.config.mirrors)]
+        self.httpd = self.servers[0]
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        mock = MockTikHub(self.config, self.base_url)
+        mock.mirror_urls = [f"http://{host}:{httpd.server_address[1]}" for httpd in self.servers]
+        stats = MockStats()
+        for index, httpd in enumerate(self.servers):
+            httpd.daemon_threads = True
+            httpd.mock = mock
+            httpd.stats = stats
+            httpd.rng = random.Random(self.config.seed + index)
+            httpd.mirror_index = index
+        self._threads = []
+
+    @property
+    def stats(self) -> MockStats:
+        return self.httpd.stats
+
+    def start(self, mirrors_only: bool = False) -> "MockTikHubServer":
+        for index, httpd in enumerate(self.servers):
+            if index or not mirrors_only:
+                thread = threading.Thread(target=httpd.serve_forever, name=f"mock-tikhub-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for httpd in self.servers:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="每个 API 请求的基础延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外随机延迟上限 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 500/429 的概率")
+    parser.add_argument("--depth", type=int, default=3, help="每个关键词/视频/主页的分页数")
+    parser.add_argument("--page-size", type=int, default=20, help="每页条目数")
+    parser.add_argument("--video-size", type=int, default=2 * 1024 * 1024, help="模拟视频文件大小 (字节)")
+    parser.add_argument("--sub-comments", type=int, default=3, help="快手每条主评论的回复数")
+    parser.add_argument("--new-comments", type=int, default=0, help="排在原有评论之前的新评论数")
+    parser.add_argument("--no-range", dest="range_support", action="store_false", help="视频不支持 Range 请求")
+    parser.add_argument("--video-cut-rate", type=float, default=0.0, help="视频传输到一半时断开连接的概率")
+    parser.add_argument("--mirrors", type=int, default=1, help="视频 CDN 镜像数 (含主服务器)")
+    parser.add_argument("--slow-mirrors", type=int, default=0, help="前几个镜像响应慢")
+    parser.add_argument("--mirror-delay", type=float, default=2.0, help="慢镜像的首字节延迟 (秒)")
+    parser.add_argument("--mirror-stall-rate", type=float, default=0.0, help="除最后一个外的镜像传输到一半卡住的概率")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="录制的响应文件目录")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, depth=args.depth,
+        page_size=args.page_size, video_size=args.video_size, sub_comments=args.sub_comments,
+        new_comments=args.new_comments,
+        range_support=args.range_support, video_cut_rate=args.video_cut_rate,
+        mirrors=args.mirrors, slow_mirrors=args.slow_mirrors, mirror_delay=args.mirror_delay,
+        mirror_stall_rate=args.mirror_stall_rate, fixtures_dir=args.fixtures, seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 TikHub 模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockTikHubServer(config_from_args(args), args.host, args.port)
+    server.start(mirrors_only=True)
+    print(f"模拟服务器已启动: {server.base_url}")
+    print(f"使用方法: TIKHUB_API_BASE={server.base_url} DOUYIN_API_URL={server.base_url}/api/v1/douyin/web/fetch_user_search_result "
+          f"KUAISHOU_API_URL={server.base_url}/api/v1/kuaishou/web/fetch_search_user")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for httpd in server.servers:
+            httpd.server_close()
+        print(json.dumps(server.stats.snapshot(), ensure_ascii=False, indent=2))
@@ -0,0 +1,409 @@
+"""
+离线基准测试：在本地模拟服务器上端到端运行 dk.py、两个评论抓取脚本和各下载器，
+统计 pages/sec、embeddings/sec、rows inserted/sec、下载速度和峰值 RSS。
+
+每个场景在独立子进程中运行，峰值 RSS 互不干扰。
+
+    python bench/run_bench.py                          # 运行全部场景，只计数不写库
+    python bench/run_bench.py dk douyin_comments --latency 0.05 --error-rate 0.02
+    python bench/run_bench.py --sink milvus            # 写入 Milvus 的 bench_* 集合，结束后删除
+    python bench/run_bench.py --json after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import importlib.util
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_tikhub_server import MockTikHubServer, add_config_arguments, config_from_args
+
+DOUYIN_SEARCH_PATH = "/api/v1/douyin/web/fetch_user_search_result"
+KUAISHOU_SEARCH_PATH = "/api/v1/kuaishou/web/fetch_search_user"
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存 (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class CountingEncoder:
+    """包装 SentenceTransformer，统计编码条数和耗时"""
+
+    def __init__(self, model):
+        self.model = model
+        self.sentences = 0
+        self.calls = 0
+        self.seconds = 0.0
+
+    def encode(self, sentences, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.model.encode(sentences, *args, **kwargs)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        self.sentences += 1 if isinstance(sentences, str) else len(sentences)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class _InsertResult:
+    def __init__(self, rows: int):
+        self.insert_count = rows
+        self.upsert_count = rows
+        self.delete_count = 0
+        self.primary_keys = list(range(rows))
+
+
+def _row_count(data: Any) -> int:
+    if isinstance(data, dict):
+        return 1
+    if data and isinstance(data[0], dict):
+        return len(data)
+    # 按列插入: 每一列长度相同
+    return len(data[0]) if data else 0
+
+
+class BenchCollection:
+    """统计写入行数的集合包装。target 为 None 时只计数不落库 (memory sink)"""
+
+    def __init__(self, target=None):
+        self.target = target
+        self.rows = 0
+        self.insert_calls = 0
+        self.insert_seconds = 0.0
+
+    def _write(self, method: str, data, *args, **kwargs):
+        rows = _row_count(data)
+        start = time.perf_counter()
+        if self.target is not None:
+            result = getattr(self.target, method)(data, *args, **kwargs)
+        else:
+            result = _InsertResult(rows)
+        self.insert_seconds += time.perf_counter() - start
+        self.insert_calls += 1
+        self.rows += rows
+        return result
+
+    def insert(self, data, *args, **kwargs):
+        return self._write("insert", data, *args, **kwargs)
+
+    def upsert(self, data, *args, **kwargs):
+        return self._write("upsert", data, *args, **kwargs)
+
+    def flush(self, *args, **kwargs):
+        if self.target is not None:
+            self.target.flush(*args, **kwargs)
+
+    def load(self, *args, **kwargs):
+        if self.target is not None:
+            self.target.load(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        return self.target.query(*args, **kwargs) if self.target is not None else []
+
+    def delete(self, *args, **kwargs):
+        return self.target.delete(*args, **kwargs) if self.target is not None else _InsertResult(0)
+
+    @property
+    def num_entities(self) -> int:
+        return self.target.num_entities if self.target is not None else self.rows
+
+    def __getattr__(self, name):
+        if self.target is None:
+            raise AttributeError(name)
+        return getattr(self.target, name)
+
+
+def load_script(relpath: str, name: str):
+    """按文件路径加载脚本模块 (目录名含空格，无法直接 import)"""
+    path = os.path.join(REPO_ROOT, relpath)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Scenario:
+    """单个场景的运行上下文"""
+
+    def __init__(self, args: argparse.Namespace, server: MockTikHubServer, workdir: str):
+        self.args = args
+        self.server = server
+        self.workdir = workdir
+        self.encoders: List[CountingEncoder] = []
+        self.collections: List[BenchCollection] = []
+        self.output_dir = os.path.join(workdir, "downloads")
+        self._milvus_collections: List[str] = []
+
+    def instrument(self, module):
+        if hasattr(module, "model"):
+            encoder = CountingEncoder(module.model)
+            module.model = encoder
+            self.encoders.append(encoder)
+        return module
+
+    async def sink(self, init=None, name: str = "") -> BenchCollection:
+        """创建写入目标；--sink milvus 时调用脚本自身的 init_milvus 创建 bench_ 前缀的集合"""
+        target = None
+        if self.args.sink == "milvus" and init is not None:
+            bench_name = f"bench_{name}"
+            target = init(bench_name)
+            if asyncio.iscoroutine(target):
+                target = await target
+            self._milvus_collections.append(bench_name)
+        collection = BenchCollection(target)
+        self.collections.append(collection)
+        return collection
+
+    def cleanup(self):
+        if self._milvus_collections and not self.args.keep:
+            from pymilvus import utility
+            for name in self._milvus_collections:
+                if utility.has_collection(name):
+                    utility.drop_collection(name)
+
+    def downloaded_bytes(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.output_dir):
+            for name in files:
+                total += os.path.getsize(os.path.join(root, name))
+        return total
+
+
+# ---------- 场景 ----------
+
+async def bench_dk(ctx: Scenario):
+    dk = ctx.instrument(load_script("dk.py", "dk"))
+    keywords = [f"关键词{i}" for i in range(ctx.args.keywords)]
+    for filename in ("快手.txt", "抖音.txt"):
+        with open(os.path.join(ctx.workdir, filename), "w", encoding="utf-8") as f:
+            f.write("\n".join(keywords))
+    collection = await ctx.sink(dk.init_milvus, "user_data")
+    await dk.process_platform(collection, "快手", dk.KUAISHOU_API_URL, "快手.txt")
+    await dk.process_platform(collection, "抖音", dk.DOUYIN_API_URL, "抖音.txt")
+    collection.flush()
+
+
+async def bench_kuaishou_comments(ctx: Scenario):
+    fetcher = ctx.instrument(load_script("Kuaishou/comment_fetcher.py", "kuaishou_comment_fetcher"))
+    collection = await ctx.sink(fetcher.init_milvus, "kuaishou_comments")
+    videos = [(f"bench_photo_{i}", f"author_{i}", f"作者{i}") for i in range(ctx.args.videos)]
+    await fetcher.crawl_comment_videos(collection, videos, ctx.args.concurrency, ctx.args.rate)
+
+
+async def bench_douyin_comments(ctx: Scenario):
+    fetcher = ctx.instrument(load_script("Douyin/comment_fetcher_douyin.py", "douyin_comment_fetcher"))
+    collection = await ctx.sink(fetcher.init_milvus, "douyin_comments")
+    videos = [(str(7300000000000000000 + i), f"author_{i}", f"作者{i}") for i in range(ctx.args.videos)]
+    await fetcher.crawl_comment_videos(collection, videos, ctx.args.concurrency, ctx.args.rate)
+
+
+async def bench_douyin_profile(ctx: Scenario):
+    downloader = load_script("Douyin/APP API Demo/profile_videos_downloader.py", "douyin_profile_downloader")
+    await downloader.download_profile("MS4wLjABAAAAbench_douyin_user", ctx.output_dir, ctx.args.download_concurrency)
+
+
+async def bench_tiktok_profile(ctx: Scenario):
+    downloader = load_script("TikTok/APP API Demo/profile_videos_downloader.py", "tiktok_profile_downloader")
+    await downloader.download_profile("https://www.tiktok.com/@bench_user", ctx.output_dir, ctx.args.download_concurrency)
+
+
+async def _bench_single(ctx: Scenario, relpath: str, name: str, url_template: str):
+    downloader = load_script(relpath, name)
+    for i in range(ctx.args.videos):
+        video_info, play_addr = await downloader.get_video_info(url_template.format(i=i))
+        if play_addr:
+            await downloader.download_file(video_info, play_addr, ctx.output_dir)
+
+
+async def bench_douyin_single(ctx: Scenario):
+    await _bench_single(ctx, "Douyin/APP API Demo/single_video_downloader.py", "douyin_single_downloader",
+                        "https://v.douyin.com/bench{i}/")
+
+
+async def bench_tiktok_single(ctx: Scenario):
+    await _bench_single(ctx, "TikTok/APP API Demo/single_video_downloader.py", "tiktok_single_downloader",
+                        "https://www.tiktok.com/t/bench{i}/")
+
+
+async def bench_kuaishou_single(ctx: Scenario):
+    await _bench_single(ctx, "Kuaishou/single_video_downloader.py", "kuaishou_single_downloader",
+                        "https://www.kuaishou.com/f/bench{i}")
+
+
+async def bench_batch_share(ctx: Scenario):
+    downloader = load_script("batch_share_downloader.py", "batch_share_downloader")
+    # 三个平台交替，另加分享文案、重复链接和无法识别的链接
+    lines = []
+    for i in range(ctx.args.videos):
+        lines.append(f"https://v.douyin.com/bench{i}/")
+        lines.append(f"看看这个作品 https://www.tiktok.com/t/bench{i}/ 复制打开")
+        lines.append(f"https://www.kuaishou.com/f/bench{i}")
+    lines += ["https://v.douyin.com/bench0/", "https://example.com/not-a-video"]
+    await downloader.download_share_urls(lines, ctx.output_dir, os.path.join(ctx.workdir, "batch_manifest.csv"),
+                                         ctx.args.download_concurrency)
+
+
+SCENARIOS = {
+    "dk": bench_dk,
+    "kuaishou_comments": bench_kuaishou_comments,
+    "douyin_comments": bench_douyin_comments,
+    "douyin_profile": bench_douyin_profile,
+    "tiktok_profile": bench_tiktok_profile,
+    "douyin_single": bench_douyin_single,
+    "tiktok_single": bench_tiktok_single,
+    "kuaishou_single": bench_kuaishou_single,
+    "batch_share": bench_batch_share,
+}
+
+
+def run_scenario(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """在当前进程中运行单个场景并返回统计结果"""
+    server = MockTikHubServer(config_from_args(args)).start()
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    os.environ.update({
+        "API_KEY": "bench-api-key",
+        "TIKHUB_API_BASE": server.base_url,
+        "DOUYIN_API_URL": server.base_url + DOUYIN_SEARCH_PATH,
+        "KUAISHOU_API_URL": server.base_url + KUAISHOU_SEARCH_PATH,
+        "TIKHUB_CACHE_MODE": args.cache_mode,
+        "TIKHUB_CACHE_DIR": os.path.join(workdir, "cache"),
+        "DEAD_LETTER_FILE": os.path.join(workdir, "dead_letters.jsonl"),
+        "SHARE_ID_CACHE_FILE": os.path.join(workdir, "share_id_cache.json"),
+    })
+    os.chdir(workdir)
+
+    ctx = Scenario(args, server, workdir)
+    start = time.perf_counter()
+    try:
+        asyncio.run(SCENARIOS[name](ctx))
+    finally:
+        elapsed = time.perf_counter() - start
+        server.stop()
+        ctx.cleanup()
+
+    stats = server.stats.snapshot()
+    embeddings = sum(e.sentences for e in ctx.encoders)
+    encode_seconds = sum(e.seconds for e in ctx.encoders)
+    rows = sum(c.rows for c in ctx.collections)
+    downloaded = ctx.downloaded_bytes()
+    return {
+        "scenario": name,
+        "elapsed_s": round(elapsed, 3),
+        "pages": stats["api_pages"],
+        "pages_per_s": round(stats["api_pages"] / elapsed, 2) if elapsed else 0.0,
+        "injected_errors": stats["errors"],
+        "embeddings": embeddings,
+        "embeddings_per_s": round(embeddings / encode_seconds, 1) if encode_seconds else 0.0,
+        "encode_calls": sum(e.calls for e in ctx.encoders),
+        "rows_inserted": rows,
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else 0.0,
+        "insert_calls": sum(c.insert_calls for c in ctx.collections),
+        "downloaded_mb": round(downloaded / 1024 / 1024, 2),
+        "download_mb_per_s": round(downloaded / 1024 / 1024 / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+COLUMNS = [
+    ("scenario", "场景"), ("elapsed_s", "耗时(s)"), ("pages_per_s", "pages/s"),
+    ("embeddings_per_s", "emb/s"), ("encode_calls", "encode次数"), ("rows_per_s", "rows/s"),
+    ("insert_calls", "insert次数"), ("download_mb_per_s", "MB/s"), ("peak_rss_mb", "峰值RSS(MB)"),
+]
+
+
+def print_report(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None):
+    header = " | ".join(title for _, title in COLUMNS)
+    print("\n" + header)
+    print("-" * len(header.encode("gbk", errors="replace")))
+    for result in results:
+        cells = []
+        for key, _ in COLUMNS:
+            value = result.get(key, "")
+            base = (baseline or {}).get(result["scenario"], {}).get(key)
+            if isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+                cells.append(f"{value} ({(value - base) / base * 100:+.0f}%)")
+            else:
+                cells.append(str(value))
+        print(" | ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TikHub 数据管道离线基准测试")
+    parser.add_argument("scenarios", nargs="*", help=f"要运行的场景，默认全部: {', '.join(SCENARIOS)}")
+    parser.add_argument("--keywords", type=int, default=5, help="dk 场景每个平台的关键词数")
+    parser.add_argument("--videos", type=int, default=5, help="评论/单视频场景的视频数")
+    parser.add_argument("--concurrency", type=int, default=8, help="评论场景同时抓取的视频数")
+    parser.add_argument("--rate", type=float, default=0, help="评论场景的全局请求速率上限 (次/秒)，0 表示不限速")
+    parser.add_argument("--download-concurrency", type=int, default=8, help="主页下载和批量下载场景同时下载的视频数")
+    parser.add_argument("--sink", choices=["memory", "milvus"], default="memory",
+                        help="memory 只计数不落库；milvus 写入 bench_ 前缀的集合")
+    parser.add_argument("--keep", action="store_true", help="--sink milvus 时保留 bench_ 集合")
+    parser.add_argument("--cache-mode", choices=["off", "on"], default="off", help="响应缓存模式")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--verbose", action="store_true", help="显示脚本自身的输出")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_scenario(args.child, args)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+    child_args = [a for a in sys.argv[1:] if a not in names]
+    results = []
+    for name in names:
+        print(f"运行场景 {name} ...", flush=True)
+        fd, result_file = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name, "--result-file", result_file] + child_args,
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.PIPE,
+            text=True,
+        )
+        if proc.returncode != 0:
+            print(f"场景 {name} 运行失败 (退出码 {proc.returncode})")
+            if proc.stderr:
+                print(proc.stderr[-2000:])
+            continue
+        with open(result_file, "r", encoding="utf-8") as f:
+            results.append(json.load(f))
+        os.remove(result_file)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = {r["scenario"]: r for r in json.load(f)}
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+评论统计：流式遍历评论集合，按批转成列用 numpy 聚合，输出每个视频/作者的汇总表。
+
+    python comment_analytics.py                                   # douyin_comments 和 kuaishou_comments
+    python comment_analytics.py douyin_comments --hours 24 --top-k 5 --bucket 3600
+
+每个集合输出到 <output>/<集合名>/ 下的 CSV:
+    videos.csv        每个视频的评论数、回复数与回复占比、总点赞、首末评论时间
+    top_comments.csv  每个视频点赞最多的 top-k 条评论
+    areas.csv         每个视频的评论地区分布
+    timeline.csv      每个视频按时间桶 (默认 1 小时) 的评论量
+    authors.csv       总点赞最多的评论者及其点赞最多的评论
+
+内存只与批大小和视频数有关，与评论总数和评论者数无关：评论内容只为 top-k 保留，
+评论者的累计数据每批合并进临时 SQLite 表 (在磁盘上，关闭时删除)，输出时只取前 top_authors 名。
+"""
+import os
+import csv
+import time
+import heapq
+import sqlite3
+import argparse
+from typing import Dict, List
+
+import numpy as np
+from dotenv import load_dotenv
+from pymilvus import connections, Collection
+
+from comment_schema import epoch_seconds
+from comment_search import check_time_filter, filter_expr
+
+load_dotenv()
+MILVUS_HOST = os.getenv("MILVUS_HOST", "localhost")
+MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
+
+FIELDS = ["photo_id", "comment_id", "author_id", "author_name", "content", "time", "likes", "area", "is_reply"]
+
+
+def _top_per_group(groups: np.ndarray, likes: np.ndarray, k: int) -> np.ndarray:
+    """每组 (groups 为组下标) 点赞最多的 k 行的下标"""
+    order = np.lexsort((-likes, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return order[rank < k]
+
+
+class CommentStats:
+    """按批累加的评论统计"""
+
+    def __init__(self, top_k: int = 10, bucket_seconds: int = 3600):
+        self.top_k = top_k
+        self.bucket_seconds = bucket_seconds
+        self.rows = 0
+        # photo_id -> [评论数, 回复数, 总点赞, 最早时间, 最晚时间]
+        self.videos: Dict[str, List[int]] = {}
+        # photo_id -> [(点赞, comment_id, 评论者, 内容)]，按点赞降序
+        self.top: Dict[str, List[tuple]] = {}
+        self.areas: Dict[tuple, int] = {}
+        self.timeline: Dict[tuple, int] = {}
+        # 评论者累计数据放在临时数据库中 (路径为空时 SQLite 在磁盘上建临时文件)，不随评论者数占用内存
+        self._authors = sqlite3.connect("")
+        self._authors.execute("PRAGMA cache_size=-16384")
+        self._authors.execute(
+            """CREATE TABLE authors (
+                author_id INTEGER PRIMARY KEY,
+                author_name TEXT NOT NULL,
+                comments INTEGER NOT NULL,
+                likes INTEGER NOT NULL,
+                top_comment_likes INTEGER NOT NULL,
+                top_comment_id TEXT NOT NULL
+            )"""
+        )
+
+    def add(self, rows: List[Dict]):
+        n = len(rows)
+        if not n:
+            return
+        self.rows += n
+        video_ids, video_idx = np.unique(np.array([r["photo_id"] for r in rows], dtype=object), return_inverse=True)
+        likes = np.fromiter((r["likes"] for r in rows), dtype=np.int64, count=n)
+        replies = np.fromiter((r["is_reply"] for r in rows), dtype=bool, count=n)
+        times = np.fromiter((r["time"] if isinstance(r["time"], int) else epoch_seconds(r["time"]) for r in rows),
+                            dtype=np.int64, count=n)
+        self._add_videos(video_ids, video_idx, likes, replies, times)
+        self._add_top(rows, video_ids, video_idx, likes)
+        self._add_areas(rows, video_ids, video_idx)
+        self._add_timeline(video_ids, video_idx, times)
+        self._add_authors(rows, likes)
+
+    def _add_videos(self, video_ids, video_idx, likes, replies, times):
+        groups = len(video_ids)
+        counts = np.bincount(video_idx, minlength=groups)
+        reply_counts = np.bincount(video_idx, weights=replies, minlength=groups).astype(np.int64)
+        like_sums = np.bincount(video_idx, weights=likes, minlength=groups).astype(np.int64)
+        # 时间无法识别的评论 (0) 不参与首末时间
+        known = times > 0
+        first = np.full(groups, np.iinfo(np.int64).max)
+        last = np.zeros(groups, dtype=np.int64)
+        np.minimum.at(first, video_idx[known], times[known])
+        np.maximum.at(last, video_idx[known], times[known])
+        for i, video in enumerate(video_ids):
+            stats = self.videos.get(video)
+            if stats is None:
+                self.videos[video] = [int(counts[i]), int(reply_counts[i]), int(like_sums[i]), int(first[i]), int(last[i])]
+            else:
+                stats[0] += int(counts[i])
+                stats[1] += int(reply_counts[i])
+                stats[2] += int(like_sums[i])
+                stats[3] = min(stats[3], int(first[i]))
+                stats[4] = max(stats[4], int(last[i]))
+
+    def _add_top(self, rows, video_ids, video_idx, likes):
+        # 先在批内取每个视频的 top-k，再与已有的 top-k 合并
+        for i in _top_per_group(video_idx, likes, self.top_k):
+            row = rows[i]
+            self.top.setdefault(video_ids[video_idx[i]], []).append(
+                (int(likes[i]), row["comment_id"], row["author_name"], row["content"]))
+        # 每次合并后都重新排序，评论分布在多批中时名次也正确
+        for video in video_ids:
+            entries = self.top.get(video)
+            if entries:
+                self.top[video] = heapq.nlargest(self.top_k, entries, key=lambda e: e[0])
+
+    def _add_areas(self, rows, video_ids, video_idx):
+        area_names, area_idx = np.unique(np.array([r["area"] or "" for r in rows], dtype=object), return_inverse=True)
+        pairs, counts = np.unique(np.stack((video_idx, area_idx), axis=1), axis=0, return_counts=True)
+        for (v, a), count in zip(pairs, counts):
+            key = (video_ids[v], area_names[a])
+            self.areas[key] = self.areas.get(key, 0) + int(count)
+
+    def _add_timeline(self, video_ids, video_idx, times):
+        known = times > 0
+        buckets = times[known] // self.bucket_seconds * self.bucket_seconds
+        pairs, counts = np.unique(np.stack((video_idx[known], buckets), axis=1), axis=0, return_counts=True)
+        for (v, bucket), count in zip(pairs, counts):
+            key = (video_ids[v], int(bucket))
+            self.timeline[key] = self.timeline.get(key, 0) + int(count)
+
+    def _add_authors(self, rows, likes):
+        author_ids, author_idx = np.unique(np.fromiter((r["author_id"] for r in rows), dtype=np.int64, count=len(rows)),
+                                           return_inverse=True)
+        counts = np.bincount(author_idx)
+        like_sums = np.bincount(author_idx, weights=likes).astype(np.int64)
+        best = _top_per_group(author_idx, likes, 1)
+        # SET 中的表达式都取更新前的值，最高点赞与对应的 comment_id 一起比较
+        self._authors.executemany(
+            """INSERT INTO authors VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (author_id) DO UPDATE SET
+                   comments = comments + excluded.comments,
+                   likes = likes + excluded.likes,
+                   top_comment_id = CASE WHEN excluded.top_comment_likes > top_comment_likes
+                                         THEN excluded.top_comment_id ELSE top_comment_id END,
+                   top_comment_likes = MAX(top_comment_likes, excluded.top_comment_likes)""",
+            ((int(author_ids[author_idx[i]]), rows[i]["author_name"], int(counts[author_idx[i]]),
+              int(like_sums[author_idx[i]]), int(likes[i]), rows[i]["comment_id"]) for i in best),
+        )
+        self._authors.commit()
+
+    @property
+    def author_count(self) -> int:
+        return self._authors.execute("SELECT COUNT(*) FROM authors").fetchone()[0]
+
+    def close(self):
+        self._authors.close()
+
+    def write(self, output_dir: str, top_authors: int = 1000):
+        os.makedirs(output_dir, exist_ok=True)
+
+        def write_csv(name, header, rows):
+            with open(os.path.join(output_dir, name), "w", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+
+        def fmt(ts):
+            return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) if 0 < ts < np.iinfo(np.int64).max else ""
+
+        write_csv("videos.csv", ["photo_id", "comments", "replies", "reply_ratio", "likes", "first_comment", "last_comment"], (
+            [video, c, r, round(r / c, 4) if c else 0, likes, fmt(first), fmt(last)]
+            for video, (c, r, likes, first, last) in sorted(self.videos.items(), key=lambda x: -x[1][0])
+        ))
+        write_csv("top_comments.csv", ["photo_id", "rank", "comment_id", "author_name", "likes", "content"], (
+            [video, rank, cid, author, likes, content]
+            for video, entries in self.top.items()
+            for rank, (likes, cid, author, content) in enumerate(entries, 1)
+        ))
+        write_csv("areas.csv", ["photo_id", "area", "comments"], (
+            [video, area, count] for (video, area), count in sorted(self.areas.items(), key=lambda x: (x[0][0], -x[1]))
+        ))
+        write_csv("timeline.csv", ["photo_id", "bucket_start", "comments"], (
+            [video, fmt(bucket), count] for (video, bucket), count in sorted(self.timeline.items())
+        ))
+        ranked = self._authors.execute(
+            "SELECT author_id, author_name, comments, likes, top_comment_likes, top_comment_id "
+            "FROM authors ORDER BY likes DESC LIMIT ?", (top_authors,)
+        )
+        write_csv("authors.csv", ["author_id", "author_name", "comments", "likes", "top_comment_likes", "top_comment_id"],
+                  ranked)
+
+
+def analyze(collection: Collection, stats: CommentStats, expr: str = "", batch_size: int = 5000) -> CommentStats:
+    """用 query_iterator 按批读取评论并累加到 stats"""
+    iterator = collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=FIELDS)
+    started = time.perf_counter()
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            stats.add(rows)
+            elapsed = time.perf_counter() - started
+            print(f"\r{collection.name}: 已统计 {stats.rows} 条评论 ({stats.rows / elapsed:.0f} 条/秒)", end="")
+    finally:
+        iterator.close()
+    print()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评论集合的按视频/作者统计")
+    parser.add_argument("collections", nargs="*", default=["douyin_comments", "kuaishou_comments"])
+    parser.add_argument("--output", default="analytics", help="输出目录")
+    parser.add_argument("--top-k", type=int, default=10, help="每个视频保留的点赞最多的评论数")
+    parser.add_argument("--top-authors", type=int, default=1000, help="输出的评论者数")
+    parser.add_argument("--bucket", type=int, default=3600, help="时间桶长度 (秒)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批读取的评论数")
+    parser.add_argument("--video", action="append", default=[], help="只统计这些视频，可重复")
+    parser.add_argument("--hours", type=float, help="只统计最近 N 小时的评论")
+    args = parser.parse_args()
+
+    since = int(time.time() - args.hours * 3600) if args.hours else None
+    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
+    try:
+        for name in args.collections:
+            collection = Collection(name)
+            collection.load()
+            check_time_filter(collection, since, None)
+            stats = CommentStats(args.top_k, args.bucket)
+            output_dir = os.path.join(args.output, name)
+            try:
+                analyze(collection, stats, filter_expr(args.video, None, since), args.batch_size)
+                stats.write(output_dir, args.top_authors)
+                print(f"{name}: {stats.rows} 条评论，{len(stats.videos)} 个视频，{stats.author_count} 个评论者 -> {output_dir}")
+            finally:
+                stats.close()
+    finally:
+        connections.disconnect("default")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+按列批量写入评论：一页 (或多页) 评论先整理成列，再一次 encode、一次 insert。
+
+格式异常的评论 (字段类型不对、字符串超过 schema 长度) 在加入批次时逐条跳过，
+不影响同批的其他评论；批量 insert 失败时退回逐条插入，只丢弃真正写不进去的行。
+
+集合以 "平台:comment_id" 为主键时用 upsert 写入，同一条评论只保留一行。
+旧集合以自增 id 为主键，无法 upsert：指定 replace_key (如 comment_id) 时先删除
+同 key 的旧行再插入。同一批次内重复的评论只保留最后一次出现的内容。
+
+指定 tagger (见 comment_clustering.ClusterTagger) 时，encode 后先把批次与已知的
+近重复簇比较并记录命中的评论，再写入。
+"""
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from pymilvus import DataType, FieldSchema
+
+from metrics import EMBED_BATCH_SIZE, EMBED_SECONDS, INSERT_BATCH_SIZE, INSERT_SECONDS, ROWS_INSERTED
+from profiling import PROFILER
+from comment_schema import PK_FIELD, VECTOR_FIELD, is_legacy
+
+TEXT_FIELD = "content"
+
+# 多个视频的批次在不同线程中 flush，共用的模型 (fast tokenizer) 不是线程安全的，encode 逐个进行
+ENCODE_LOCK = threading.Lock()
+
+
+class CommentBatch:
+    def __init__(self, collection, model, fields: Sequence[FieldSchema], platform: str,
+                 collection_name: str, encode_batch_size: int = 64, replace_key: Optional[str] = None,
+                 tagger=None):
+        self.collection = collection
+        self.model = model
+        self.platform = platform
+        self.collection_name = collection_name
+        self.encode_batch_size = encode_batch_size
+        self.tagger = tagger
+        # 新 schema 用 upsert，按主键去重；旧 schema 按 replace_key 先删后插
+        self.upsert = not is_legacy(fields)
+        self.key = PK_FIELD if self.upsert else replace_key
+        self._rows_by_key: Dict[Any, int] = {}
+        # 按 schema 顺序的列名 (不含自增主键)，向量列在 flush 时才生成
+        self.field_names = [f.name for f in fields if not f.auto_id]
+        self.max_lengths = {
+            f.name: f.params.get("max_length") for f in fields
+            if f.dtype == DataType.VARCHAR and not f.auto_id
+        }
+        self.columns: Dict[str, List[Any]] = {name: [] for name in self.field_names if name != VECTOR_FIELD}
+        self.skipped = 0
+        self.pages = 0  # 自上次 flush 以来加入的页数
+
+    def __len__(self) -> int:
+        return len(self.columns[TEXT_FIELD])
+
+    def add(self, comment: Dict, convert: Callable[..., Dict[str, Any]], *args) -> bool:
+        """用 convert(comment, *args) 把原始评论转成一行，格式异常时跳过该行"""
+        try:
+            row = convert(comment, *args)
+            for name, limit in self.max_lengths.items():
+                # 旧版集合的 time 等字段为字符串，数值按文本写入
+                if not isinstance(row[name], str):
+                    row[name] = str(row[name])
+                if limit and len(row[name].encode("utf-8")) > limit:
+                    raise ValueError(f"{name} 超过 {limit} 字节")
+            values = [row[name] for name in self.columns]
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            self.skipped += 1
+            print(f"跳过格式异常的评论 ({e}): {str(comment)[:200]}")
+            return False
+        if self.key:
+            index = self._rows_by_key.get(row[self.key])
+            if index is not None:
+                for column, value in zip(self.columns.values(), values):
+                    column[index] = value
+                return True
+            self._rows_by_key[row[self.key]] = len(self)
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+        return True
+
+    def end_page(self) -> int:
+        """记录加入了一整页，返回未 flush 的页数"""
+        self.pages += 1
+        return self.pages
+
+    def flush(self) -> int:
+        """对当前批次做一次 encode 和一次写入，返回写入行数并清空批次"""
+        rows = len(self)
+        self.pages = 0
+        if not rows:
+            return 0
+        texts = self.columns[TEXT_FIELD]
+        EMBED_BATCH_SIZE.observe(rows, source=self.collection_name)
+        with ENCODE_LOCK, EMBED_SECONDS.time(source=self.collection_name), PROFILER.stage("encode"):
+            vectors = self.model.encode(texts, batch_size=self.encode_batch_size, show_progress_bar=False).tolist()
+        if self.tagger is not None:
+            try:
+                with PROFILER.stage("tag"):
+                    self.tagger.tag_batch(self.columns, vectors)
+            except Exception as e:
+                print(f"评论聚类打标失败 ({str(e)[:100]})")
+        data = [vectors if name == VECTOR_FIELD else self.columns[name] for name in self.field_names]
+        self.columns = {name: [] for name in self.columns}
+        self._rows_by_key = {}
+        if self.key and not self.upsert:
+            self._delete_existing(data[self.field_names.index(self.key)])
+
+        try:
+            return self._write(data, rows)
+        except Exception as e:
+            print(f"批量写入 {rows} 条评论失败 ({str(e)[:100]})，改为逐条写入")
+        inserted = 0
+        for i in range(rows):
+            try:
+                inserted += self._write([[column[i]] for column in data], 1)
+            except Exception as e:
+                self.skipped += 1
+                print(f"插入评论失败，已跳过 ({str(e)[:100]}): {data[self.field_names.index(TEXT_FIELD)][i][:30]}")
+        return inserted
+
+    def _delete_existing(self, keys: List[Any]):
+        try:
+            with PROFILER.stage("delete"):
+                self.collection.delete(f"{self.key} in {json.dumps(keys, ensure_ascii=False)}")
+        except Exception as e:
+            print(f"删除旧评论失败，可能产生重复行 ({str(e)[:100]})")
+
+    def _write(self, data: List[List[Any]], rows: int) -> int:
+        INSERT_BATCH_SIZE.observe(rows, collection=self.collection_name)
+        with INSERT_SECONDS.time(collection=self.collection_name), PROFILER.stage("insert"):
+            if self.upsert:
+                self.collection.upsert(data)
+            else:
+                self.collection.insert(data)
+        ROWS_INSERTED.inc(rows, platform=self.platform, collection=self.collection_name)
+        return rows
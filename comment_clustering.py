@@ -0,0 +1,264 @@
+"""
+近重复 / 刷屏评论聚类：按视频 (或评论者) 分组，用 content_vector 做随机超平面 LSH 分桶，
+只比较同桶的评论，相似度超过阈值的并成一簇 (并查集)，避免两两比较。
+
+    python comment_clustering.py douyin_comments --scope video --threshold 0.95 --min-size 5
+    python comment_clustering.py kuaishou_comments --scope author --video 5xabc123
+
+输出到 <output>/<集合名>/:
+    clusters.csv   簇 ID、分组、大小、不同评论者数、代表评论
+    members.csv    簇 ID 与 comment_id 的对应
+    centroids.npz  各簇的中心向量，供抓取时给新评论打标
+
+设置 COMMENT_CLUSTER_DIR=clusters 后，评论抓取脚本在写入前把新评论与已有簇中心比较，
+命中的评论追加到 COMMENT_CLUSTER_TAGS (默认 comment_cluster_tags.jsonl)。
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+from pymilvus import connections, Collection
+
+from comment_schema import VECTOR_FIELD
+from comment_search import check_time_filter, filter_expr
+from metrics import CLUSTER_TAGGED
+
+load_dotenv()
+MILVUS_HOST = os.getenv("MILVUS_HOST", "localhost")
+MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
+COMMENT_CLUSTER_DIR = os.getenv("COMMENT_CLUSTER_DIR")
+COMMENT_CLUSTER_TAGS = os.getenv("COMMENT_CLUSTER_TAGS", "comment_cluster_tags.jsonl")
+
+SCOPE_FIELDS = {"video": "photo_id", "author": "author_id"}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class UnionFind:
+    def __init__(self, n: int):
+        self.parent = np.arange(n)
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def labels(self) -> np.ndarray:
+        return np.array([self.find(i) for i in range(len(self.parent))])
+
+
+def lsh_labels(vectors: np.ndarray, threshold: float = 0.95, bands: int = 12, rows: int = 12,
+               seed: int = 0) -> np.ndarray:
+    """返回每条评论所在簇的标签 (簇内最小的行号)，vectors 须已归一化。
+
+    每个 band 用 rows 个随机超平面生成签名，签名相同的评论进入同一个桶；桶内按顺序
+    与桶首和前一条比较余弦相似度，达到 threshold 的合并。比较次数为 O(n * bands)。
+    """
+    n, dim = vectors.shape
+    uf = UnionFind(n)
+    if n < 2:
+        return uf.labels()
+    planes = np.random.default_rng(seed).standard_normal((dim, bands * rows)).astype(vectors.dtype)
+    bits = (vectors @ planes > 0).reshape(n, bands, rows)
+    signatures = bits.astype(np.int64) @ (1 << np.arange(rows, dtype=np.int64))
+    for band in range(bands):
+        keys = signatures[:, band]
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        same_as_prev = np.r_[False, sorted_keys[1:] == sorted_keys[:-1]]
+        if not same_as_prev.any():
+            continue
+        starts = np.maximum.accumulate(np.where(same_as_prev, 0, np.arange(n)))
+        for partner in (order[starts], np.r_[order[0], order[:-1]]):
+            candidates = same_as_prev & (partner != order)
+            a, b = order[candidates], partner[candidates]
+            similar = np.einsum("ij,ij->i", vectors[a], vectors[b]) >= threshold
+            for i, j in zip(a[similar], b[similar]):
+                uf.union(int(i), int(j))
+    return uf.labels()
+
+
+def cluster_group(key: str, rows: List[Dict], threshold: float, min_size: int, **lsh) -> List[Dict]:
+    """对同一视频/评论者的评论聚类，返回大小不小于 min_size 的簇"""
+    if len(rows) < min_size:
+        return []
+    vectors = _normalize(np.asarray([r[VECTOR_FIELD] for r in rows], dtype=np.float32))
+    labels = lsh_labels(vectors, threshold, **lsh)
+    roots, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    clusters = []
+    for c in np.flatnonzero(sizes >= min_size):
+        members = np.flatnonzero(inverse == c)
+        centroid = _normalize(vectors[members].mean(axis=0, keepdims=True))[0]
+        representative = rows[members[int(np.argmax(vectors[members] @ centroid))]]
+        clusters.append({
+            "cluster_id": f"{key}:{representative['comment_id']}",
+            "key": key,
+            "size": len(members),
+            "authors": len({rows[i]["author_id"] for i in members}),
+            "representative": representative["content"],
+            "members": [rows[i]["comment_id"] for i in members],
+            "centroid": centroid,
+        })
+    return clusters
+
+
+def _iterate(collection, expr: str, output_fields: List[str], batch_size: int):
+    iterator = collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=output_fields)
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                return
+            yield rows
+    finally:
+        iterator.close()
+
+
+def cluster_collection(collection, scope: str = "video", expr: str = "", threshold: float = 0.95,
+                       min_size: int = 5, batch_size: int = 2000, **lsh) -> List[Dict]:
+    """先统计各分组的评论数，只逐组读取评论数不少于 min_size 的分组聚类，内存只与最大的一组有关"""
+    field = SCOPE_FIELDS[scope]
+    counts = Counter()
+    for rows in _iterate(collection, expr, [field], batch_size):
+        counts.update(row[field] for row in rows)
+    # 评论数不足 min_size 的分组不可能形成簇，不再读取向量
+    keys = [key for key, count in counts.items() if count >= min_size]
+    print(f"{collection.name}: {len(counts)} 个{'视频' if scope == 'video' else '评论者'}，"
+          f"其中 {len(keys)} 个不少于 {min_size} 条评论")
+
+    clusters = []
+    started = time.perf_counter()
+    for n, key in enumerate(sorted(keys), 1):
+        key_expr = f"{field} == {json.dumps(key, ensure_ascii=False)}"
+        group = [row for rows in _iterate(collection, f"({expr}) and {key_expr}" if expr else key_expr,
+                                          ["comment_id", "author_id", "content", VECTOR_FIELD], batch_size)
+                 for row in rows]
+        clusters.extend(cluster_group(str(key), group, threshold, min_size, **lsh))
+        print(f"\r已处理 {n}/{len(keys)} 组，发现 {len(clusters)} 个簇 ({time.perf_counter() - started:.0f}s)", end="")
+    print()
+    return clusters
+
+
+def write_clusters(clusters: List[Dict], output_dir: str, scope: str, threshold: float):
+    os.makedirs(output_dir, exist_ok=True)
+    clusters = sorted(clusters, key=lambda c: -c["size"])
+    with open(os.path.join(output_dir, "clusters.csv"), "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["cluster_id", scope, "size", "authors", "representative"])
+        writer.writerows([c["cluster_id"], c["key"], c["size"], c["authors"], c["representative"]] for c in clusters)
+    with open(os.path.join(output_dir, "members.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["cluster_id", "comment_id"])
+        writer.writerows([c["cluster_id"], m] for c in clusters for m in c["members"])
+    dim = len(clusters[0]["centroid"]) if clusters else 0
+    np.savez(
+        os.path.join(output_dir, "centroids.npz"),
+        cluster_ids=np.array([c["cluster_id"] for c in clusters], dtype=str),
+        representatives=np.array([c["representative"] for c in clusters], dtype=str),
+        centroids=np.array([c["centroid"] for c in clusters], dtype=np.float32).reshape(len(clusters), dim),
+        threshold=np.float32(threshold),
+    )
+
+
+class ClusterTagger:
+    """把新评论与已有簇中心比较，相似度达到阈值的记为该簇成员"""
+
+    def __init__(self, cluster_ids: Sequence[str], centroids: np.ndarray, threshold: float,
+                 collection_name: str, log_path: str = COMMENT_CLUSTER_TAGS):
+        self.cluster_ids = [str(c) for c in cluster_ids]
+        self.centroids = centroids
+        self.threshold = threshold
+        self.collection_name = collection_name
+        self.log_path = log_path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, collection_name: str) -> "ClusterTagger":
+        data = np.load(path)
+        return cls(data["cluster_ids"], data["centroids"], float(data["threshold"]), collection_name)
+
+    def tag(self, vectors) -> List[Optional[str]]:
+        """返回每条评论命中的簇 ID，未命中为 None"""
+        if not len(self.cluster_ids):
+            return [None] * len(vectors)
+        similarity = _normalize(np.asarray(vectors, dtype=np.float32)) @ self.centroids.T
+        best = similarity.argmax(axis=1)
+        hit = similarity[np.arange(len(best)), best] >= self.threshold
+        return [self.cluster_ids[b] if h else None for b, h in zip(best, hit)]
+
+    def tag_batch(self, columns: Dict[str, List], vectors) -> int:
+        """给一个写入批次打标，命中的评论追加到日志文件，返回命中条数"""
+        tags = self.tag(vectors)
+        hits = [
+            {"collection": self.collection_name, "cluster_id": tag, "comment_id": columns["comment_id"][i],
+             "photo_id": columns["photo_id"][i], "author_id": columns["author_id"][i], "content": columns["content"][i]}
+            for i, tag in enumerate(tags) if tag
+        ]
+        if hits:
+            CLUSTER_TAGGED.inc(len(hits), collection=self.collection_name)
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(hit, ensure_ascii=False) + "\n" for hit in hits)
+        return len(hits)
+
+
+def load_tagger(collection_name: str) -> Optional[ClusterTagger]:
+    """设置了 COMMENT_CLUSTER_DIR 且存在该集合的簇中心时返回打标器"""
+    if not COMMENT_CLUSTER_DIR:
+        return None
+    path = os.path.join(COMMENT_CLUSTER_DIR, collection_name, "centroids.npz")
+    if not os.path.exists(path):
+        print(f"未找到 {path}，新评论不做聚类打标")
+        return None
+    tagger = ClusterTagger.load(path, collection_name)
+    print(f"已加载 {len(tagger.cluster_ids)} 个评论簇，新评论写入前打标")
+    return tagger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近重复 / 刷屏评论聚类")
+    parser.add_argument("collection", help="评论集合，如 douyin_comments / kuaishou_comments")
+    parser.add_argument("--scope", choices=list(SCOPE_FIELDS), default="video", help="按视频还是按评论者分组聚类")
+    parser.add_argument("--threshold", type=float, default=0.95, help="视为近重复的余弦相似度")
+    parser.add_argument("--min-size", type=int, default=5, help="输出的最小簇大小")
+    parser.add_argument("--bands", type=int, default=12, help="LSH band 数，越大召回越高")
+    parser.add_argument("--rows", type=int, default=12, help="每个 band 的超平面数，越大桶越小")
+    parser.add_argument("--video", action="append", default=[], help="只处理这些视频，可重复")
+    parser.add_argument("--hours", type=float, help="只处理最近 N 小时的评论")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--output", default="clusters", help="输出目录")
+    args = parser.parse_args()
+
+    since = int(time.time() - args.hours * 3600) if args.hours else None
+    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
+    try:
+        collection = Collection(args.collection)
+        collection.load()
+        check_time_filter(collection, since, None)
+        clusters = cluster_collection(collection, args.scope, filter_expr(args.video, None, since), args.threshold,
+                                      args.min_size, args.batch_size, bands=args.bands, rows=args.rows)
+        output_dir = os.path.join(args.output, args.collection)
+        write_clusters(clusters, output_dir, args.scope, args.threshold)
+        print(f"{len(clusters)} 个簇，共 {sum(c['size'] for c in clusters)} 条评论 -> {output_dir}")
+    finally:
+        connections.disconnect("default")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+评论集合的一次性清理工具。
+
+    python comment_dedupe.py dedupe kuaishou_comments
+        流式遍历旧版 (自增主键) 集合，同一 comment_id 只保留最后写入的一行，
+        在服务端删除其余行并触发 compaction 回收空间。
+
+    python comment_dedupe.py migrate douyin_comments douyin_comments_v2
+        把旧版集合流式复制到以 "平台:comment_id" 为主键的新集合 (upsert，自动去重)，
+        time 字符串同时转成 Unix 秒；完成后可用 --swap 把新集合改名为原名，旧集合保留为 <原名>_legacy。
+"""
+import os
+import argparse
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from pymilvus import connections, Collection, utility
+
+from comment_schema import COMMENT_FIELDS, PK_FIELD, comment_pk, create_comment_collection, epoch_seconds, is_legacy
+
+load_dotenv()
+MILVUS_HOST = os.getenv("MILVUS_HOST", "localhost")
+MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
+
+PLATFORM_KEYS = {"douyin_comments": "douyin", "kuaishou_comments": "kuaishou"}
+
+
+def iterate(collection: Collection, output_fields: List[str], batch_size: int):
+    """按主键顺序分批遍历整个集合"""
+    iterator = collection.query_iterator(batch_size=batch_size, expr="", output_fields=output_fields)
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                return
+            yield rows
+    finally:
+        iterator.close()
+
+
+def dedupe(collection: Collection, batch_size: int = 1000, dry_run: bool = False) -> int:
+    """删除重复的评论行，返回删除数"""
+    if not is_legacy(collection.schema.fields):
+        print(f"{collection.name} 以评论 ID 为主键，不会有重复行")
+        return 0
+
+    # comment_id -> 目前保留的自增 id；遍历按 id 升序，重复时删除先前保留的较早的行
+    kept: Dict[int, int] = {}
+    pending: List[int] = []
+    scanned = deleted = 0
+
+    def delete_pending():
+        nonlocal deleted
+        if pending and not dry_run:
+            collection.delete(f"id in {pending}")
+        deleted += len(pending)
+        pending.clear()
+
+    for rows in iterate(collection, ["comment_id"], batch_size):
+        for row in rows:
+            previous = kept.get(row["comment_id"])
+            kept[row["comment_id"]] = row["id"]
+            if previous is not None:
+                pending.append(previous)
+        scanned += len(rows)
+        if len(pending) >= batch_size:
+            delete_pending()
+        print(f"\r已扫描 {scanned} 行，重复 {deleted + len(pending)} 行", end="")
+    delete_pending()
+    print(f"\n{collection.name}: {scanned} 行中有 {deleted} 行重复" + ("(未删除，--dry-run)" if dry_run else "，已删除"))
+
+    if deleted and not dry_run:
+        collection.flush()
+        print("开始 compaction...")
+        collection.compact()
+        collection.wait_for_compaction_completed()
+        print("compaction 完成")
+    return deleted
+
+
+def migrate(source: Collection, target_name: str, platform_key: str, batch_size: int = 1000) -> int:
+    """把旧版集合复制到新 schema 的集合，返回写入行数"""
+    if utility.has_collection(target_name):
+        target = Collection(target_name)
+        if is_legacy(target.schema.fields):
+            raise ValueError(f"目标集合 {target_name} 不是以评论 ID 为主键的新 schema")
+    else:
+        target = create_comment_collection(target_name, source.description)
+        print(f"创建集合: {target_name}")
+
+    target_fields = [f.name for f in COMMENT_FIELDS]
+    source_fields = [f.name for f in source.schema.fields if not f.is_primary]
+    written = 0
+    for rows in iterate(source, source_fields, batch_size):
+        for row in rows:
+            row[PK_FIELD] = comment_pk(platform_key, row["comment_id"])
+            row["time"] = epoch_seconds(row.get("time"))
+        target.upsert([[row[name] for row in rows] for name in target_fields])
+        written += len(rows)
+        print(f"\r已复制 {written} 行", end="")
+    target.flush()
+    print(f"\n{source.name} -> {target_name}: 复制 {written} 行，去重后共 {target.num_entities} 行")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评论集合去重与迁移")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_dedupe = sub.add_parser("dedupe", help="删除旧版集合中的重复评论并 compaction")
+    p_dedupe.add_argument("collection")
+    p_dedupe.add_argument("--dry-run", action="store_true", help="只统计，不删除")
+
+    p_migrate = sub.add_parser("migrate", help="迁移到以评论 ID 为主键的新集合")
+    p_migrate.add_argument("collection")
+    p_migrate.add_argument("target")
+    p_migrate.add_argument("--platform", choices=["douyin", "kuaishou"], help="主键前缀 (默认按集合名推断)")
+    p_migrate.add_argument("--swap", action="store_true", help="完成后把旧集合改名为 <原名>_legacy，新集合改为原名")
+
+    for p in (p_dedupe, p_migrate):
+        p.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
+    try:
+        collection = Collection(args.collection)
+        collection.load()
+        if args.command == "dedupe":
+            dedupe(collection, args.batch_size, args.dry_run)
+            return
+
+        platform_key = args.platform or PLATFORM_KEYS.get(args.collection)
+        if not platform_key:
+            parser.error("无法从集合名推断平台，请指定 --platform")
+        migrate(collection, args.target, platform_key, args.batch_size)
+        if args.swap:
+            utility.rename_collection(args.collection, f"{args.collection}_legacy")
+            utility.rename_collection(args.target, args.collection)
+            print(f"已切换: {args.target} -> {args.collection}，旧集合保留为 {args.collection}_legacy")
+    finally:
+        connections.disconnect("default")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+多视频评论抓取调度：K 个视频并发抓取，每个视频由同一个任务按页顺序抓取和写入，
+所有视频的请求共用一个令牌桶限速，避免并发后超出 API 配额。
+"""
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Optional, Sequence, TypeVar
+
+from metrics import QUEUE_DEPTH
+
+T = TypeVar("T")
+
+# 同时抓取的视频数和全局请求速率 (次/秒，<= 0 表示不限速)
+COMMENT_CONCURRENCY = int(os.getenv("COMMENT_CONCURRENCY", "8"))
+COMMENT_RATE_LIMIT = float(os.getenv("COMMENT_RATE_LIMIT", "10"))
+
+
+class RateLimiter:
+    """令牌桶：平均每秒 rate 次，最多突发 burst 次"""
+
+    def __init__(self, rate: float = COMMENT_RATE_LIMIT, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # 排队等待，先到先得
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def crawl_videos(videos: Sequence[T], crawl_one: Callable[[T], Awaitable[None]],
+                       concurrency: int = COMMENT_CONCURRENCY, queue_name: str = "comments:videos"):
+    """用 concurrency 个工作任务依次取出视频并调用 crawl_one，单个视频出错不影响其他视频"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for video in videos:
+        queue.put_nowait(video)
+    QUEUE_DEPTH.set(queue.qsize(), queue=queue_name)
+
+    async def worker():
+        while True:
+            try:
+                video = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            QUEUE_DEPTH.set(queue.qsize(), queue=queue_name)
+            try:
+                await crawl_one(video)
+            except Exception as e:
+                print(f"抓取 {video} 时出错: {str(e)}")
+
+    workers = max(1, min(concurrency, len(videos)))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    QUEUE_DEPTH.set(0, queue=queue_name)
+
+
+def add_scheduler_arguments(parser):
+    """为评论抓取脚本添加并发和限速参数"""
+    parser.add_argument("--concurrency", type=int, default=COMMENT_CONCURRENCY,
+                        help="同时抓取的视频数 (默认读取 COMMENT_CONCURRENCY，为 8)")
+    parser.add_argument("--rate", type=float, default=COMMENT_RATE_LIMIT,
+                        help="所有视频共享的请求速率上限，次/秒 (默认读取 COMMENT_RATE_LIMIT，为 10)")
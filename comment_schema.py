@@ -0,0 +1,109 @@
+"""
+抖音/快手评论集合的 schema。
+
+主键 pk 为 "平台:comment_id" (如 "douyin:7301234567890123456")，写入使用 upsert，
+重试或重复抓取同一条评论只会覆盖原有的行。
+旧版集合以自增 id 为主键，无法 upsert，写入时退回为按 comment_id 先删后插；
+可用 comment_dedupe.py 清理其中的重复行或迁移到新 schema。
+
+time 为 Unix 秒 (INT64)，time、photo_id、author_id 建有标量索引，
+按视频、作者和时间窗口的过滤在 Milvus 服务端完成 (见 comment_search.py)。
+旧版集合的 time 为字符串，只能通过迁移获得时间过滤能力。
+"""
+import time
+from typing import Any, List
+
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema
+
+PK_FIELD = "pk"
+VECTOR_FIELD = "content_vector"
+
+COMMENT_FIELDS = [
+    FieldSchema(name=PK_FIELD, dtype=DataType.VARCHAR, max_length=64, is_primary=True, auto_id=False),
+    FieldSchema(name="comment_id", dtype=DataType.INT64),
+    FieldSchema(name="photo_id", dtype=DataType.VARCHAR, max_length=200),
+    FieldSchema(name="author_name", dtype=DataType.VARCHAR, max_length=200),
+    FieldSchema(name="author_id", dtype=DataType.INT64),
+    FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=2000),
+    FieldSchema(name=VECTOR_FIELD, dtype=DataType.FLOAT_VECTOR, dim=384),
+    FieldSchema(name="time", dtype=DataType.INT64),
+    FieldSchema(name="likes", dtype=DataType.INT64),
+    FieldSchema(name="area", dtype=DataType.VARCHAR, max_length=100),
+    FieldSchema(name="is_reply", dtype=DataType.BOOL),
+    FieldSchema(name="video_author_id", dtype=DataType.VARCHAR, max_length=200),
+    FieldSchema(name="video_author_name", dtype=DataType.VARCHAR, max_length=200)
+]
+
+INDEX_PARAMS = {
+    "metric_type": "L2",
+    "index_type": "IVF_FLAT",
+    "params": {"nlist": 1024}
+}
+
+# 过滤常用的标量字段；数值字段用排序索引，字符串字段用倒排索引
+SCALAR_INDEX_FIELDS = ["time", "photo_id", "author_id"]
+
+# 平台接口返回的时间字符串格式
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def comment_pk(platform_key: str, comment_id: Any) -> str:
+    return f"{platform_key}:{comment_id}"
+
+
+def epoch_seconds(value: Any) -> int:
+    """把秒或毫秒时间戳、"YYYY-MM-DD HH:MM" 形式的本地时间转成 Unix 秒，无法识别时为 0"""
+    if value is None or isinstance(value, bool):
+        return 0
+    text = str(value).strip()
+    if isinstance(value, (int, float)) or text.isdigit():
+        seconds = int(float(value))
+        # 毫秒时间戳
+        return seconds // 1000 if seconds > 10 ** 11 else seconds
+    for fmt in TIME_FORMATS:
+        try:
+            return int(time.mktime(time.strptime(text, fmt)))
+        except ValueError:
+            continue
+    return 0
+
+
+def collection_fields(collection) -> List[FieldSchema]:
+    """集合实际使用的字段；拿不到 schema 的对象 (如基准测试的计数集合) 按新 schema 处理"""
+    try:
+        return list(collection.schema.fields)
+    except AttributeError:
+        return COMMENT_FIELDS
+
+
+def is_legacy(fields: List[FieldSchema]) -> bool:
+    """是否为自增主键的旧版集合"""
+    return any(f.is_primary and f.auto_id for f in fields)
+
+
+def has_epoch_time(fields: List[FieldSchema]) -> bool:
+    """time 是否为 Unix 秒，旧版集合为字符串，不能按时间范围过滤"""
+    return any(f.name == "time" and f.dtype == DataType.INT64 for f in fields)
+
+
+def ensure_scalar_indexes(collection: Collection):
+    """为过滤字段补建标量索引 (已存在的跳过)，需在 load 之前调用"""
+    fields = {f.name: f for f in collection.schema.fields}
+    for name in SCALAR_INDEX_FIELDS:
+        field = fields.get(name)
+        index_name = f"{name}_index"
+        if field is None or collection.has_index(index_name=index_name):
+            continue
+        index_type = "INVERTED" if field.dtype == DataType.VARCHAR else "STL_SORT"
+        try:
+            collection.create_index(field_name=name, index_name=index_name, index_params={"index_type": index_type})
+            print(f"为 {collection.name}.{name} 创建 {index_type} 索引")
+        except Exception as e:
+            print(f"为 {collection.name}.{name} 创建索引失败，按该字段过滤将退回全量扫描 ({str(e)[:100]})")
+
+
+def create_comment_collection(name: str, description: str) -> Collection:
+    collection = Collection(name=name, schema=CollectionSchema(COMMENT_FIELDS, description=description))
+    collection.create_index(field_name=VECTOR_FIELD, index_params=INDEX_PARAMS)
+    ensure_scalar_indexes(collection)
+    return collection
@@ -0,0 +1,116 @@
+"""
+按视频、作者和时间窗口过滤评论，过滤在 Milvus 服务端完成 (走标量索引)。
+
+    python comment_search.py douyin_comments --video 7301234567890123456 --hours 24
+        列出该视频最近 24 小时的评论
+    python comment_search.py kuaishou_comments "太好笑了" --author 2451236789 --since "2024-01-01"
+        在该作者 2024 年以来的评论中做语义搜索
+"""
+import os
+import json
+import time
+import argparse
+from typing import Iterable, List, Optional
+
+from dotenv import load_dotenv
+from pymilvus import connections, Collection
+
+from comment_schema import VECTOR_FIELD, epoch_seconds, has_epoch_time
+
+load_dotenv()
+MILVUS_HOST = os.getenv("MILVUS_HOST", "localhost")
+MILVUS_PORT = os.getenv("MILVUS_PORT", "19530")
+
+OUTPUT_FIELDS = ["comment_id", "photo_id", "author_name", "author_id", "content", "time", "likes", "area", "is_reply"]
+
+
+def filter_expr(photo_ids: Optional[Iterable[str]] = None, author_ids: Optional[Iterable[int]] = None,
+                since: Optional[int] = None, until: Optional[int] = None) -> str:
+    """由过滤条件拼出 Milvus 布尔表达式，since/until 为 Unix 秒 (含 since，不含 until)"""
+    clauses = []
+    if photo_ids:
+        clauses.append(f"photo_id in {json.dumps([str(p) for p in photo_ids], ensure_ascii=False)}")
+    if author_ids:
+        clauses.append(f"author_id in {[int(a) for a in author_ids]}")
+    if since:
+        clauses.append(f"time >= {int(since)}")
+    if until:
+        clauses.append(f"time < {int(until)}")
+    return " and ".join(clauses)
+
+
+def check_time_filter(collection: Collection, since: Optional[int], until: Optional[int]):
+    """旧版集合的 time 为字符串，带时间条件时直接报错，避免返回错误的结果"""
+    if (since or until) and not has_epoch_time(collection.schema.fields):
+        raise ValueError(f"{collection.name} 的 time 字段为字符串，不支持按时间过滤；"
+                         f"请先用 comment_dedupe.py migrate 迁移到新 schema")
+
+
+def query_comments(collection: Collection, photo_ids=None, author_ids=None, since: Optional[int] = None,
+                   until: Optional[int] = None, limit: int = 100, output_fields: List[str] = OUTPUT_FIELDS):
+    """返回满足过滤条件的评论"""
+    check_time_filter(collection, since, until)
+    expr = filter_expr(photo_ids, author_ids, since, until)
+    return collection.query(expr=expr, output_fields=output_fields, limit=limit)
+
+
+def search_comments(collection: Collection, model, text: str, photo_ids=None, author_ids=None,
+                    since: Optional[int] = None, until: Optional[int] = None, limit: int = 10,
+                    output_fields: List[str] = OUTPUT_FIELDS):
+    """在满足过滤条件的评论中按语义相似度搜索 text，返回 (距离, 评论) 列表"""
+    check_time_filter(collection, since, until)
+    expr = filter_expr(photo_ids, author_ids, since, until)
+    vector = model.encode([text], show_progress_bar=False).tolist()
+    results = collection.search(
+        data=vector,
+        anns_field=VECTOR_FIELD,
+        param={"metric_type": "L2", "params": {"nprobe": 16}},
+        limit=limit,
+        expr=expr or None,
+        output_fields=output_fields,
+    )
+    return [(hit.distance, {name: hit.entity.get(name) for name in output_fields}) for hit in results[0]]
+
+
+def format_comment(comment) -> str:
+    created = time.strftime("%Y-%m-%d %H:%M", time.localtime(comment["time"])) if isinstance(comment["time"], int) else comment["time"]
+    prefix = "  ↳ " if comment.get("is_reply") else ""
+    return f"{prefix}[{created}] {comment['author_name']} ({comment['likes']} 赞, {comment['area']}): {comment['content']}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按视频、作者和时间窗口查询评论")
+    parser.add_argument("collection", help="评论集合，如 douyin_comments / kuaishou_comments")
+    parser.add_argument("text", nargs="?", help="语义搜索的文本，省略时只按条件列出评论")
+    parser.add_argument("--video", action="append", default=[], help="视频 ID，可重复")
+    parser.add_argument("--author", action="append", default=[], type=int, help="评论者 ID，可重复")
+    parser.add_argument("--hours", type=float, help="只看最近 N 小时的评论")
+    parser.add_argument("--since", help="起始时间 (Unix 秒或 YYYY-MM-DD [HH:MM])")
+    parser.add_argument("--until", help="结束时间 (不含)")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600 if args.hours else epoch_seconds(args.since) or None
+    until = epoch_seconds(args.until) or None
+
+    connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
+    try:
+        collection = Collection(args.collection)
+        collection.load()
+        if args.text:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer('all-MiniLM-L6-v2')
+            hits = search_comments(collection, model, args.text, args.video, args.author, since, until, args.limit)
+            for distance, comment in hits:
+                print(f"{distance:.4f} {format_comment(comment)}")
+        else:
+            comments = query_comments(collection, args.video, args.author, since, until, args.limit)
+            for comment in sorted(comments, key=lambda c: c["time"], reverse=True):
+                print(format_comment(comment))
+        print(f"\n共 {len(hits) if args.text else len(comments)} 条")
+    finally:
+        connections.disconnect("default")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+评论抓取进度清单 (SQLite)：每个视频一行，记录状态、可续抓的游标和已写入条数。
+
+    pending   已登记，尚未抓取
+    partial   抓到一半，cursor 为下一页的游标，重启后从这里继续
+    complete  全部分页已写入
+
+启动时只需按平台读出所有视频的状态 (与视频数成正比)，不再从 Milvus 查询全部评论。
+另外记录每个视频已写入的最新评论 (newest_time / newest_comment_id)。增量刷新时用 comments_stored
+检查每页评论是否都已写入集合，连续 INCREMENTAL_KNOWN_PAGES 页都是已知评论就停止。
+"""
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+CRAWL_MANIFEST_FILE = os.getenv("CRAWL_MANIFEST_FILE", "crawl_manifest.sqlite3")
+
+# 增量刷新在连续多少页评论都已写入集合时停止 (接口先列热门评论，首页常全是旧评论)
+INCREMENTAL_KNOWN_PAGES = int(os.getenv("COMMENT_INCREMENTAL_KNOWN_PAGES", "2"))
+
+PENDING = "pending"
+PARTIAL = "partial"
+COMPLETE = "complete"
+
+# (评论时间戳秒, 评论 ID)
+Newest = Tuple[int, str]
+
+
+class VideoState(NamedTuple):
+    status: str
+    cursor: str
+    pages: int
+    comments: int
+    newest_time: int
+    newest_comment_id: str
+
+    @property
+    def newest(self) -> Optional[Newest]:
+        return (self.newest_time, self.newest_comment_id) if self.newest_time else None
+
+
+class CrawlManifest:
+    def __init__(self, path: str = CRAWL_MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS videos (
+                platform TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                cursor TEXT NOT NULL DEFAULT '',
+                pages INTEGER NOT NULL DEFAULT 0,
+                comments INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                newest_time INTEGER NOT NULL DEFAULT 0,
+                newest_comment_id TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (platform, video_id)
+            )"""
+        )
+        # 旧版本清单没有最新评论列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(videos)")}
+        if "newest_time" not in columns:
+            self._conn.execute("ALTER TABLE videos ADD COLUMN newest_time INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("ALTER TABLE videos ADD COLUMN newest_comment_id TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_status ON videos (platform, status)")
+
+    def states(self, platform: str) -> Dict[str, VideoState]:
+        """返回该平台所有已登记视频的状态"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id, status, cursor, pages, comments, newest_time, newest_comment_id "
+                "FROM videos WHERE platform = ?", (platform,)
+            ).fetchall()
+        return {row[0]: VideoState(*row[1:]) for row in rows}
+
+    def get(self, platform: str, video_id: str) -> Optional[VideoState]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, cursor, pages, comments, newest_time, newest_comment_id "
+                "FROM videos WHERE platform = ? AND video_id = ?",
+                (platform, video_id),
+            ).fetchone()
+        return VideoState(*row) if row else None
+
+    def register(self, platform: str, video_ids: Iterable[str], status: str = PENDING) -> int:
+        """登记新视频 (已登记的保持原状态)，返回新增数"""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO videos (platform, video_id, status, updated_at) VALUES (?, ?, ?, ?)",
+                ((platform, video_id, status, now) for video_id in video_ids),
+            )
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def save_progress(self, platform: str, video_id: str, cursor: str, pages: int, comments: int,
+                      newest: Optional[Newest] = None):
+        """累加本次新写入的 pages 页、comments 条评论，下一页从 cursor 开始"""
+        self._upsert(platform, video_id, PARTIAL, cursor, pages, comments, newest)
+
+    def mark_complete(self, platform: str, video_id: str, pages: int = 0, comments: int = 0,
+                      newest: Optional[Newest] = None):
+        self._upsert(platform, video_id, COMPLETE, "", pages, comments, newest)
+
+    def _upsert(self, platform: str, video_id: str, status: str, cursor: str, pages: int, comments: int,
+                newest: Optional[Newest]):
+        newest_time, newest_comment_id = newest or (0, "")
+        with self._lock:
+            # 最新评论只前进不后退
+            self._conn.execute(
+                """INSERT INTO videos (platform, video_id, status, cursor, pages, comments, updated_at,
+                                       newest_time, newest_comment_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (platform, video_id) DO UPDATE SET
+                       status = excluded.status,
+                       cursor = excluded.cursor,
+                       pages = videos.pages + excluded.pages,
+                       comments = videos.comments + excluded.comments,
+                       updated_at = excluded.updated_at,
+                       newest_comment_id = CASE WHEN excluded.newest_time > videos.newest_time
+                                                THEN excluded.newest_comment_id ELSE videos.newest_comment_id END,
+                       newest_time = MAX(videos.newest_time, excluded.newest_time)""",
+                (platform, video_id, status, cursor, pages, comments, time.time(), newest_time, newest_comment_id),
+            )
+
+    def counts(self, platform: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM videos WHERE platform = ? GROUP BY status", (platform,)
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def seed_from_collection(manifest: CrawlManifest, platform: str, collection, batch_size: int = 1000) -> int:
+    """一次性迁移：把 Milvus 中已有评论的视频登记为 complete，返回登记数"""
+    video_ids = set()
+    iterator = collection.query_iterator(batch_size=batch_size, expr="photo_id != ''", output_fields=["photo_id"])
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            video_ids.update(row["photo_id"] for row in rows)
+    finally:
+        iterator.close()
+    return manifest.register(platform, video_ids, status=COMPLETE)
+
+
+def comments_stored(collection, photo_id: str, comments: Sequence[Tuple[int, int]],
+                    since: Optional[Newest] = None) -> bool:
+    """一页评论 ((时间, comment_id) 列表) 是否都已写入集合。
+
+    晚于 since (上次记录的最新评论的时间和 ID) 的评论必然是新的，不必查询；其余按 comment_id 在该视频内查询。
+    查询失败时按未写入处理，增量刷新继续翻页。
+    """
+    if since and any((time_, str(comment_id)) > tuple(since) for time_, comment_id in comments):
+        return False
+    ids = sorted({int(comment_id) for _, comment_id in comments if comment_id})
+    if not ids:
+        return False
+    try:
+        rows = collection.query(expr=f'photo_id == "{photo_id}" and comment_id in {ids}', output_fields=["comment_id"])
+    except Exception as e:
+        print(f"查询已写入的评论失败 ({str(e)[:100]})")
+        return False
+    return {int(row["comment_id"]) for row in rows} >= set(ids)
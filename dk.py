@@ -3,12 +3,21 @@ import asyncio
 import httpx
 import json
 import urllib.parse
+import argparse
 from typing import List, Dict, Tuple, Optional
 from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType, utility, MilvusException
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 from tqdm import tqdm  # 添加到文件开头的导入部分
 
+from resilience import Resilience, DeadLetterQueue, FetchError, ResponseError
+from response_cache import RESPONSE_CACHE, CacheMiss
+from profiling import PROFILER, add_profile_arguments, enable_from_args
+from metrics import (
+    start_metrics_server, timed_request, QUEUE_DEPTH, EMBED_BATCH_SIZE, EMBED_SECONDS,
+    INSERT_BATCH_SIZE, INSERT_SECONDS, ROWS_INSERTED,
+)
+
 # 加载 .env 文件
 load_dotenv()
 
@@ -37,17 +46,21 @@ if DOUYIN_API_URL == "INVALID_URL" or KUAISHOU_API_URL == "INVALID_URL":
 # 初始化 SentenceTransformer 模型
 model = SentenceTransformer('all-MiniLM-L6-v2')
 
+# 请求重试/熔断与死信记录
+RESILIENCE = Resilience()
+DEAD_LETTERS = DeadLetterQueue()
+
 # 初始化 Milvus 数据库
-async def init_milvus() -> Optional[Collection]:
+async def init_milvus(collection_name: str = "user_data") -> Optional[Collection]:
     try:
         print(f"尝试连接Milvus: {MILVUS_HOST}:{MILVUS_PORT}")
         connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
         print("Milvus连接成功")
 
         # 检查是否存在旧集合
-        if "user_data" in utility.list_collections():
+        if collection_name in utility.list_collections():
             print("检测到现有集合，继续使用...")
-            collection = Collection("user_data")
+            collection = Collection(collection_name)
             return collection
 
         # 如果不存在，创建新集合
@@ -59,8 +72,8 @@ async def init_milvus() -> Optional[Collection]:
         ]
         schema = CollectionSchema(fields, "用户数据集合")
         
-        print("创建新集合 'user_data'")
-        collection = Collection("user_data", schema)
+        print(f"创建新集合 '{collection_name}'")
+        collection = Collection(collection_name, schema)
         
         # 创建索引
         index_params = {
@@ -77,7 +90,7 @@ async def init_milvus() -> Optional[Collection]:
         return None
 
 async def fetch_data(api_url: str, keyword: str, cursor: str, platform: str) -> Tuple[List[Dict], str]:
-    """从 API 获取数据"""
+    """从 API 获取数据，请求或解析失败时抛出异常"""
     headers = {
         "Authorization": f"Bearer {API_KEY}",
         "Accept": "application/json",
@@ -100,15 +113,32 @@ async def fetch_data(api_url: str, keyword: str, cursor: str, platform: str) ->
         try:
             if platform == "快手":
                 encoded_keyword = urllib.parse.quote(params["keyword"])
-                api_url = f"{api_url}?keyword={encoded_keyword}&page={params['page']}"
-                response = await client.get(api_url, headers=headers, timeout=60)
-                data = response.json()
+                request_url = f"{api_url}?keyword={encoded_keyword}&page={params['page']}"
+
+                async def request_page():
+                    with PROFILER.stage("fetch"):
+                        response = await client.get(request_url, headers=headers, timeout=60)
+                    response.raise_for_status()
+                    with PROFILER.stage("parse"):
+                        return response.json()
+
+                data = await RESPONSE_CACHE.fetch(api_url, params, timed_request(f"{platform}:search", request_page))
                 
                 # 添加调试输出
                 print(f"\n快手API返回数据结构: {json.dumps(data, ensure_ascii=False)[:200]}...")
                 
-                if data.get("data", {}).get("mixFeeds"):
-                    mix_feeds = data.get("data", {}).get("mixFeeds", [])
+                # 错误响应体或结构异常时抛出，由重试层重试并在耗尽后写入死信，不当作分页结束；
+                # result 字段不一定返回，只有返回了且不为 1 时才算错误
+                inner = data.get("data")
+                if (not isinstance(inner, dict) or inner.get("result", 1) != 1
+                        or not isinstance(inner.get("mixFeeds"), list)):
+                    raise ResponseError(
+                        f"快手API返回错误或数据结构不符合预期: {json.dumps(data, ensure_ascii=False)[:200]}",
+                        f"{platform}:search",
+                    )
+                mix_feeds = inner["mixFeeds"]
+                # extract 阶段只包含从响应中提取用户字段
+                with PROFILER.stage("extract"):
                     users = []
                     for feed in mix_feeds:
                         if isinstance(feed, dict):
@@ -123,46 +153,55 @@ async def fetch_data(api_url: str, keyword: str, cursor: str, platform: str) ->
                                 }
                                 if user_data["name"] and user_data["uid"]:
                                     users.append(user_data)
-                    
-                    # 添加调试输出
-                    if not users:
-                        print(f"未能从数据中提取到用户信息，原始数据结构: {json.dumps(mix_feeds[:1], ensure_ascii=False)}")
-                    
-                    next_cursor = str(int(params["page"]) + 1)
-                    next_cursor = "" if not users else next_cursor
-                    return users, next_cursor
-                else:
-                    print(f"快手API返回数据结构不符合预期: {json.dumps(data.get('data', {}), ensure_ascii=False)[:200]}...")
-                    return [], ""
+                
+                # 添加调试输出
+                if not users:
+                    print(f"未能从数据中提取到用户信息，原始数据结构: {json.dumps(mix_feeds[:1], ensure_ascii=False)}")
+                
+                next_cursor = str(int(params["page"]) + 1)
+                next_cursor = "" if not users else next_cursor
+                return users, next_cursor
             else:
-                response = await client.get(api_url, headers=headers, params=params, timeout=60)
-                data = response.json()
-                # 移除详细的数据打印
-                print(f"请求 URL: {response.url}")
-                print(f"请求参数: {params}")
-                response.raise_for_status()
-                data = response.json()
+                async def request_page():
+                    with PROFILER.stage("fetch"):
+                        response = await client.get(api_url, headers=headers, params=params, timeout=60)
+                    # 移除详细的数据打印
+                    print(f"请求 URL: {response.url}")
+                    print(f"请求参数: {params}")
+                    response.raise_for_status()
+                    with PROFILER.stage("parse"):
+                        return response.json()
+
+                data = await RESPONSE_CACHE.fetch(api_url, params, timed_request(f"{platform}:search", request_page))
                 print(f"{platform} API返回数据: {data}")  # 添加调试输出
 
             if platform == "抖音":
                 # 修改数据解析逻辑
-                if data.get("data", {}).get("data", {}).get("user_list"):  # 注意这里改变了路径
-                    users = data.get("data", {}).get("data", {}).get("user_list", [])
-                    next_cursor = str(data.get("data", {}).get("data", {}).get("cursor", ""))
+                inner = (data.get("data") or {}).get("data")  # 注意这里改变了路径
+                if not isinstance(inner, dict) or not isinstance(inner.get("user_list"), list):
+                    raise ResponseError(
+                        f"抖音API返回错误或数据结构不符合预期: {json.dumps(data, ensure_ascii=False)[:200]}",
+                        f"{platform}:search",
+                    )
+                # user_list 为空表示没有更多结果
+                if inner["user_list"]:
+                    users = inner["user_list"]
+                    next_cursor = str(inner.get("cursor", ""))
                     
-                    extracted_users = [
-                        {
-                            "name": user.get("nick_name", ""),
-                            "uid": user.get("user_id", ""),
-                            "description": "",
-                            "following": 0,
-                            "followers": user.get("fans_cnt", 0)
-                        }
-                        for user in users
-                    ]
+                    with PROFILER.stage("extract"):
+                        extracted_users = [
+                            {
+                                "name": user.get("nick_name", ""),
+                                "uid": user.get("user_id", ""),
+                                "description": "",
+                                "following": 0,
+                                "followers": user.get("fans_cnt", 0)
+                            }
+                            for user in users
+                        ]
                     return extracted_users, next_cursor
                 else:
-                    print(f"抖音API返回数据为空 (实际数据结构: {data.keys()})")
+                    print("抖音API没有更多结果")
                     return [], ""
 
             elif platform == "快手":
@@ -170,41 +209,85 @@ async def fetch_data(api_url: str, keyword: str, cursor: str, platform: str) ->
                     users = data.get("users", [])
                     next_cursor = data.get("pcursor", "")
                     
-                    extracted_users = [
-                        {
-                            "name": user.get("user_name", ""),  # 直接从根对象获取
-                            "uid": user.get("user_id", ""),
-                            "description": user.get("user_text", ""),  # 改用 user_text
-                            "following": 0,  # 这些字段在返回数据中没有
-                            "followers": user.get("fansCount", 0)  # 使用 fansCount
-                        }
-                        for user in users
-                    ]
+                    with PROFILER.stage("extract"):
+                        extracted_users = [
+                            {
+                                "name": user.get("user_name", ""),  # 直接从根对象获取
+                                "uid": user.get("user_id", ""),
+                                "description": user.get("user_text", ""),  # 改用 user_text
+                                "following": 0,  # 这些字段在返回数据中没有
+                                "followers": user.get("fansCount", 0)  # 使用 fansCount
+                            }
+                            for user in users
+                        ]
                     # 检查是否还有更多数据
                     next_cursor = "" if data.get("recoPcursor") == "no_more" else next_cursor
                     return extracted_users, next_cursor
                 else:
-                    print(f"快手API返回错误: {data}")
-                    return [], ""
+                    raise ResponseError(f"快手API返回错误: {json.dumps(data, ensure_ascii=False)[:200]}",
+                                        f"{platform}:search")
 
-            return [], ""
+            raise ValueError(f"不支持的平台: {platform}")
 
         except Exception as e:
+            # 交给调用方的重试/熔断层处理，避免把一次超时当成分页结束
             print(f"获取数据时发生错误 ({platform}, 关键词: {keyword}): {e}")
-            return [], ""
+            raise
 
 
 async def vectorize_data(users: List[Dict]) -> List[List[float]]:
     """将用户名向量化"""
     names = [user.get('name', '') for user in users]
     try:
-        vectors = model.encode(names).tolist()
+        EMBED_BATCH_SIZE.observe(len(names), source="dk")
+        with EMBED_SECONDS.time(source="dk"), PROFILER.stage("encode"):
+            vectors = model.encode(names).tolist()
         return vectors
     except Exception as e:
         print(f"向量化时出错: {e}")
         return []
 
 
+async def crawl_keyword(collection: Collection, platform: str, api_url: str, keyword: str, cursor: str = "0") -> int:
+    """从 cursor 开始抓取一个关键词的全部分页，返回插入条数。
+
+    请求在重试耗尽或熔断时，把当前 (关键词, 游标) 写入死信，而不是当作抓取完成。
+    """
+    keyword_total = 0
+    while cursor:
+        try:
+            users, next_cursor = await RESILIENCE.call(
+                f"{platform}:search",
+                lambda: fetch_data(api_url, keyword, cursor, platform),
+            )
+        except FetchError as e:
+            if isinstance(e.__cause__, CacheMiss):
+                # 离线回放只处理已缓存的分页，未命中不算失败
+                print(f"\n{keyword}: cursor={cursor} 未缓存，回放结束")
+                break
+            print(f"\n× {keyword}: 在 cursor={cursor} 处抓取失败 ({e.kind})")
+            DEAD_LETTERS.add(platform, keyword, cursor, e)
+            break
+        if users:
+            vectors = await vectorize_data(users)
+            if vectors:
+                insert_data = [
+                    vectors,
+                    [json.dumps(user, ensure_ascii=False) for user in users],
+                    [keyword] * len(users)
+                ]
+                try:
+                    INSERT_BATCH_SIZE.observe(len(users), collection="user_data")
+                    with INSERT_SECONDS.time(collection="user_data"), PROFILER.stage("insert"):
+                        mr = collection.insert(insert_data)
+                    keyword_total += len(mr.primary_keys)
+                    ROWS_INSERTED.inc(len(mr.primary_keys), platform=platform, collection="user_data")
+                except Exception as e:
+                    print(f"\n插入数据时出错 ({platform}, {keyword}): {str(e)[:100]}...")
+        cursor = next_cursor
+    return keyword_total
+
+
 async def process_platform(collection: Collection, platform: str, api_url: str, filename: str):
     try:
         print(f"\n开始处理 {platform} 平台数据...")
@@ -218,41 +301,57 @@ async def process_platform(collection: Collection, platform: str, api_url: str,
         print(f"读取到 {len(keywords)} 个关键词")
         
         total_inserted = 0
-        for keyword in tqdm(keywords, desc=f"{platform}关键词处理"):
-            cursor = "0"
-            keyword_total = 0
-            
-            while cursor:
-                users, cursor = await fetch_data(api_url, keyword, cursor, platform)
-                if users:
-                    vectors = await vectorize_data(users)
-                    if vectors:
-                        insert_data = [
-                            vectors,
-                            [json.dumps(user, ensure_ascii=False) for user in users],
-                            [keyword] * len(users)
-                        ]
-                        try:
-                            mr = collection.insert(insert_data)
-                            keyword_total += len(mr.primary_keys)
-                            total_inserted += len(mr.primary_keys)
-                        except Exception as e:
-                            print(f"\n插入数据时出错 ({platform}, {keyword}): {str(e)[:100]}...")
+        for index, keyword in enumerate(tqdm(keywords, desc=f"{platform}关键词处理")):
+            QUEUE_DEPTH.set(len(keywords) - index, queue=f"{platform}:keywords")
+            keyword_total = await crawl_keyword(collection, platform, api_url, keyword)
+            total_inserted += keyword_total
                 
             if keyword_total > 0:
                 print(f"\n√ {keyword}: 已插入 {keyword_total} 条数据")
                 
+        QUEUE_DEPTH.set(0, queue=f"{platform}:keywords")
         print(f"\n✓ {platform}平台处理完成，共插入 {total_inserted} 条数据")
 
     except Exception as e:
         print(f"\n处理 {platform} 数据时出错: {str(e)[:100]}...")
 
-async def main():
+
+async def retry_dead_letters(collection: Collection):
+    """只补抓死信中记录的 (关键词, 游标)，从失败的游标继续向后分页"""
+    entries = DEAD_LETTERS.drain()
+    if not entries:
+        print("没有需要补抓的死信")
+        return
+
+    api_urls = {"快手": KUAISHOU_API_URL, "抖音": DOUYIN_API_URL}
+    print(f"开始补抓 {len(entries)} 条死信...")
+    total_inserted = 0
+    for entry in tqdm(entries, desc="死信补抓"):
+        platform = entry["platform"]
+        if platform not in api_urls:
+            print(f"未知平台 {platform}，跳过死信: {entry}")
+            continue
+        inserted = await crawl_keyword(collection, platform, api_urls[platform], entry["keyword"], entry["cursor"])
+        total_inserted += inserted
+        if inserted > 0:
+            print(f"\n√ {entry['keyword']} (cursor={entry['cursor']}): 补抓 {inserted} 条数据")
+    DEAD_LETTERS.commit_drain()
+
+    remaining = len(DEAD_LETTERS.load())
+    print(f"\n✓ 死信补抓完成，共插入 {total_inserted} 条数据，仍有 {remaining} 条失败")
+
+async def main(retry_only: bool = False):
     print("正在初始化系统...")
     collection = await init_milvus()
     if not collection:
         return
 
+    if retry_only:
+        await retry_dead_letters(collection)
+        with PROFILER.stage("flush"):
+            collection.flush()
+        return
+
     # 先显示现有数据统计
     collection.load()
     total = collection.num_entities
@@ -322,8 +421,16 @@ async def main():
             print(f"  {i}. {metadata.get('name')} ({result['keyword']})")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="抖音/快手关键词用户数据采集")
+    parser.add_argument("--retry-dead-letters", action="store_true", help="只补抓死信文件中失败的关键词和游标")
+    parser.add_argument("--metrics-port", type=int, help="在该端口提供 Prometheus /metrics 端点 (默认读取 METRICS_PORT)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_metrics_server(args.metrics_port)
+    enable_from_args(args)
+
     try:
-        asyncio.run(main())
+        asyncio.run(main(retry_only=args.retry_dead_letters))
     except KeyboardInterrupt:
         print("\n程序被用户中断")
     except Exception as e:
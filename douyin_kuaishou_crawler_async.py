@@ -4,12 +4,21 @@ import asyncio
 import httpx
 import json
 import urllib.parse
+import argparse
 from typing import List, Dict, Tuple, Optional, Union
 
 from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType, utility
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 
+from resilience import Resilience, DeadLetterQueue, FetchError, ResponseError
+from response_cache import RESPONSE_CACHE, CacheMiss
+from profiling import PROFILER, add_profile_arguments, enable_from_args
+from metrics import (
+    start_metrics_server, timed_request, QUEUE_DEPTH, EMBED_BATCH_SIZE, EMBED_SECONDS,
+    INSERT_BATCH_SIZE, INSERT_SECONDS, ROWS_INSERTED,
+)
+
 # 加载 .env 文件
 load_dotenv()
 
@@ -39,8 +48,12 @@ if DOUYIN_API_URL == "INVALID_URL":
 # 初始化 SentenceTransformer 模型
 model = SentenceTransformer('all-MiniLM-L6-v2')
 
+# 请求重试/熔断与死信记录 (与 dk.py 的接口格式不同，单独记录)
+RESILIENCE = Resilience()
+DEAD_LETTERS = DeadLetterQueue(os.getenv("DOUYIN_ASYNC_DEAD_LETTER_FILE", "dead_letters_douyin_async.jsonl"))
+
 # 初始化 Milvus 数据库
-async def init_milvus() -> Collection:
+async def init_milvus(recreate: bool = True) -> Collection:
     try:
         print(f"尝试连接Milvus: {MILVUS_HOST}:{MILVUS_PORT}")
         connections.connect("default", host=MILVUS_HOST, port=MILVUS_PORT)
@@ -55,6 +68,9 @@ async def init_milvus() -> Collection:
         schema = CollectionSchema(fields, "用户数据集合")
 
         if "user_data" in utility.list_collections():
+            if not recreate:
+                print("集合 'user_data' 已存在，继续使用")
+                return Collection("user_data")
             print("集合 'user_data' 已存在，准备删除并重新创建")
             collection = Collection("user_data")
             collection.drop()
@@ -75,7 +91,9 @@ async def vectorize_data(users: List[Dict]) -> List[List[float]]:
         names = [user["name"] for user in users]
         print(f"待向量化的用户名列表：{names}")
         loop = asyncio.get_event_loop()
-        vectors = await loop.run_in_executor(None, model.encode, names)
+        EMBED_BATCH_SIZE.observe(len(names), source="douyin_async")
+        with EMBED_SECONDS.time(source="douyin_async"), PROFILER.stage("encode"):
+            vectors = await loop.run_in_executor(None, model.encode, names)
         print(f"已成功向量化 {len(vectors)} 个用户名")
         return vectors.tolist()
     except Exception as e:
@@ -83,7 +101,7 @@ async def vectorize_data(users: List[Dict]) -> List[List[float]]:
         return []
 
 async def fetch_data(api_url: str, keyword: str, cursor: str) -> Tuple[List[Dict], Optional[str]]:
-    """从抖音 API 获取数据。"""
+    """从抖音 API 获取数据，请求或解析失败时抛出异常。"""
     try:
         headers = {
             "Authorization": f"Bearer {API_KEY}" if API_KEY else "",
@@ -99,64 +117,141 @@ async def fetch_data(api_url: str, keyword: str, cursor: str) -> Tuple[List[Dict
         print(f"请求API: {urllib.parse.unquote(full_url)}")
 
         async with httpx.AsyncClient() as client:
-            response = await client.get(full_url, headers=headers, timeout=10)
-            response.raise_for_status()
+            async def request_page():
+                with PROFILER.stage("fetch"):
+                    response = await client.get(full_url, headers=headers, timeout=10)
+                response.raise_for_status()
 
-            print(f"API 响应状态码: {response.status_code}")
-            print(f"API 响应头: {dict(response.headers)}")
+                print(f"API 响应状态码: {response.status_code}")
+                print(f"API 响应头: {dict(response.headers)}")
 
-            data = response.json()
+                with PROFILER.stage("parse"):
+                    return response.json()
+
+            data = await RESPONSE_CACHE.fetch(
+                api_url, {"keyword": keyword, "cursor": cursor}, timed_request("抖音:search", request_page)
+            )
 
             print(f"抖音原始数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
 
             if isinstance(data, str):  # 额外检查
                 data = json.loads(data)
 
+            # HTTP 200 但响应体是错误信息或结构不对时抛出可重试错误，不能当成分页结束
+            inner = data.get("data") if isinstance(data, dict) else None
+            if (not isinstance(inner, dict) or not isinstance(inner.get("business_data"), list)
+                    or inner.get("cursor") is None):
+                message = data.get("message", "") if isinstance(data, dict) else ""
+                raise ResponseError(f"抖音搜索响应缺少 data/business_data/cursor: {message}"[:200], "抖音:search")
+
             users = []
-            business_data_list = data.get("data", {}).get("business_data", [])
+            business_data_list = inner["business_data"]
             print(f"business_data 列表长度: {len(business_data_list)}")
 
-            for item in business_data_list:
-                if (isinstance(item, dict) and item.get("type") == 1 and
-                        isinstance(item.get("data"), dict)):
-                    aweme_info = item["data"].get("aweme_info")
-                    if isinstance(aweme_info, dict):
-                        author_info = aweme_info.get("author")
-                        if isinstance(author_info, dict):
-                            user_data = {
-                                "name": author_info.get("nickname", ""),
-                                "uid": str(author_info.get("uid", "")),
-                            }
-                            if user_data["name"] and user_data["uid"]:
-                                users.append(user_data)
+            # extract 阶段只包含从响应中提取用户字段
+            with PROFILER.stage("extract"):
+                for item in business_data_list:
+                    if (isinstance(item, dict) and item.get("type") == 1 and
+                            isinstance(item.get("data"), dict)):
+                        aweme_info = item["data"].get("aweme_info")
+                        if isinstance(aweme_info, dict):
+                            author_info = aweme_info.get("author")
+                            if isinstance(author_info, dict):
+                                user_data = {
+                                    "name": author_info.get("nickname", ""),
+                                    "uid": str(author_info.get("uid", "")),
+                                }
+                                if user_data["name"] and user_data["uid"]:
+                                    users.append(user_data)
 
             print(f"抖音获取到 {len(users)} 个用户数据")
             if users:
                 print(f"第一个用户数据示例: {json.dumps(users[0], ensure_ascii=False)}")
 
-            next_page_cursor = data.get("data", {}).get("cursor")
+            # has_more 为 0 时没有下一页
+            next_page_cursor = str(inner["cursor"]) if inner.get("has_more", 1) else None
             print(f"下一页游标: {next_page_cursor}")
             return users, next_page_cursor
 
+    # 异常交给调用方的重试/熔断层处理，避免把一次超时当成分页结束
     except httpx.RequestError as e:
         print(f"请求失败: {e}")
-        return [], None
+        raise
     except httpx.HTTPStatusError as e:
         print(f"HTTP 错误: {e}")
-        print(f"响应内容: {response.text}")  # 打印响应内容以帮助调试
-        return [], None
+        print(f"响应内容: {e.response.text}")  # 打印响应内容以帮助调试
+        raise
     except Exception as e:
         print(f"处理抖音数据时出错: {str(e)}")
-        print(f"抖音原始数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
-        return [], None
+        raise
+
+
+
+async def crawl_keyword(collection: Collection, keyword: str, cursor: str = "0") -> int:
+    """从 cursor 开始抓取一个关键词的全部分页，失败时写入死信。返回插入条数。"""
+    inserted = 0
+    while cursor:
+        try:
+            users, next_cursor = await RESILIENCE.call(
+                "抖音:search",
+                lambda: fetch_data(DOUYIN_API_URL, keyword, cursor),
+            )
+        except FetchError as e:
+            if isinstance(e.__cause__, CacheMiss):
+                # 离线回放只处理已缓存的分页，未命中不算失败
+                print(f"关键词 {keyword} 的 cursor={cursor} 未缓存，回放结束")
+                break
+            print(f"关键词 {keyword} 在 cursor={cursor} 处抓取失败 ({e.kind})")
+            DEAD_LETTERS.add("抖音", keyword, cursor, e)
+            break
+
+        if users:
+            vectors = await vectorize_data(users)
+            metadatas = [
+                json.dumps({"uid": user["uid"], "name": user["name"]}, ensure_ascii=False)
+                for user in users
+            ]
+            
+
+            keywords_list = [keyword] * len(users)  # 为每个用户添加关键词
+
+            # 插入数据到 Milvus
+            try:
+                # 确保插入的数据与 schema 匹配
+                INSERT_BATCH_SIZE.observe(len(vectors), collection="user_data")
+                with INSERT_SECONDS.time(collection="user_data"), PROFILER.stage("insert"):
+                    insert_result = collection.insert([vectors, metadatas, keywords_list])
+                ROWS_INSERTED.inc(len(vectors), platform="抖音", collection="user_data")
+                print(f"成功插入 {len(vectors)} 条数据到 Milvus")
+                with PROFILER.stage("flush"):
+                    collection.flush()  # 刷新以确保数据写入
+                inserted += len(vectors)
+            except Exception as e:
+                print(f"插入数据到 Milvus 时出错：{e}")
 
 
+        cursor = next_cursor
+        await asyncio.sleep(1)  # 避免请求过于频繁
+    return inserted
 
-async def main():
-    collection = await init_milvus()
+
+async def main(retry_only: bool = False):
+    # 补抓模式下保留已有集合，只处理死信
+    collection = await init_milvus(recreate=not retry_only)
     if collection is None:
         return
 
+    if retry_only:
+        entries = DEAD_LETTERS.drain()
+        print(f"开始补抓 {len(entries)} 条死信...")
+        for entry in entries:
+            inserted = await crawl_keyword(collection, entry["keyword"], entry["cursor"])
+            print(f"关键词 {entry['keyword']} (cursor={entry['cursor']}) 补抓 {inserted} 条数据")
+        DEAD_LETTERS.commit_drain()
+        print(f"死信补抓完成，仍有 {len(DEAD_LETTERS.load())} 条失败")
+        connections.disconnect("default")
+        return
+
     # 从文件中读取关键词
     try:
         with open("抖音.txt", "r", encoding="utf-8") as f:
@@ -165,37 +260,21 @@ async def main():
         print("未找到 抖音.txt 文件，请创建该文件并输入关键词。")
         return
 
-    for keyword in keywords:
-        cursor = "0"  # 初始化游标
-        while cursor:
-            users, next_cursor = await fetch_data(DOUYIN_API_URL, keyword, cursor)
-
-            if users:
-                vectors = await vectorize_data(users)
-                metadatas = [
-                    json.dumps({"uid": user["uid"], "name": user["name"]}, ensure_ascii=False)
-                    for user in users
-                ]
-                
-
-                keywords_list = [keyword] * len(users)  # 为每个用户添加关键词
-
-                # 插入数据到 Milvus
-                try:
-                    # 确保插入的数据与 schema 匹配
-                    insert_result = collection.insert([vectors, metadatas, keywords_list])
-                    print(f"成功插入 {len(vectors)} 条数据到 Milvus")
-                    collection.flush()  # 刷新以确保数据写入
-                except Exception as e:
-                    print(f"插入数据到 Milvus 时出错：{e}")
-
-
-            cursor = next_cursor
-            await asyncio.sleep(1)  # 避免请求过于频繁
+    for index, keyword in enumerate(keywords):
+        QUEUE_DEPTH.set(len(keywords) - index, queue="抖音:keywords")
+        await crawl_keyword(collection, keyword)
+    QUEUE_DEPTH.set(0, queue="抖音:keywords")
 
     print("数据抓取和插入完成")
     connections.disconnect("default")
     print("已关闭 Milvus 连接")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="抖音关键词用户数据采集")
+    parser.add_argument("--retry-dead-letters", action="store_true", help="只补抓死信文件中失败的关键词和游标")
+    parser.add_argument("--metrics-port", type=int, help="在该端口提供 Prometheus /metrics 端点 (默认读取 METRICS_PORT)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_metrics_server(args.metrics_port)
+    enable_from_args(args)
+    asyncio.run(main(retry_only=args.retry_dead_letters))
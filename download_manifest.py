@@ -0,0 +1,285 @@
+"""
+视频下载清单 (SQLite)：所有下载器共用，每个 (平台, 作品 ID) 一行，记录下载地址、文件、预期大小
+(接口返回的 data_size，未知为 0)、实际大小、SHA-256、状态和时间。
+
+    pending   已登记，尚未下载完成 (进程中断时停在这个状态)
+    failed    下载失败、大小与预期不一致或校验失败，error 为原因
+    complete  文件已下载，size / sha256 为落盘后的大小和哈希
+
+再次运行时 complete 且磁盘上文件大小一致的作品直接跳过；不需要重新翻页时可以只重试清单中
+pending 和 failed 的作品 (用记录的地址，签名过期的地址需重新运行原下载器刷新)：
+
+    python download_manifest.py status
+    python download_manifest.py resume [--platform douyin] [--concurrency 8]
+    python download_manifest.py verify [--platform douyin] [--workers 8]
+
+verify 用多个线程并行重新计算 complete 文件的哈希，文件缺失、大小或哈希不一致的标记为 failed，
+下次运行会重新下载。
+"""
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import httpx
+
+from profile_sync import item_id
+from video_download import (DOWNLOAD_CHUNK_SIZE, DOWNLOAD_CONCURRENCY, DownloadPool, Urls, download_client,
+                            download_video, mirror_list)
+
+DOWNLOAD_MANIFEST_FILE = os.getenv("DOWNLOAD_MANIFEST_FILE", "download_manifest.sqlite3")
+
+# verify 的默认线程数
+VERIFY_WORKERS = min(8, os.cpu_count() or 1)
+
+PENDING = "pending"
+FAILED = "failed"
+COMPLETE = "complete"
+
+COLUMNS = ("platform, item_id, url, file, expected_size, size, sha256, status, error, attempts, "
+           "created_at, updated_at")
+
+
+class DownloadItem(NamedTuple):
+    platform: str
+    item_id: str
+    url: str
+    file: str
+    expected_size: int
+    size: int
+    sha256: str
+    status: str
+    error: str
+    attempts: int
+    created_at: float
+    updated_at: float
+
+
+def file_sha256(file_name: str) -> str:
+    """分块计算文件的 SHA-256，大文件也不会整个读入内存"""
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadManifest:
+    def __init__(self, path: str = DOWNLOAD_MANIFEST_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS downloads (
+                platform TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                url TEXT NOT NULL DEFAULT '',
+                file TEXT NOT NULL DEFAULT '',
+                expected_size INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL DEFAULT 0,
+                sha256 TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT NOT NULL DEFAULT '',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (platform, item_id)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_downloads_status ON downloads (platform, status)")
+
+    def get(self, platform: str, item: str) -> Optional[DownloadItem]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {COLUMNS} FROM downloads WHERE platform = ? AND item_id = ?", (platform, item)
+            ).fetchone()
+        return DownloadItem(*row) if row else None
+
+    def items(self, platform: Optional[str] = None, statuses: Sequence[str] = (PENDING, FAILED)) -> List[DownloadItem]:
+        """按状态列出作品，platform 为 None 时包括所有平台"""
+        query = f"SELECT {COLUMNS} FROM downloads WHERE status IN ({', '.join('?' * len(statuses))})"
+        params = list(statuses)
+        if platform:
+            query += " AND platform = ?"
+            params.append(platform)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_at", params).fetchall()
+        return [DownloadItem(*row) for row in rows]
+
+    def is_complete(self, platform: str, file_name: str) -> bool:
+        """已记录下载完成且磁盘上的文件大小与记录一致"""
+        item = self.get(platform, item_id(file_name))
+        try:
+            return item is not None and item.status == COMPLETE and os.path.getsize(file_name) == item.size
+        except OSError:
+            return False
+
+    def register(self, platform: str, url: Urls, file_name: str, expected_size: int = 0):
+        """登记一次下载尝试；已登记的作品更新地址、回到 pending 并累加尝试次数"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO downloads (platform, item_id, url, file, expected_size, attempts, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                   ON CONFLICT (platform, item_id) DO UPDATE SET
+                       url = excluded.url,
+                       file = excluded.file,
+                       expected_size = CASE WHEN excluded.expected_size > 0
+                                            THEN excluded.expected_size ELSE downloads.expected_size END,
+                       status = 'pending',
+                       attempts = downloads.attempts + 1,
+                       updated_at = excluded.updated_at""",
+                (platform, item_id(file_name), mirror_list(url)[0], file_name, expected_size, now, now),
+            )
+
+    def mark_complete(self, platform: str, file_name: str, size: int, sha256: str):
+        self._update(platform, item_id(file_name), COMPLETE, "", size=size, sha256=sha256)
+
+    def mark_failed(self, platform: str, file_name: str, error: str):
+        self._update(platform, item_id(file_name), FAILED, error)
+
+    def _update(self, platform: str, item: str, status: str, error: str, size: Optional[int] = None,
+                sha256: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                """UPDATE downloads SET status = ?, error = ?, size = COALESCE(?, size),
+                       sha256 = COALESCE(?, sha256), updated_at = ?
+                   WHERE platform = ? AND item_id = ?""",
+                (status, error, size, sha256, time.time(), platform, item),
+            )
+
+    async def record(self, platform: str, file_name: str) -> bool:
+        """在线程中计算已下载文件的大小和哈希并标记为 complete；与预期大小不一致时标记为 failed 并返回 False"""
+        size = os.path.getsize(file_name)
+        item = self.get(platform, item_id(file_name))
+        expected_size = item.expected_size if item is not None else 0
+        if expected_size > 0 and size != expected_size:
+            self.mark_failed(platform, file_name, f"size mismatch: {size} != expected {expected_size}")
+            return False
+        sha256 = await asyncio.to_thread(file_sha256, file_name)
+        self.mark_complete(platform, file_name, size, sha256)
+        return True
+
+    async def download(self, http_client: httpx.AsyncClient, url: Urls, file_name: str, platform: str,
+                       expected_size: int = 0) -> Optional[str]:
+        """登记并下载一个作品，成功后记录大小和哈希并返回文件名。
+
+        HTTP 错误或大小与预期不一致时记为 failed 并返回 None，其他异常记为 failed 后抛出。
+        """
+        self.register(platform, url, file_name, expected_size)
+        try:
+            result = await download_video(http_client, url, file_name, platform)
+        except Exception as e:
+            self.mark_failed(platform, file_name, str(e) or type(e).__name__)
+            raise
+        if result is None:
+            self.mark_failed(platform, file_name, "HTTP error")
+            return None
+        if not await self.record(platform, result):
+            print(f"Size mismatch for {os.path.basename(result)}, marked as failed")
+            return None
+        return result
+
+    def counts(self, platform: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """{平台: {状态: 作品数}}"""
+        query = "SELECT platform, status, COUNT(*) FROM downloads"
+        params = ()
+        if platform:
+            query += " WHERE platform = ?"
+            params = (platform,)
+        with self._lock:
+            rows = self._conn.execute(query + " GROUP BY platform, status", params).fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for name, status, count in rows:
+            counts.setdefault(name, {})[status] = count
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def check_file(item: DownloadItem) -> str:
+    """校验一个 complete 作品的文件，返回错误原因，一致时返回空字符串"""
+    try:
+        size = os.path.getsize(item.file)
+    except OSError:
+        return "file missing"
+    if size != item.size:
+        return f"size mismatch: {size} != {item.size}"
+    if file_sha256(item.file) != item.sha256:
+        return "sha256 mismatch"
+    return ""
+
+
+def verify(manifest: DownloadManifest, platform: Optional[str] = None, workers: int = VERIFY_WORKERS) -> Dict[str, int]:
+    """并行校验所有 complete 文件，不一致的标记为 failed，返回 {ok, failed} 计数"""
+    items = manifest.items(platform, statuses=(COMPLETE,))
+    result = {"ok": 0, "failed": 0}
+    # hashlib 计算大块数据时释放 GIL，多个线程可以同时读盘和计算
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for item, error in zip(items, executor.map(check_file, items)):
+            if error:
+                print(f"FAILED {item.platform}/{item.item_id}: {error}")
+                manifest.mark_failed(item.platform, item.file, error)
+                result["failed"] += 1
+            else:
+                result["ok"] += 1
+    return result
+
+
+async def resume(manifest: DownloadManifest, platform: Optional[str] = None,
+                 concurrency: int = DOWNLOAD_CONCURRENCY) -> int:
+    """用记录的地址重新下载 pending 和 failed 的作品，返回成功数"""
+    items = manifest.items(platform)
+    if not items:
+        return 0
+    async with download_client(concurrency) as http_client:
+        pool = DownloadPool(http_client, "resume", concurrency, manifest=manifest)
+        results = await pool.run((item.url, item.file, item.platform, item.expected_size) for item in items)
+    print(pool.summary())
+    return sum(1 for result in results if result)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="视频下载清单：查看状态、重试未完成的下载、校验文件哈希")
+    parser.add_argument("command", choices=["status", "resume", "verify"])
+    parser.add_argument("--manifest", default=DOWNLOAD_MANIFEST_FILE, help="清单文件路径")
+    parser.add_argument("--platform", help="只处理该平台")
+    parser.add_argument("--concurrency", type=int, default=DOWNLOAD_CONCURRENCY, help="resume 的下载并发数")
+    parser.add_argument("--workers", type=int, default=VERIFY_WORKERS, help="verify 的校验线程数")
+    args = parser.parse_args(argv)
+
+    manifest = DownloadManifest(args.manifest)
+    failed = 0
+    try:
+        if args.command == "resume":
+            asyncio.run(resume(manifest, args.platform, args.concurrency))
+        elif args.command == "verify":
+            started = time.perf_counter()
+            result = verify(manifest, args.platform, args.workers)
+            failed = result["failed"]
+            print(f"Verified {result['ok'] + failed} files in {time.perf_counter() - started:.1f}s: "
+                  f"{result['ok']} ok, {failed} failed")
+        for name, counts in sorted(manifest.counts(args.platform).items()):
+            print(f"{name}: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    finally:
+        manifest.close()
+    # 有文件校验失败时以非零状态退出，便于在脚本中检查
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Prometheus 文本格式的轻量指标：计数器、仪表和直方图，不依赖 prometheus_client。
+
+指标始终在进程内累计 (只是字典更新，开销很小)；设置 METRICS_PORT 时在该端口
+提供 /metrics 端点，设置 METRICS_TEXTFILE 时在进程退出前把指标写入文件
+(适合 node_exporter 的 textfile collector 采集短时运行的脚本)。
+"""
+import os
+import time
+import atexit
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """各指标类型输出自己的样本行"""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数..., +Inf 计数], 总和
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = [(k, list(c), self._sums[k]) for k, c in self._counts.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------- 抓取 ----------
+REQUESTS = REGISTRY.register(Counter(
+    "tikhub_requests_total", "TikHub API 请求数 (按接口和状态码)", ["endpoint", "status"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "tikhub_request_seconds", "单页 API 请求耗时 (秒)", ["endpoint"]))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "pipeline_queue_depth", "待处理队列长度", ["queue"]))
+
+# ---------- 向量化 ----------
+EMBED_BATCH_SIZE = REGISTRY.register(Histogram(
+    "embedding_batch_size", "单次 encode 的文本条数", ["source"], buckets=SIZE_BUCKETS))
+EMBED_SECONDS = REGISTRY.register(Histogram(
+    "embedding_seconds", "单次 encode 耗时 (秒)", ["source"]))
+
+# ---------- 写入 Milvus ----------
+INSERT_BATCH_SIZE = REGISTRY.register(Histogram(
+    "milvus_insert_batch_size", "单次 insert 的行数", ["collection"], buckets=SIZE_BUCKETS))
+INSERT_SECONDS = REGISTRY.register(Histogram(
+    "milvus_insert_seconds", "单次 insert 耗时 (秒)", ["collection"]))
+ROWS_INSERTED = REGISTRY.register(Counter(
+    "rows_inserted_total", "写入 Milvus 的行数 (按平台)", ["platform", "collection"]))
+CLUSTER_TAGGED = REGISTRY.register(Counter(
+    "comment_cluster_tagged_total", "写入时命中已知近重复簇的评论数", ["collection"]))
+
+# ---------- 下载 ----------
+DOWNLOADS = REGISTRY.register(Counter(
+    "video_downloads_total", "视频下载次数 (按平台和结果)", ["platform", "status"]))
+DOWNLOAD_BYTES = REGISTRY.register(Counter(
+    "video_download_bytes_total", "下载的视频字节数", ["platform"]))
+DOWNLOAD_SECONDS = REGISTRY.register(Histogram(
+    "video_download_seconds", "单个视频下载耗时 (秒)", ["platform"]))
+VARIANT_BYTES_SAVED = REGISTRY.register(Counter(
+    "video_variant_bytes_saved_total", "按版本选择策略比原来的选法少下载的字节数 (按作品详情中的大小)", ["platform", "policy"]))
+
+
+def _status_of(exc: BaseException) -> str:
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return str(status) if status is not None else type(exc).__name__
+
+
+def timed_request(endpoint: str, fn: Callable[[], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+    """包装一次上游请求，记录按状态码划分的请求数和耗时"""
+
+    async def wrapper() -> T:
+        start = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            REQUESTS.inc(endpoint=endpoint, status=_status_of(e))
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        status = result.get("code", 200) if isinstance(result, dict) else 200
+        REQUESTS.inc(endpoint=endpoint, status=str(status))
+        return result
+
+    return wrapper
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_textfile_registered = False
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """启动 /metrics 端点；未指定端口且未设置 METRICS_PORT 时不启动。
+
+    设置了 METRICS_TEXTFILE 时同时注册退出时写文件。
+    """
+    global _server, _textfile_registered
+    if METRICS_TEXTFILE and not _textfile_registered:
+        atexit.register(write_textfile, METRICS_TEXTFILE)
+        _textfile_registered = True
+    if port is None:
+        if not METRICS_PORT:
+            return None
+        port = int(METRICS_PORT)
+    if _server is not None:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    print(f"指标端点已启动: http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+def write_textfile(path: str):
+    """把当前指标原子写入文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
@@ -0,0 +1,96 @@
+"""
+主页增量同步：每个主页一个状态文件 (<下载目录>/.sync/<平台>_<主页>.json)，记录上次完整同步到的
+最新发布时间和已下载的作品及其文件大小。
+
+再次同步时翻页遇到不晚于该时间的非置顶作品即停止，已下载且大小一致的文件直接跳过，
+每天同步一次通常只需要请求一两页。有下载失败时不推进发布时间，下次会重新检查这些作品。
+"""
+import os
+import re
+import json
+import time
+from typing import AsyncIterable, AsyncIterator, Dict
+
+# 已下载作品至少每隔多少秒写一次状态文件
+SYNC_SAVE_INTERVAL = 1.0
+
+
+def state_path(output_dir: str, platform: str, profile_id: str) -> str:
+    """主页的状态文件路径，profile_id 可以是 sec_user_id 或主页链接"""
+    key = re.sub(r"[^\w.-]+", "_", profile_id).strip("_")[-120:]
+    return os.path.join(output_dir, ".sync", f"{platform}_{key}.json")
+
+
+def item_id(file_name: str) -> str:
+    """下载文件名 <作品 ID>.mp4 对应的作品 ID"""
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+
+class ProfileSync:
+    """一个主页的同步状态"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.newest_time = 0
+        self.newest_id = ""
+        # 作品 ID -> 文件大小
+        self.downloaded: Dict[str, int] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.newest_time = int(state.get("newest_create_time", 0))
+            self.newest_id = state.get("newest_aweme_id", "")
+            self.downloaded = state.get("downloaded", {})
+        except (OSError, ValueError):
+            pass
+        # 本次同步看到的最新作品、新作品数、是否在已知作品处停止
+        self.seen_time = self.newest_time
+        self.seen_id = self.newest_id
+        self.new_posts = 0
+        self.reached_known = False
+        self._saved = time.monotonic()
+
+    async def new_videos(self, videos: AsyncIterable[Dict]) -> AsyncIterator[Dict]:
+        """按发布时间倒序的作品中只交出上次同步之后的，遇到已知的非置顶作品即停止翻页"""
+        async for video_info in videos:
+            create_time = int(video_info.get("create_time") or 0)
+            # 置顶作品排在最前面但可能很旧，不能据此停止
+            if self.newest_time and create_time <= self.newest_time and not video_info.get("is_top"):
+                self.reached_known = True
+                break
+            if create_time > self.seen_time:
+                self.seen_time, self.seen_id = create_time, str(video_info.get("aweme_id", ""))
+            self.new_posts += 1
+            yield video_info
+
+    def is_downloaded(self, file_name: str) -> bool:
+        """已记录下载且磁盘上的文件大小与记录一致"""
+        size = self.downloaded.get(item_id(file_name))
+        try:
+            return size is not None and os.path.getsize(file_name) == size
+        except OSError:
+            return False
+
+    def mark_downloaded(self, file_name: str):
+        self.downloaded[item_id(file_name)] = os.path.getsize(file_name)
+        if time.monotonic() - self._saved >= SYNC_SAVE_INTERVAL:
+            self.save()
+
+    def finish(self, complete: bool):
+        """保存状态；只有本次同步完整且没有失败时才推进最新发布时间"""
+        if complete:
+            self.newest_time, self.newest_id = self.seen_time, self.seen_id
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "newest_create_time": self.newest_time,
+                "newest_aweme_id": self.newest_id,
+                "downloaded": self.downloaded,
+                "updated": int(time.time()),
+            }, f)
+        os.replace(tmp, self.path)
+        self._saved = time.monotonic()
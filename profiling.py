@@ -0,0 +1,198 @@
+"""
+低开销的分阶段性能剖析 (--profile)。
+
+用 PROFILER.stage("fetch") 这样的上下文管理器包住各阶段，记录墙钟时间和 CPU 时间。
+阶段可以嵌套 (按 asyncio 任务分别跟踪)，汇总表显示的是扣除子阶段后的自身耗时。
+未开启时 stage() 返回共享的空上下文，几乎没有开销。
+CPU 时间按进程统计 (包含线程池中的 encode)；多个任务并发时各阶段的墙钟时间会重叠，
+占比之和可能超过 100%。
+
+进程退出时打印汇总表，并写出:
+    <prefix>.summary.txt        汇总表
+    <prefix>.stages.folded      按阶段嵌套折叠的调用栈 (单位: 微秒)
+    <prefix>.samples.folded     开启采样时按 Python 调用栈折叠的采样结果
+两种 .folded 文件都是 flamegraph.pl / speedscope 可直接读取的 collapsed stack 格式。
+"""
+import os
+import sys
+import time
+import atexit
+import threading
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+_stage_stack: ContextVar[Tuple[str, ...]] = ContextVar("profile_stage_stack", default=())
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "path", "token", "wall", "cpu")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.path = _stage_stack.get() + (self.name,)
+        self.token = _stage_stack.set(self.path)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        _stage_stack.reset(self.token)
+        self.profiler._record(self.path, wall, cpu)
+        return False
+
+
+class _Sampler(threading.Thread):
+    """定时抓取各线程的 Python 调用栈"""
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.samples: Dict[str, int] = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.output_prefix = "profile"
+        self.started_at = 0.0
+        self._lock = threading.Lock()
+        # 按阶段路径累计: [调用次数, 墙钟总时间, CPU 总时间]
+        self._inclusive: Dict[Tuple[str, ...], List[float]] = {}
+        # 子阶段占用的墙钟/CPU 时间，用于计算自身耗时
+        self._children: Dict[Tuple[str, ...], List[float]] = {}
+        self._sampler: Optional[_Sampler] = None
+
+    def enable(self, output_prefix: str = "profile", sample_interval: Optional[float] = None):
+        """开启剖析；sample_interval (秒) 不为空时同时开启调用栈采样"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.output_prefix = output_prefix
+        self.started_at = time.perf_counter()
+        if sample_interval:
+            self._sampler = _Sampler(sample_interval)
+            self._sampler.start()
+        atexit.register(self.report)
+        print(f"性能剖析已开启，结果将写入 {output_prefix}.*")
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def _record(self, path: Tuple[str, ...], wall: float, cpu: float):
+        with self._lock:
+            entry = self._inclusive.setdefault(path, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += wall
+            entry[2] += cpu
+            if len(path) > 1:
+                parent = self._children.setdefault(path[:-1], [0.0, 0.0])
+                parent[0] += wall
+                parent[1] += cpu
+
+    def _exclusive(self) -> Dict[Tuple[str, ...], Tuple[int, float, float]]:
+        result = {}
+        with self._lock:
+            for path, (calls, wall, cpu) in self._inclusive.items():
+                child_wall, child_cpu = self._children.get(path, (0.0, 0.0))
+                result[path] = (int(calls), max(0.0, wall - child_wall), max(0.0, cpu - child_cpu))
+        return result
+
+    def summary(self) -> str:
+        """按阶段名汇总自身耗时的表格"""
+        by_name: Dict[str, List[float]] = {}
+        for path, (calls, wall, cpu) in self._exclusive().items():
+            entry = by_name.setdefault(path[-1], [0, 0.0, 0.0])
+            entry[0] += calls
+            entry[1] += wall
+            entry[2] += cpu
+        total_wall = time.perf_counter() - self.started_at
+        staged_wall = sum(e[1] for e in by_name.values())
+
+        lines = [
+            f"{'阶段':<12}{'次数':>10}{'墙钟(s)':>12}{'平均(ms)':>12}{'CPU(s)':>12}{'占比':>8}",
+            "-" * 66,
+        ]
+        for name, (calls, wall, cpu) in sorted(by_name.items(), key=lambda e: -e[1][1]):
+            avg_ms = wall / calls * 1000 if calls else 0.0
+            share = wall / total_wall * 100 if total_wall else 0.0
+            lines.append(f"{name:<12}{int(calls):>10}{wall:>12.3f}{avg_ms:>12.2f}{cpu:>12.3f}{share:>7.1f}%")
+        lines.append("-" * 66)
+        lines.append(f"总运行时间 {total_wall:.3f}s，其中未计入任何阶段 {max(0.0, total_wall - staged_wall):.3f}s")
+        return "\n".join(lines)
+
+    def report(self):
+        """停止采样，打印汇总并写出文件"""
+        if not self.enabled:
+            return
+        if self._sampler is not None:
+            self._sampler.stop()
+
+        summary = self.summary()
+        print("\n=== 性能剖析 ===")
+        print(summary)
+
+        with open(f"{self.output_prefix}.summary.txt", "w", encoding="utf-8") as f:
+            f.write(summary + "\n")
+        with open(f"{self.output_prefix}.stages.folded", "w", encoding="utf-8") as f:
+            for path, (_, wall, _) in sorted(self._exclusive().items()):
+                micros = int(wall * 1_000_000)
+                if micros:
+                    f.write(f"{';'.join(path)} {micros}\n")
+        written = [f"{self.output_prefix}.summary.txt", f"{self.output_prefix}.stages.folded"]
+        if self._sampler is not None:
+            with open(f"{self.output_prefix}.samples.folded", "w", encoding="utf-8") as f:
+                for stack, count in sorted(self._sampler.samples.items()):
+                    f.write(f"{stack} {count}\n")
+            written.append(f"{self.output_prefix}.samples.folded")
+        print(f"剖析结果已写入: {', '.join(written)}")
+        self.enabled = False
+
+
+# 同一进程内共享的剖析器，未开启时不记录任何数据
+PROFILER = Profiler()
+
+
+def add_profile_arguments(parser):
+    """为脚本添加 --profile 相关命令行参数"""
+    parser.add_argument("--profile", action="store_true", help="记录各阶段耗时，退出时输出汇总表和火焰图文件")
+    parser.add_argument("--profile-sample", type=float, metavar="MS",
+                        help="同时以该间隔 (毫秒) 采样 Python 调用栈")
+    parser.add_argument("--profile-output", default="profile", help="剖析结果文件前缀 (默认 profile)")
+
+
+def enable_from_args(args):
+    if args.profile or args.profile_sample:
+        interval = args.profile_sample / 1000 if args.profile_sample else None
+        PROFILER.enable(args.profile_output, interval)
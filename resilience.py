@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import random
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+# 错误分类
+TRANSIENT = "transient"        # 超时、连接失败、5xx 等可重试错误
+RATE_LIMITED = "rate_limited"  # 429 限流，按 Retry-After 或退避等待后重试
+PERMANENT = "permanent"        # 4xx、数据解析错误等，重试无意义
+
+DEAD_LETTER_FILE = os.getenv("DEAD_LETTER_FILE", "dead_letters.jsonl")
+
+
+class FetchError(Exception):
+    """重试耗尽或不可重试时抛出的请求错误"""
+
+    def __init__(self, message: str, kind: str, endpoint: str = "", status_code: Optional[int] = None):
+        super().__init__(message)
+        self.kind = kind
+        self.endpoint = endpoint
+        self.status_code = status_code
+
+
+class CircuitOpenError(FetchError):
+    """接口熔断期间直接拒绝请求"""
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"接口 {endpoint} 已熔断，暂停请求", TRANSIENT, endpoint)
+
+
+class ResponseError(FetchError):
+    """HTTP 成功但响应体是错误信息或结构不符合预期，按可重试错误处理"""
+
+    def __init__(self, message: str, endpoint: str = ""):
+        super().__init__(message, TRANSIENT, endpoint)
+
+
+def classify_error(exc: BaseException) -> str:
+    """将异常归类为 TRANSIENT / RATE_LIMITED / PERMANENT"""
+    if isinstance(exc, FetchError):
+        return exc.kind
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        if status == 429:
+            return RATE_LIMITED
+        if status >= 500 or status == 408:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return TRANSIENT
+    if isinstance(exc, json.JSONDecodeError):
+        # 网关返回的 HTML 错误页或被截断的响应体
+        return TRANSIENT
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """读取 429 响应中的 Retry-After 头（秒）"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        value = exc.response.headers.get("Retry-After")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return None
+    return None
+
+
+class RetryPolicy:
+    """带全抖动 (full jitter) 的指数退避重试策略"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, exc: Optional[BaseException] = None) -> float:
+        """第 attempt 次失败后的等待时间"""
+        retry_after = _retry_after(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """单个接口的熔断器：连续 failure_threshold 次调用在重试耗尽后仍失败时打开，冷却后半开放行一次试探调用"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_ignored(self):
+        """不计入熔断的结果 (如 4xx)：保持当前状态，只释放半开状态下的试探名额"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class Resilience:
+    """组合重试策略与按接口划分的熔断器"""
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.policy = policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[endpoint]
+
+    async def call(self, endpoint: str, func: Callable[[], Awaitable[T]]) -> T:
+        """执行 func，可重试错误按策略退避重试；最终失败时抛出 FetchError。
+
+        一次调用无论重试几次只计一次熔断失败，单个出错的关键词不会打开整个接口的熔断器。
+        """
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(endpoint)
+        last_exc: Optional[BaseException] = None
+        for attempt in range(self.policy.max_attempts):
+            if attempt and breaker.state == breaker.OPEN:
+                # 其他调用的失败已打开熔断器，停止重试
+                raise CircuitOpenError(endpoint) from last_exc
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                # 被取消的调用不计入熔断，释放半开状态下的试探名额
+                breaker.record_ignored()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                last_exc = e
+                if kind == PERMANENT:
+                    # 不可重试的错误说明请求本身有问题，不计入熔断，也不能关闭半开的熔断器
+                    breaker.record_ignored()
+                    raise FetchError(f"{endpoint} 请求失败: {e}", kind, endpoint, _status_code(e)) from e
+                if attempt + 1 >= self.policy.max_attempts:
+                    break
+                delay = self.policy.backoff(attempt, e)
+                print(f"{endpoint} 第 {attempt + 1} 次请求失败 ({kind}): {str(e)[:100]}，{delay:.1f} 秒后重试")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+        breaker.record_failure()
+        raise FetchError(
+            f"{endpoint} 重试 {self.policy.max_attempts} 次后仍失败: {last_exc}",
+            classify_error(last_exc) if last_exc else TRANSIENT,
+            endpoint,
+            _status_code(last_exc),
+        ) from last_exc
+
+
+def _status_code(exc: Optional[BaseException]) -> Optional[int]:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return None
+
+
+class DeadLetterQueue:
+    """记录失败的 (平台, 关键词, 游标)，供单独的补抓流程重试"""
+
+    def __init__(self, path: str = DEAD_LETTER_FILE):
+        self.path = path
+
+    def add(self, platform: str, keyword: str, cursor: str, error: FetchError):
+        entry = {
+            "platform": platform,
+            "keyword": keyword,
+            "cursor": cursor,
+            "kind": error.kind,
+            "error": str(error)[:500],
+            "time": int(time.time()),
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"已记录死信: {platform} / {keyword} / cursor={cursor}")
+
+    def load(self) -> List[Dict]:
+        return self._read(self.path)
+
+    @staticmethod
+    def _read(path: str) -> List[Dict]:
+        if not os.path.exists(path):
+            return []
+        entries = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"死信文件中存在无法解析的行，跳过: {line[:100]}")
+        return entries
+
+    def drain(self) -> List[Dict]:
+        """取出全部死信并清空文件；重试仍失败的条目会被重新写入。
+
+        取出的条目先保存到 .retrying 备份，补抓中途退出时下次会一并取出。
+        """
+        backup = self.path + ".retrying"
+        entries = self._read(backup) + self.load()
+        with open(backup, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return entries
+
+    def commit_drain(self):
+        """补抓流程结束后删除备份"""
+        backup = self.path + ".retrying"
+        if os.path.exists(backup):
+            os.remove(backup)
@@ -0,0 +1,203 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# 缓存配置 (从环境变量获取)
+# TIKHUB_CACHE_MODE: on = 读写缓存, off = 不使用缓存, replay = 只读缓存、未命中即报错 (离线重放)
+CACHE_DIR = os.getenv(
+    "TIKHUB_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tikhub"),
+)
+CACHE_MODE = os.getenv("TIKHUB_CACHE_MODE", "on")
+CACHE_TTL = int(os.getenv("TIKHUB_CACHE_TTL", str(24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("TIKHUB_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# 视频详情里的播放地址带签名且会过期，默认只缓存 1 小时
+VIDEO_DETAIL_TTL = int(os.getenv("TIKHUB_VIDEO_DETAIL_TTL", "3600"))
+
+
+class CacheMiss(Exception):
+    """回放模式下请求未命中缓存"""
+
+
+def cache_key(endpoint: str, params: Dict[str, Any]) -> str:
+    """按 (接口, 参数) 计算内容寻址的缓存键"""
+    raw = json.dumps([endpoint, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _inner(data: Dict) -> Dict:
+    value = data.get("data")
+    return value if isinstance(value, dict) else {}
+
+
+# 接口路径 -> 响应体的业务成功检查 (在 code 之外)，endpoint 包含该路径时使用
+SUCCESS_CHECKS: Dict[str, Callable[[Dict], bool]] = {
+    "douyin/web/fetch_user_search_result": lambda d: isinstance(_inner(_inner(d)).get("user_list"), list),
+    "kuaishou/web/fetch_search_user": lambda d: isinstance(_inner(d).get("mixFeeds"), list),
+    "douyin/app/v1/fetch_video_comments": lambda d: _inner(d).get("status_code", 0) == 0 and bool(_inner(d)),
+    "kuaishou/app/fetch_one_video_comment": lambda d: isinstance(_inner(d).get("rootComments"), list),
+    "kuaishou/app/fetch_one_video_sub_comment": lambda d: isinstance(_inner(d).get("subComments"), list),
+    "douyin/app/v3/fetch_one_video_by_share_url": lambda d: isinstance(_inner(d).get("aweme_detail"), dict),
+    "tiktok/app/v3/fetch_one_video_by_share_url": lambda d: bool(_inner(d).get("aweme_details")),
+    "kuaishou/web/fetch_one_video": lambda d: isinstance(d.get("data"), list) and bool(d["data"]),
+    "fetch_user_post_videos": lambda d: isinstance(_inner(d).get("aweme_list"), list),
+}
+
+
+def is_cacheable(data: Any, endpoint: str = "") -> bool:
+    """只缓存业务上成功的响应：TikHub 出错时 code 不为 200，快手接口出错时 result 不为 1，
+    另按 SUCCESS_CHECKS 检查各接口的响应结构"""
+    if not isinstance(data, dict):
+        return False
+    if data.get("code", 200) != 200:
+        return False
+    for node in (data, data.get("data")):
+        if isinstance(node, dict) and "result" in node and node["result"] != 1:
+            return False
+    for path, check in SUCCESS_CHECKS.items():
+        if path in endpoint:
+            return check(data)
+    return True
+
+
+class ResponseCache:
+    """TikHub 接口响应的磁盘缓存：gzip 压缩、按 TTL 过期、超出容量按最近使用时间淘汰"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, ttl: int = CACHE_TTL,
+                 max_bytes: int = CACHE_MAX_BYTES, mode: str = CACHE_MODE):
+        if mode not in ("on", "off", "replay"):
+            raise ValueError(f"不支持的缓存模式: {mode}")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key[2:] + ".json.gz")
+
+    def get(self, key: str, ttl: Optional[int] = None) -> Optional[Any]:
+        """读取缓存，不存在或已过期时返回 None；回放模式忽略 TTL"""
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                entry = json.loads(f.read().decode("utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"缓存文件损坏，已删除: {path} ({e})")
+            self._remove(path)
+            return None
+
+        ttl = self.ttl if ttl is None else ttl
+        if self.mode != "replay" and time.time() - entry.get("stored_at", 0) > ttl:
+            self._remove(path)
+            return None
+
+        # 更新修改时间，淘汰时按最近使用排序
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("data")
+
+    def set(self, key: str, data: Any, endpoint: str = "", params: Optional[Dict[str, Any]] = None):
+        """写入缓存 (先写临时文件再原子替换)"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"endpoint": endpoint, "params": params, "stored_at": time.time(), "data": data}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        os.replace(tmp_path, path)
+
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            if self._size is not None:
+                self._size -= size
+        except OSError:
+            pass
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json.gz"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """删除过期条目，再按最近使用时间淘汰到容量上限的 90%"""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        now = time.time()
+        removed = 0
+        for path, size, mtime in entries:
+            if total <= target and now - mtime <= self.ttl:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._size = total
+        if removed:
+            print(f"响应缓存淘汰 {removed} 个文件，当前占用 {total / 1024 / 1024:.1f} MB")
+
+    async def fetch(self, endpoint: str, params: Dict[str, Any],
+                    fetch: Callable[[], Awaitable[Any]], ttl: Optional[int] = None, refresh: bool = False) -> Any:
+        """命中缓存直接返回，否则调用 fetch 获取并写入缓存。
+
+        refresh 为 True 时不读缓存 (回放模式除外)，总是重新请求并更新缓存，用于需要最新数据的增量刷新。
+        """
+        if self.mode == "off":
+            return await fetch()
+
+        key = cache_key(endpoint, params)
+        data = None if refresh and self.mode != "replay" else self.get(key, ttl)
+        if data is not None and not is_cacheable(data, endpoint):
+            # 旧版本写入的错误响应，删除后按未命中处理
+            self._remove(self._path(key))
+            data = None
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        if self.mode == "replay":
+            raise CacheMiss(f"回放模式缓存未命中: {endpoint} {params}")
+
+        data = await fetch()
+        if is_cacheable(data, endpoint):
+            try:
+                self.set(key, data, endpoint, params)
+            except OSError as e:
+                print(f"写入响应缓存失败: {e}")
+        return data
+
+
+# 同一进程内共享的默认缓存实例
+RESPONSE_CACHE = ResponseCache()
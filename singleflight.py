@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    """一次进行中的上游调用及其等待者数"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并同时进行的相同请求：同一个 key 只发起一次上游调用，其余等待者共享结果。
+
+    上游调用在独立的 task 中执行，发起它的调用方被取消时其他等待者照常拿到结果；
+    所有等待者都取消后才取消上游调用。共享的是同一个结果对象，调用方不应原地修改返回值。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.hits = 0    # 搭上已有请求的次数
+        self.misses = 0  # 实际发起上游调用的次数
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(key, call))
+        call.waiters += 1
+        try:
+            # shield: 某个等待者被取消时不取消共享的 task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 没有等待者了，新的调用方重新发起请求，不搭正在取消的 task
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _finish(self, key: str, call: _Call):
+        self._forget(key, call)
+        if not call.task.cancelled():
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            call.task.exception()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "in_flight": len(self._calls),
+        }
+
+
+# 同一进程内共享的默认实例，key 中带接口名以区分不同请求
+INFLIGHT = SingleFlight()
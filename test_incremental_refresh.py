@@ -0,0 +1,89 @@
+"""
+评论增量刷新的离线测试：在本地模拟服务器上先完整抓取一个快手视频，服务器首页出现新评论后
+再增量刷新，新评论必须被写入，不能因为读到缓存中的旧首页而提前结束。
+
+    python -m pytest test_incremental_refresh.py
+
+需要 requirements.txt 中的依赖 (加载评论抓取脚本时会加载 SentenceTransformer 模型)；
+评论写入内存中的集合，不需要 Milvus。
+"""
+import os
+import re
+import sys
+import asyncio
+import importlib.util
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(REPO_ROOT, "bench"))
+
+from comment_schema import COMMENT_FIELDS
+from crawl_manifest import CrawlManifest
+from mock_tikhub_server import MockConfig, MockTikHubServer, stable_id
+from response_cache import ResponseCache
+
+PHOTO_ID = "refresh_photo"
+
+
+class MemoryCollection:
+    """只保存 photo_id 和 comment_id 的内存集合，支持评论抓取用到的 upsert / query / flush"""
+
+    def __init__(self):
+        self.field_names = [f.name for f in COMMENT_FIELDS if not f.auto_id]
+        self.rows = {}
+
+    def upsert(self, data):
+        columns = dict(zip(self.field_names, data))
+        for pk, photo_id, comment_id in zip(columns["pk"], columns["photo_id"], columns["comment_id"]):
+            self.rows[pk] = (photo_id, int(comment_id))
+
+    def query(self, expr, output_fields=None):
+        photo_id = re.search(r'photo_id == "([^"]*)"', expr).group(1)
+        ids = {int(i) for i in re.search(r"comment_id in \[([^\]]*)\]", expr).group(1).split(",") if i.strip()}
+        return [{"comment_id": comment_id} for photo, comment_id in self.rows.values()
+                if photo == photo_id and comment_id in ids]
+
+    def flush(self):
+        pass
+
+    def comment_ids(self):
+        return {comment_id for _, comment_id in self.rows.values()}
+
+
+@pytest.fixture
+def fetcher(tmp_path, monkeypatch):
+    # 脚本在导入时于当前目录创建清单文件
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location(
+        "kuaishou_comment_fetcher", os.path.join(REPO_ROOT, "Kuaishou", "comment_fetcher.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.MANIFEST = CrawlManifest(str(tmp_path / "crawl_manifest.sqlite3"))
+    module.RESPONSE_CACHE = ResponseCache(cache_dir=str(tmp_path / "cache"), mode="on")
+    yield module
+    module.MANIFEST.close()
+
+
+def test_refresh_sees_new_comments_on_first_page(fetcher, monkeypatch):
+    config = MockConfig(depth=4, page_size=5, sub_comments=1)
+    collection = MemoryCollection()
+
+    async def run(**kwargs):
+        await fetcher.fetch_video_comments(PHOTO_ID, collection, "author", "作者", **kwargs)
+
+    with MockTikHubServer(config) as server:
+        monkeypatch.setattr(fetcher, "TIKHUB_API_BASE", server.base_url)
+        asyncio.run(run())
+        first = fetcher.MANIFEST.get("快手", PHOTO_ID)
+        assert first.status == "complete"
+        stored = collection.comment_ids()
+
+        # 首页出现 3 条新评论，原有评论整体后移；上次抓取的页仍在缓存有效期内
+        config.new_comments = 3
+        asyncio.run(run(incremental=True, since=first.newest))
+
+    new_ids = {stable_id("kuaishou_comment", PHOTO_ID, -i) for i in range(1, 4)}
+    assert new_ids <= collection.comment_ids(), "增量刷新没有写入首页的新评论"
+    assert new_ids.isdisjoint(stored)
+    assert fetcher.MANIFEST.get("快手", PHOTO_ID).newest > first.newest
@@ -0,0 +1,93 @@
+"""
+重试与熔断的离线测试，不访问网络。
+
+    python -m pytest test_resilience.py
+"""
+import asyncio
+
+import httpx
+
+from resilience import CircuitBreaker, CircuitOpenError, FetchError, PERMANENT, Resilience, RetryPolicy
+
+ENDPOINT = "快手:search"
+
+
+def make_resilience(failure_threshold: int = 5) -> Resilience:
+    # 退避为 0，测试不需要等待
+    return Resilience(RetryPolicy(max_attempts=5, base_delay=0), failure_threshold=failure_threshold)
+
+
+class Upstream:
+    """按关键词返回结果，bad 开头的关键词总是连接失败；记录实际发出的请求"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def search(self, keyword: str):
+        self.requests.append(keyword)
+        if keyword.startswith("bad"):
+            raise httpx.ConnectError("connection refused")
+        return [keyword]
+
+
+def test_bad_keyword_does_not_block_next_keyword():
+    async def run():
+        resilience = make_resilience()
+        upstream = Upstream()
+        try:
+            await resilience.call(ENDPOINT, lambda: upstream.search("bad"))
+        except FetchError as e:
+            assert not isinstance(e, CircuitOpenError)
+        else:
+            raise AssertionError("bad 关键词应在重试耗尽后失败")
+        assert upstream.requests == ["bad"] * 5
+        # 一个关键词耗尽重试只计一次失败，下一个关键词照常请求
+        assert resilience.breaker(ENDPOINT).state == CircuitBreaker.CLOSED
+        assert await resilience.call(ENDPOINT, lambda: upstream.search("good")) == ["good"]
+        assert upstream.requests[-1] == "good"
+
+    asyncio.run(run())
+
+
+def test_breaker_opens_after_threshold_failed_calls():
+    async def run():
+        resilience = make_resilience(failure_threshold=3)
+        upstream = Upstream()
+        for i in range(3):
+            try:
+                await resilience.call(ENDPOINT, lambda: upstream.search(f"bad{i}"))
+            except FetchError:
+                pass
+        assert resilience.breaker(ENDPOINT).state == CircuitBreaker.OPEN
+        sent = len(upstream.requests)
+        try:
+            await resilience.call(ENDPOINT, lambda: upstream.search("good"))
+        except CircuitOpenError:
+            pass
+        else:
+            raise AssertionError("熔断器打开后应直接拒绝请求")
+        assert len(upstream.requests) == sent
+
+    asyncio.run(run())
+
+
+def test_permanent_error_keeps_half_open_breaker():
+    async def run():
+        resilience = make_resilience(failure_threshold=1)
+        breaker = resilience.breaker(ENDPOINT)
+        breaker.record_failure()
+        breaker.opened_at -= breaker.reset_timeout
+
+        async def forbidden():
+            request = httpx.Request("GET", "http://mock/search")
+            raise httpx.HTTPStatusError("403", request=request, response=httpx.Response(403, request=request))
+
+        try:
+            await resilience.call(ENDPOINT, forbidden)
+        except FetchError as e:
+            assert e.kind == PERMANENT
+        # 4xx 说明请求本身有问题，不能据此关闭半开的熔断器
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+
+    asyncio.run(run())
@@ -0,0 +1,171 @@
+"""
+视频下载的离线测试：在本地模拟服务器上验证镜像切换、不支持 Range 和断点续传，
+逐字节比对下载结果与模拟服务器生成的内容。
+
+    python test_video_download.py
+    python test_video_download.py stalled_mirror resume
+    python -m pytest test_video_download.py
+
+全部通过时退出码为 0，有失败时为 1。
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+# 卡顿判定和对冲间隔在导入 video_download 时读取，测试中缩短以免等待过久
+os.environ.setdefault("DOWNLOAD_STALL_SECONDS", "1")
+os.environ.setdefault("DOWNLOAD_HEDGE_DELAY", "0.2")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench"))
+
+import httpx
+
+import video_download
+from video_download import download_video, load_progress, part_path, progress_path, segmented_download
+from mock_tikhub_server import MockConfig, MockTikHubServer, video_bytes
+
+VIDEO_SIZE = 3 * 1024 * 1024 + 12345
+
+
+def video_urls(server: MockTikHubServer, name: str):
+    return [mirror + f"/mock/video/{name}" for mirror in server.httpd.mock.mirror_urls]
+
+
+def check_file(file_name: str, name: str, size: int = VIDEO_SIZE):
+    with open(file_name, "rb") as f:
+        data = f.read()
+    assert len(data) == size, f"文件大小 {len(data)} != {size}"
+    assert data == video_bytes(name, size), "文件内容与模拟服务器生成的不一致"
+    assert not os.path.exists(part_path(file_name)), ".part 文件未清理"
+    assert not os.path.exists(progress_path(file_name)), ".part.json 文件未清理"
+
+
+async def mirror_requests(server: MockTikHubServer, mirror: int) -> int:
+    """镜像处理完的视频请求数；服务端在发送完数据后才计数，稍等片刻再读取"""
+    await asyncio.sleep(0.2)
+    route = f"/mock/video@mirror{mirror}" if mirror else "/mock/video"
+    return server.stats.requests.get(route, 0)
+
+
+async def run_slow_mirror(workdir: str):
+    """第一个镜像首字节很慢时，对冲探测改用第二个镜像，且不必等慢镜像响应"""
+    config = MockConfig(video_size=VIDEO_SIZE, mirrors=2, slow_mirrors=1, mirror_delay=3.0)
+    with MockTikHubServer(config) as server:
+        file_name = os.path.join(workdir, "slow.mp4")
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            result = await download_video(client, video_urls(server, "slow.mp4"), file_name, "test")
+        elapsed = time.perf_counter() - started
+        assert result == file_name, f"下载失败: {result}"
+        check_file(file_name, "slow.mp4")
+        assert elapsed < config.mirror_delay, f"等待了慢镜像 ({elapsed:.1f}s)"
+        assert await mirror_requests(server, 1) > 0, "没有使用第二个镜像"
+
+
+async def run_stalled_mirror(workdir: str):
+    """第一个镜像传输到一半卡住时，从断点切换到第二个镜像继续"""
+    config = MockConfig(video_size=VIDEO_SIZE, mirrors=2, mirror_stall_rate=1.0)
+    with MockTikHubServer(config) as server:
+        file_name = os.path.join(workdir, "stalled.mp4")
+        async with httpx.AsyncClient() as client:
+            result = await download_video(client, video_urls(server, "stalled.mp4"), file_name, "test")
+        assert result == file_name, f"下载失败: {result}"
+        check_file(file_name, "stalled.mp4")
+        assert await mirror_requests(server, 1) > 0, "卡住后没有切换到第二个镜像"
+        # 卡住的镜像还没有计数，这里只有第二个镜像续传的字节，不应重新下载整个文件
+        assert server.stats.video_bytes < 2 * VIDEO_SIZE, f"共传输 {server.stats.video_bytes} 字节"
+
+
+async def run_no_range(workdir: str):
+    """服务器不支持 Range 时不分段，从探测到的镜像整体流式下载"""
+    config = MockConfig(video_size=VIDEO_SIZE, mirrors=2, range_support=False)
+    with MockTikHubServer(config) as server:
+        file_name = os.path.join(workdir, "no_range.mp4")
+        async with httpx.AsyncClient() as client:
+            result = await download_video(client, video_urls(server, "no_range.mp4"), file_name, "test")
+        assert result == file_name, f"下载失败: {result}"
+        check_file(file_name, "no_range.mp4")
+
+
+async def run_resume(workdir: str):
+    """Range 下载中途断开后保留已收到的全部字节，下次只请求缺失的范围"""
+    config = MockConfig(video_size=VIDEO_SIZE, video_cut_rate=1.0)
+    with MockTikHubServer(config) as server:
+        name = "resume.mp4"
+        url = video_urls(server, name)[0]
+        file_name = os.path.join(workdir, name)
+        retries = video_download.SEGMENT_RETRIES
+        video_download.SEGMENT_RETRIES = 0
+        try:
+            async with httpx.AsyncClient() as client:
+                try:
+                    await segmented_download(client, url, file_name, VIDEO_SIZE, 1)
+                except (httpx.TransportError, video_download.IncompleteDownload):
+                    pass
+                else:
+                    raise AssertionError("断开连接后下载没有失败")
+                # 服务器在一半处断开，断开前收到的字节都应记入进度
+                cut_at = VIDEO_SIZE // 2
+                plan = load_progress(progress_path(file_name), VIDEO_SIZE)
+                assert plan is not None, "没有保存分段进度"
+                assert plan[0][2] == cut_at, f"进度记录了 {plan[0][2]} 字节，服务器发送了 {cut_at} 字节"
+
+                config.video_cut_rate = 0.0
+                sent = server.stats.video_bytes
+                downloaded = await segmented_download(client, url, file_name, VIDEO_SIZE, 1)
+                await mirror_requests(server, 0)
+        finally:
+            video_download.SEGMENT_RETRIES = retries
+        assert downloaded == VIDEO_SIZE - cut_at, f"续传下载了 {downloaded} 字节"
+        assert server.stats.video_bytes - sent == VIDEO_SIZE - cut_at, "续传请求了已下载的范围"
+        check_file(file_name, name)
+
+
+TESTS = {
+    "slow_mirror": run_slow_mirror,
+    "stalled_mirror": run_stalled_mirror,
+    "no_range": run_no_range,
+    "resume": run_resume,
+}
+
+
+# pytest 入口：每个场景在独立的事件循环和临时目录中运行
+def test_slow_mirror(tmp_path):
+    asyncio.run(run_slow_mirror(str(tmp_path)))
+
+
+def test_stalled_mirror(tmp_path):
+    asyncio.run(run_stalled_mirror(str(tmp_path)))
+
+
+def test_no_range(tmp_path):
+    asyncio.run(run_no_range(str(tmp_path)))
+
+
+def test_resume(tmp_path):
+    asyncio.run(run_resume(str(tmp_path)))
+
+
+def main(names):
+    unknown = [name for name in names if name not in TESTS]
+    if unknown:
+        print(f"未知的测试: {', '.join(unknown)}，可选: {', '.join(TESTS)}")
+        return 2
+    failed = 0
+    for name in names or TESTS:
+        with tempfile.TemporaryDirectory(prefix="test_video_download_") as workdir:
+            started = time.perf_counter()
+            try:
+                asyncio.run(TESTS[name](workdir))
+            except Exception as e:
+                failed += 1
+                print(f"FAIL {name}: {type(e).__name__}: {e}")
+            else:
+                print(f"OK   {name} ({time.perf_counter() - started:.1f}s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
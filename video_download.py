@@ -0,0 +1,461 @@
+"""
+视频下载的公共部分：按固定大小的块流式写入 <文件名>.part，完成后原子重命名为目标文件。
+
+单个下载的内存占用只有一个块 (DOWNLOAD_CHUNK_SIZE，默认 1 MiB)，与视频大小无关；
+下载中途失败时删除临时文件，目标路径上不会出现不完整的 .mp4。
+
+文件不小于 DOWNLOAD_SEGMENT_MIN_MB 且服务器支持 Range 时，download_video 把文件分成
+DOWNLOAD_SEGMENTS 段并发下载，写入预分配的 .part 文件，各段进度保存在 .part.json 中；
+中断后再次下载同一文件时只请求缺失的字节范围。分段下载收到数据即写入，不按块缓冲。
+
+DownloadPool 在一个事件循环和一个连接池上并发下载多个视频，限制总并发数和每个 CDN 主机
+的并发数，并打印进度；DownloadPool.stream 从异步迭代器边取任务边下载，队列有上限，
+内存不随任务总数增长。skip_existing 时跳过大小与服务器一致的已有文件。
+
+url 可以是 CDN 镜像列表 (url_list)：探测时先请求第一个镜像，每隔 DOWNLOAD_HEDGE_DELAY 秒没有响应
+就再请求下一个，用最先响应的镜像下载；下载中某段 DOWNLOAD_STALL_SECONDS 秒收不到数据或出错时，
+该段从断点切换到下一个镜像继续。
+"""
+import os
+import json
+import time
+import asyncio
+import urllib.parse
+from typing import AsyncIterable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import httpx
+import aiofiles
+
+from metrics import DOWNLOADS, DOWNLOAD_BYTES, DOWNLOAD_SECONDS, QUEUE_DEPTH
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# 分段下载的段数 (1 表示不分段)、启用分段的最小文件大小和每段的重试次数
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))
+SEGMENT_MIN_SIZE = int(float(os.getenv("DOWNLOAD_SEGMENT_MIN_MB", "8")) * 1024 * 1024)
+SEGMENT_RETRIES = int(os.getenv("DOWNLOAD_SEGMENT_RETRIES", "3"))
+# 同时下载的视频数和每个主机同时下载的视频数
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "4"))
+# 分段进度至少每隔多少秒写一次 .part.json
+PROGRESS_SAVE_INTERVAL = 1.0
+# 镜像：首个响应等待多久就同时请求下一个镜像，多久收不到数据算作卡住
+HEDGE_DELAY = float(os.getenv("DOWNLOAD_HEDGE_DELAY", "0.5"))
+STALL_SECONDS = float(os.getenv("DOWNLOAD_STALL_SECONDS", "10"))
+
+# 单个地址或同一文件的多个镜像地址
+Urls = Union[str, Sequence[str]]
+
+
+class IncompleteDownload(Exception):
+    """服务器提前结束了响应，收到的字节数少于请求的范围"""
+
+
+def part_path(file_name: str) -> str:
+    return file_name + ".part"
+
+
+def progress_path(file_name: str) -> str:
+    return part_path(file_name) + ".json"
+
+
+def mirror_list(url: Urls) -> List[str]:
+    return [url] if isinstance(url, str) else [u for u in url if u]
+
+
+def stall_timeout() -> httpx.Timeout:
+    """读取超时即卡顿判定：STALL_SECONDS 秒没有收到数据就放弃这个连接"""
+    return httpx.Timeout(30.0, connect=10.0, read=STALL_SECONDS)
+
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def stream_download(http_client: httpx.AsyncClient, url: str, file_name: str, platform: str,
+                          chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Optional[str]:
+    """把 url 流式下载到 file_name，返回文件名；HTTP 错误时返回 None，其他异常清理后抛出"""
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    part = part_path(file_name)
+    start = time.perf_counter()
+    size = 0
+    try:
+        async with http_client.stream("GET", url, follow_redirects=True, timeout=stall_timeout()) as response:
+            response.raise_for_status()
+            async with aiofiles.open(part, "wb") as file:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    await file.write(chunk)
+                    size += len(chunk)
+        os.replace(part, file_name)
+        remove_quietly(progress_path(file_name))
+    except httpx.HTTPStatusError as exc:
+        remove_quietly(part)
+        print(f"Error downloading video: {exc.response.status_code}")
+        DOWNLOADS.inc(platform=platform, status=str(exc.response.status_code))
+        return None
+    except BaseException:
+        remove_quietly(part)
+        DOWNLOADS.inc(platform=platform, status="error")
+        raise
+
+    DOWNLOADS.inc(platform=platform, status=str(response.status_code))
+    DOWNLOAD_BYTES.inc(size, platform=platform)
+    DOWNLOAD_SECONDS.observe(time.perf_counter() - start, platform=platform)
+    return file_name
+
+
+async def probe_size(http_client: httpx.AsyncClient, url: str) -> Optional[int]:
+    """服务器支持 Range 时返回文件总大小，否则返回 None"""
+    async with http_client.stream("GET", url, headers={"Range": "bytes=0-0"}, follow_redirects=True,
+                                  timeout=stall_timeout()) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            return None
+        # Content-Range: bytes 0-0/<总大小>
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+
+
+async def hedged_probe(http_client: httpx.AsyncClient, urls: List[str]) -> Tuple[List[str], Optional[int]]:
+    """对冲探测各镜像：每隔 HEDGE_DELAY 秒或上一个出错时再请求下一个，取最先成功响应的。
+
+    返回 (以该镜像开头的镜像列表, 文件大小)；全部镜像都失败时抛出最后一个异常。
+    """
+    if len(urls) == 1:
+        return urls, await probe_size(http_client, urls[0])
+    pending: Dict[asyncio.Future, int] = {}
+    error: Optional[BaseException] = None
+    next_index = 0
+    try:
+        while True:
+            if next_index < len(urls):
+                pending[asyncio.ensure_future(probe_size(http_client, urls[next_index]))] = next_index
+                next_index += 1
+            if not pending:
+                raise error
+            done, _ = await asyncio.wait(pending, timeout=HEDGE_DELAY if next_index < len(urls) else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                if task.exception() is None:
+                    return [urls[index]] + urls[:index] + urls[index + 1:], task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def plan_segments(size: int, segments: int) -> List[List[int]]:
+    """把 [0, size) 分成若干段，每段为 [起点, 终点 (含), 已下载字节数]"""
+    step = -(-size // segments)
+    return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+
+def load_progress(path: str, size: int) -> Optional[List[List[int]]]:
+    """读取未完成下载的分段进度，文件大小不一致 (视频已变化) 时放弃"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return progress["segments"] if progress.get("size") == size else None
+
+
+def save_progress(path: str, size: int, segments: List[List[int]]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"size": size, "segments": segments}, f)
+    os.replace(tmp, path)
+
+
+async def segmented_download(http_client: httpx.AsyncClient, url: Urls, file_name: str, size: int,
+                             segments: int = DOWNLOAD_SEGMENTS) -> int:
+    """按字节范围分段并发下载到 file_name，返回本次下载的字节数。
+
+    url 为镜像列表时，某段出错或卡住后从断点切换到下一个镜像。
+    失败或被取消时保留 .part 和 .part.json，下次调用从缺失的范围继续。
+    收到的数据不攒成整块，到达即写入并计入进度，断线时已收到的字节不会丢失。
+    """
+    urls = mirror_list(url)
+    part = part_path(file_name)
+    progress_file = progress_path(file_name)
+    plan = load_progress(progress_file, size) if os.path.exists(part) else None
+    if plan is None:
+        # 预分配完整大小，各段直接写入自己的偏移
+        with open(part, "wb") as f:
+            f.truncate(size)
+        plan = plan_segments(size, segments)
+        save_progress(progress_file, size, plan)
+    else:
+        remaining = sum(end - start + 1 - done for start, end, done in plan)
+        print(f"Resuming {os.path.basename(file_name)}: {remaining} of {size} bytes left")
+
+    downloaded = 0
+    last_save = time.monotonic()
+
+    async def fetch_segment(segment: List[int]):
+        nonlocal downloaded, last_save
+        start, end, _ = segment
+        failures = 0
+        mirror = 0
+        while start + segment[2] <= end:
+            offset = start + segment[2]
+            received = segment[2]
+            try:
+                headers = {"Range": f"bytes={offset}-{end}"}
+                async with http_client.stream("GET", urls[mirror], headers=headers, follow_redirects=True,
+                                              timeout=stall_timeout()) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise IncompleteDownload(f"server ignored Range for bytes {offset}-{end}")
+                    async with aiofiles.open(part, "r+b") as file:
+                        await file.seek(offset)
+                        async for chunk in response.aiter_bytes():
+                            chunk = chunk[:end + 1 - (start + segment[2])]
+                            await file.write(chunk)
+                            segment[2] += len(chunk)
+                            downloaded += len(chunk)
+                            if time.monotonic() - last_save >= PROGRESS_SAVE_INTERVAL:
+                                last_save = time.monotonic()
+                                save_progress(progress_file, size, plan)
+                if start + segment[2] <= end:
+                    raise IncompleteDownload(f"connection closed at byte {start + segment[2]} of {end}")
+            except (httpx.TransportError, httpx.HTTPStatusError, IncompleteDownload) as exc:
+                # 只有一个地址时 HTTP 错误不重试
+                if isinstance(exc, httpx.HTTPStatusError) and len(urls) == 1:
+                    raise
+                # 只统计连续没有进展的失败，断线后能继续收到数据的不会耗尽重试；每个镜像多给一次机会
+                failures = 1 if segment[2] > received else failures + 1
+                if failures > SEGMENT_RETRIES + len(urls) - 1:
+                    raise
+                reason = str(exc) or type(exc).__name__
+                if len(urls) > 1:
+                    mirror = (mirror + 1) % len(urls)
+                    print(f"Segment {start}-{end} interrupted ({reason}), switching to mirror {mirror + 1}/{len(urls)} "
+                          f"from byte {start + segment[2]}")
+                else:
+                    print(f"Segment {start}-{end} interrupted ({reason}), retrying from byte {start + segment[2]}")
+                # 轮完一圈镜像后再退避
+                if mirror == 0:
+                    await asyncio.sleep(min(0.5 * 2 ** failures, 10))
+
+    tasks = [asyncio.ensure_future(fetch_segment(segment)) for segment in plan if segment[0] + segment[2] <= segment[1]]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # 一段失败时停止其他段，保存进度后抛出
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        save_progress(progress_file, size, plan)
+        raise
+    os.replace(part, file_name)
+    remove_quietly(progress_file)
+    return downloaded
+
+
+async def download_video(http_client: httpx.AsyncClient, url: Urls, file_name: str, platform: str,
+                         segments: int = DOWNLOAD_SEGMENTS, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Optional[str]:
+    """下载一个视频，返回文件名；HTTP 错误时返回 None。
+
+    文件较大且服务器支持 Range 时分段并发下载并可续传，否则整体流式下载。
+    url 为镜像列表时用最先响应的镜像，并在出错或卡住时切换镜像。
+    """
+    urls = mirror_list(url)
+    if segments <= 1 and len(urls) == 1:
+        return await stream_download(http_client, urls[0], file_name, platform, chunk_size)
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    start = time.perf_counter()
+    try:
+        ordered, size = await hedged_probe(http_client, urls)
+        if ordered[0] != urls[0]:
+            print(f"Mirror {urls.index(ordered[0]) + 1}/{len(urls)} responded first for {os.path.basename(file_name)}")
+        urls = ordered
+        # 有多个镜像时小文件也按单段 Range 下载，卡住时能从断点切换到其他镜像
+        segmented = bool(size) and (size >= SEGMENT_MIN_SIZE or len(urls) > 1)
+        if segmented:
+            parts = max(segments, 1) if size >= SEGMENT_MIN_SIZE else 1
+            downloaded = await segmented_download(http_client, urls, file_name, size, parts)
+    except httpx.HTTPStatusError as exc:
+        print(f"Error downloading video: {exc.response.status_code}")
+        DOWNLOADS.inc(platform=platform, status=str(exc.response.status_code))
+        return None
+    except BaseException:
+        DOWNLOADS.inc(platform=platform, status="error")
+        raise
+    if not segmented:
+        # 不支持 Range 时只能整体重下，出错后依次换下一个镜像
+        for index, mirror in enumerate(urls):
+            last = index == len(urls) - 1
+            try:
+                result = await stream_download(http_client, mirror, file_name, platform, chunk_size)
+            except httpx.TransportError as exc:
+                if last:
+                    raise
+                print(f"Mirror {index + 1}/{len(urls)} failed ({str(exc) or type(exc).__name__}), trying the next one")
+                continue
+            if result or last:
+                return result
+
+    DOWNLOADS.inc(platform=platform, status="206")
+    DOWNLOAD_BYTES.inc(downloaded, platform=platform)
+    DOWNLOAD_SECONDS.observe(time.perf_counter() - start, platform=platform)
+    return file_name
+
+
+def download_client(concurrency: int = DOWNLOAD_CONCURRENCY, segments: int = DOWNLOAD_SEGMENTS) -> httpx.AsyncClient:
+    """所有下载共用的客户端，连接池容纳全部并发下载的分段连接"""
+    connections = max(concurrency, 1) * max(segments, 1)
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(30.0, connect=10.0))
+
+
+class DownloadPool:
+    """用 concurrency 个工作任务下载 (url, 文件名) 列表，每个主机最多 per_host 个同时下载。
+
+    skip_existing 时先比较已有文件与服务器上的大小，一致则跳过；每个成功 (或跳过) 的文件
+    都会调用 on_complete(文件名)。on_result(文件名, 结果, 耗时秒数) 对每个任务都会调用，
+    失败时结果为 None。任务可以是 (url, 文件名, 平台, 预期大小)，平台默认为 platform。
+
+    传入 manifest (download_manifest.DownloadManifest) 时清单中已完成且大小一致的文件直接跳过，
+    其余的登记后下载，并记录大小、哈希和状态。
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, platform: str, concurrency: int = DOWNLOAD_CONCURRENCY,
+                 per_host: int = DOWNLOAD_PER_HOST, skip_existing: bool = False,
+                 on_complete: Optional[Callable[[str], None]] = None,
+                 on_result: Optional[Callable[[str, Optional[str], float], None]] = None, manifest=None):
+        self.http_client = http_client
+        self.platform = platform
+        self.concurrency = max(concurrency, 1)
+        self.per_host = max(per_host, 1)
+        self.skip_existing = skip_existing
+        self.on_complete = on_complete
+        self.on_result = on_result
+        self.manifest = manifest
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+    def _host_slot(self, url: Urls) -> asyncio.Semaphore:
+        host = urllib.parse.urlsplit(mirror_list(url)[0]).hostname or ""
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def download(self, url: Urls, file_name: str, platform: Optional[str] = None,
+                       expected_size: int = 0) -> Optional[str]:
+        """下载一个视频，出错时记为失败并返回 None"""
+        platform = platform or self.platform
+        skipped = False
+        started = None
+        try:
+            async with self._host_slot(url):
+                started = time.perf_counter()
+                if self.manifest is not None and self.manifest.is_complete(platform, file_name):
+                    skipped = True
+                elif self.skip_existing and await self._is_complete(url, file_name):
+                    skipped = True
+                    if self.manifest is not None:
+                        # 启用清单之前下载的文件补记到清单中，与预期大小不一致时重新下载
+                        self.manifest.register(platform, url, file_name, expected_size)
+                        skipped = await self.manifest.record(platform, file_name)
+                if skipped:
+                    result = file_name
+                elif self.manifest is not None:
+                    result = await self.manifest.download(self.http_client, url, file_name, platform, expected_size)
+                else:
+                    result = await download_video(self.http_client, url, file_name, platform)
+        except Exception as e:
+            print(f"Error downloading {os.path.basename(file_name)}: {e}")
+            result = None
+        self._report(file_name, result, skipped)
+        if result and self.on_complete is not None:
+            self.on_complete(result)
+        if self.on_result is not None:
+            self.on_result(file_name, result, time.perf_counter() - started if started else 0.0)
+        return result
+
+    async def _is_complete(self, url: Urls, file_name: str) -> bool:
+        """目标文件已存在且大小与服务器上的一致"""
+        if not os.path.exists(file_name):
+            return False
+        _, size = await hedged_probe(self.http_client, mirror_list(url))
+        return size == os.path.getsize(file_name)
+
+    def _report(self, file_name: str, result: Optional[str], skipped: bool = False):
+        if skipped:
+            self.skipped += 1
+        elif result:
+            self.done += 1
+            self.bytes += os.path.getsize(result)
+        else:
+            self.failed += 1
+        elapsed = time.perf_counter() - self.started
+        status = "SKIPPED" if skipped else "OK" if result else "FAILED"
+        print(f"[{self.done + self.failed + self.skipped}/{self.total}] {status} {os.path.basename(file_name)} "
+              f"| {self.bytes / 1024 / 1024:.1f} MB, {self.bytes / 1024 / 1024 / elapsed if elapsed else 0:.1f} MB/s")
+
+    async def run(self, jobs: Iterable[Tuple]) -> List[Optional[str]]:
+        """并发下载全部 (url, 文件名, ...) 任务，按输入顺序返回文件名 (失败为 None)"""
+        jobs = list(jobs)
+        self.total += len(jobs)
+        queue: asyncio.Queue = asyncio.Queue()
+        for index, job in enumerate(jobs):
+            queue.put_nowait((index, job))
+        results: List[Optional[str]] = [None] * len(jobs)
+        queue_name = f"{self.platform}:downloads"
+
+        async def worker():
+            while True:
+                try:
+                    index, job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                QUEUE_DEPTH.set(queue.qsize(), queue=queue_name)
+                results[index] = await self.download(*job)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(jobs)))))
+        QUEUE_DEPTH.set(0, queue=queue_name)
+        return results
+
+    async def stream(self, jobs: AsyncIterable[Tuple], queue_size: int = 0) -> int:
+        """边从 jobs 取 (url, 文件名, ...) 任务边下载，返回成功数；队列满时暂停取任务，不保留结果列表"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or self.concurrency * 2)
+        queue_name = f"{self.platform}:downloads"
+        done_before = self.done
+
+        async def worker():
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                QUEUE_DEPTH.set(queue.qsize(), queue=queue_name)
+                await self.download(*job)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            async for job in jobs:
+                self.total += 1
+                await queue.put(job)
+                QUEUE_DEPTH.set(queue.qsize(), queue=queue_name)
+        finally:
+            # 取任务出错时也先下载完已入队的任务，再抛出异常
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            QUEUE_DEPTH.set(0, queue=queue_name)
+        return self.done - done_before
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        skipped = f"{self.skipped} skipped, " if self.skipped else ""
+        return (f"{self.done} downloaded, {skipped}{self.failed} failed, {self.bytes / 1024 / 1024:.1f} MB "
+                f"in {elapsed:.1f}s ({self.bytes / 1024 / 1024 / elapsed if elapsed else 0:.1f} MB/s)")
@@ -0,0 +1,132 @@
+"""
+视频版本选择：从作品详情的 video 中收集所有可下载的版本 (play_addr_265 / play_addr_h264 /
+play_addr_bytevc1 / play_addr 和 bit_rate 列表)，读出文件大小、码率、分辨率和编码，按策略选一个。
+
+VIDEO_VARIANT_POLICY:
+    default    原来的选法 (默认)：按平台的固定字段顺序 (DOUYIN_DEFAULT_KEYS / TIKTOK_DEFAULT_KEYS) 取第一个
+    smallest   文件最小的版本，可能降低分辨率，需显式开启
+    best       不超过 VIDEO_MAX_MB 的版本中分辨率和码率最高的；都超过时取最小的；未设上限时取最高的
+    codec      VIDEO_CODEC (h265 / h264) 编码中最小的；没有该编码时取全部中最小的
+
+与原来的选法相比节省的字节数计入 video_variant_bytes_saved_total 指标。
+"""
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from metrics import VARIANT_BYTES_SAVED
+
+VIDEO_VARIANT_POLICY = os.getenv("VIDEO_VARIANT_POLICY", "default")
+VIDEO_MAX_BYTES = int(float(os.getenv("VIDEO_MAX_MB", "0")) * 1024 * 1024)
+VIDEO_CODEC = os.getenv("VIDEO_CODEC", "h265")
+
+POLICIES = ("default", "smallest", "best", "codec")
+
+# 各平台原来的取址字段顺序，default 策略和节省字节数的比较基准都用它
+DOUYIN_DEFAULT_KEYS = ("play_addr_265", "play_addr_h264")
+TIKTOK_DEFAULT_KEYS = ("play_addr_h264",)
+
+# 固定字段对应的编码，play_addr 的编码未知
+ADDRESS_CODECS = {"play_addr_265": "h265", "play_addr_bytevc1": "h265", "play_addr_h264": "h264", "play_addr": ""}
+
+
+class Variant(NamedTuple):
+    source: str            # 字段名，bit_rate 中的版本为 bit_rate:<gear_name>
+    url_list: List[str]
+    data_size: int         # 0 表示未知
+    bit_rate: int
+    width: int
+    height: int
+    codec: str
+
+    @property
+    def url(self) -> str:
+        return self.url_list[0]
+
+    def describe(self) -> str:
+        size = f"{self.data_size / 1024 / 1024:.1f} MB" if self.data_size else "size unknown"
+        return f"{self.source} {self.codec or '?'} {self.width}x{self.height} {size}"
+
+
+def _variant(source: str, address: Dict, codec: str, bit_rate: int = 0) -> Optional[Variant]:
+    url_list = [url for url in (address or {}).get("url_list") or [] if url]
+    if not url_list:
+        return None
+    return Variant(source, url_list, int(address.get("data_size") or 0), int(bit_rate or 0),
+                   int(address.get("width") or 0), int(address.get("height") or 0), codec)
+
+
+def video_variants(video: Dict) -> List[Variant]:
+    """video 中所有带播放地址的版本，同一地址只保留一次 (优先保留信息较全的 bit_rate 条目)"""
+    variants = []
+    for entry in video.get("bit_rate") or []:
+        codec = "h265" if entry.get("is_h265") or entry.get("is_bytevc1") else "h264"
+        variant = _variant(f"bit_rate:{entry.get('gear_name', '')}", entry.get("play_addr"), codec, entry.get("bit_rate"))
+        if variant:
+            variants.append(variant)
+    for key, codec in ADDRESS_CODECS.items():
+        variant = _variant(key, video.get(key), codec)
+        if variant:
+            variants.append(variant)
+    seen = set()
+    unique = []
+    for variant in variants:
+        if variant.url not in seen:
+            seen.add(variant.url)
+            unique.append(variant)
+    return unique
+
+
+def _smallest(variants: List[Variant]) -> Variant:
+    # 大小未知的排在最后，其次按码率
+    return min(variants, key=lambda v: (v.data_size == 0, v.data_size, v.bit_rate))
+
+
+def default_variant(video: Dict, default_keys: Sequence[str]) -> Optional[Variant]:
+    """原来的选法：default_keys 中第一个有播放地址的字段"""
+    for key in default_keys:
+        variant = _variant(key, video.get(key), ADDRESS_CODECS.get(key, ""))
+        if variant:
+            return variant
+    return None
+
+
+def select_variant(video: Dict, policy: str = VIDEO_VARIANT_POLICY, max_bytes: int = VIDEO_MAX_BYTES,
+                   codec: str = VIDEO_CODEC, default_keys: Sequence[str] = ()) -> Optional[Variant]:
+    """按策略从 video 的所有版本中选一个，没有可用版本时返回 None"""
+    if policy not in POLICIES:
+        raise ValueError(f"不支持的视频版本策略: {policy}")
+    variants = video_variants(video)
+    if not variants:
+        return None
+    if policy == "default":
+        return default_variant(video, default_keys) or variants[0]
+    if policy == "best":
+        fits = [v for v in variants if v.data_size and (not max_bytes or v.data_size <= max_bytes)]
+        if not fits:
+            return _smallest(variants)
+        return max(fits, key=lambda v: (v.width * v.height, v.bit_rate, -v.data_size))
+    if policy == "codec":
+        preferred = [v for v in variants if v.codec == codec]
+        return _smallest(preferred or variants)
+    return _smallest(variants)
+
+
+def choose_play_address(video: Dict, platform: str, default_keys: Sequence[str],
+                        policy: str = VIDEO_VARIANT_POLICY) -> Variant:
+    """为一个作品选择下载版本并记录相对原来选法 (default_keys 中第一个存在的字段) 节省的字节数。
+
+    没有可下载的版本 (图集、已删除的作品) 时抛出 ValueError。
+    """
+    video = video or {}
+    chosen = select_variant(video, policy, default_keys=default_keys)
+    if chosen is None:
+        raise ValueError("No valid video URL found, this post is not a video, or the video has been deleted, or its an album.")
+    baseline = default_variant(video, default_keys)
+    if baseline and baseline.data_size and chosen.data_size and baseline.data_size > chosen.data_size:
+        VARIANT_BYTES_SAVED.inc(baseline.data_size - chosen.data_size, platform=platform, policy=policy)
+    return chosen
+
+
+def bytes_saved(platform: str, policy: str = VIDEO_VARIANT_POLICY) -> int:
+    """本进程中按 policy 选择版本累计节省的字节数"""
+    return int(VARIANT_BYTES_SAVED.value(platform=platform, policy=policy))